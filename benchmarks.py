@@ -0,0 +1,337 @@
+# benchmarks.py
+"""
+Набор бенчмарков генерации без Pygame и дисплея.
+
+Запуск и сравнение результатов:
+    python benchmarks.py run -o results.json [--quick]
+    python benchmarks.py compare old.json new.json [--threshold 0.1]
+
+Все случайные данные выводятся из фиксированных зерен, поэтому при неизменном коде каждый
+запуск строит одни и те же миры. Результат – JSON со списком замеров: у каждого есть имя,
+метрика (seconds или peak_bytes), значение и параметры. compare сопоставляет замеры по имени
+и метрике, перечисляет добавленные и удаленные замеры и завершается с кодом 1, если какая-либо
+метрика выросла больше чем на threshold.
+"""
+import argparse
+import gc
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from cell_line import CellLine
+from cell_point import CellPoint
+from cell_structure_utils import line_intersection, generate_initial_rays, generate_child_rays, \
+    generate_child_rays_batch
+from chunk_manager import ChunkManager
+
+SEED = 12345
+CHUNK_SIZE = 250
+
+# Параметры полного и быстрого (--quick) прогонов
+FULL = {
+    "grid_sides": [1, 2, 3],
+    "iterations": [5, 10, 20],
+    "child_counts": [2, 3, 4],
+    "memory_sides": [1, 3, 5],
+    "repeats": 5,
+    "micro_calls": 20000,
+}
+QUICK = {
+    "grid_sides": [1, 2],
+    "iterations": [5, 10],
+    "child_counts": [3],
+    "memory_sides": [1, 3],
+    "repeats": 3,
+    "micro_calls": 2000,
+}
+
+
+def build_world(grid_side: int, child_count: int = 3, seed: int = SEED) -> ChunkManager:
+    """
+    Создает мир из grid_side x grid_side загруженных чанков; в центре каждого – стартовая точка
+    с тремя начальными лучами, как в demo_visualization.main.
+    """
+    manager = ChunkManager((0, 0), CHUNK_SIZE, CHUNK_SIZE, seed=seed)
+    manager.configure_rays(child_count=child_count)
+    for i in range(grid_side):
+        for j in range(grid_side):
+            manager.load_chunk((i, j))
+    for i in range(grid_side):
+        for j in range(grid_side):
+            chunk = manager.chunks[(i, j)]
+            start_point = CellPoint(chunk.x + chunk.width // 2, chunk.y + chunk.height // 2)
+            initial_rays = generate_initial_rays(start_point, ray_count=3, min_length=50, max_length=80,
+                                                 rng=manager.emission_rng(start_point))
+            start_point.has_emitted = True
+            for vec, _ in initial_rays:
+                chunk.add_line(CellLine(start_point, CellPoint(start_point.x + vec[0], start_point.y + vec[1])))
+    return manager
+
+
+def _edge_count(manager: ChunkManager) -> int:
+    return sum(chunk.geometry.edge_count for chunk in manager.chunks.values())
+
+
+def _measure(run: Callable[[], Any], setup: Callable[[], Any], repeats: int) -> List[float]:
+    """
+    Возвращает время run(state) для repeats независимых состояний, созданных setup (не входит в замер).
+    """
+    times = []
+    for _ in range(repeats):
+        state = setup()
+        gc.collect()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _record(name: str, metric: str, value: float, **params) -> Dict[str, Any]:
+    return {"name": name, "metric": metric, "value": value, "params": params}
+
+
+def _timing(name: str, times: List[float], **params) -> Dict[str, Any]:
+    record = _record(name, "seconds", statistics.median(times), **params)
+    record["min"] = min(times)
+    record["repeats"] = len(times)
+    return record
+
+
+# --- Бенчмарки ---
+
+def bench_expand(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Масштабирование expand_structure по числу чанков, итераций и дочерних лучей.
+    """
+    results = []
+    for side in config["grid_sides"]:
+        for iterations in config["iterations"]:
+            for child_count in config["child_counts"]:
+                def expand(manager: ChunkManager) -> None:
+                    for _ in range(iterations):
+                        manager.expand_structure()
+
+                times = _measure(expand, lambda: build_world(side, child_count), config["repeats"])
+                world = build_world(side, child_count)
+                expand(world)
+                results.append(_timing(f"expand/chunks={side * side}/iterations={iterations}/children={child_count}",
+                                       times, chunks=side * side, iterations=iterations, children=child_count,
+                                       edges=_edge_count(world)))
+    return results
+
+
+def bench_line_intersection(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Скалярная line_intersection на случайных отрезках с целыми координатами.
+    """
+    rng = random.Random(SEED)
+    calls = config["micro_calls"]
+    points = [CellPoint(rng.randint(0, 500), rng.randint(0, 500)) for _ in range(4 * calls)]
+
+    def run(_) -> None:
+        for k in range(0, len(points), 4):
+            line_intersection(points[k], points[k + 1], points[k + 2], points[k + 3])
+
+    times = _measure(run, lambda: None, config["repeats"])
+    return [_timing("micro/line_intersection", [t / calls for t in times], calls=calls)]
+
+
+def bench_generate_child_rays(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    generate_child_rays с параметрами, которые использует ChunkManager.
+    """
+    calls = config["micro_calls"]
+    start_point = CellPoint(100, 100)
+
+    def run(rng: random.Random) -> None:
+        for k in range(calls):
+            generate_child_rays(start_point, k * 0.1, child_count=3, min_length=40, max_length=60,
+                                max_deviation=math.radians(90), rng=rng)
+
+    times = _measure(run, lambda: random.Random(SEED), config["repeats"])
+    return [_timing("micro/generate_child_rays", [t / calls for t in times], calls=calls)]
+
+
+def bench_generate_child_rays_batch(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    generate_child_rays_batch для блока из 256 точек с теми же параметрами; время – на одну точку.
+    """
+    calls = config["micro_calls"]
+    block = 256
+    start_points = np.full((block, 2), 100)
+    directions = np.arange(block) * 0.1
+
+    def run(rng: np.random.Generator) -> None:
+        for _ in range(max(calls // block, 1)):
+            generate_child_rays_batch(start_points, directions, child_count=3, min_length=40, max_length=60,
+                                      max_deviation=math.radians(90), rng=rng)
+
+    points = max(calls // block, 1) * block
+    times = _measure(run, lambda: np.random.default_rng(SEED), config["repeats"])
+    return [_timing("micro/generate_child_rays_batch", [t / points for t in times], calls=points)]
+
+
+def bench_load_chunk(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    load_chunk для новых чанков (вместе с созданием соседей) в пустом мире.
+    """
+    side = 10
+
+    def run(manager: ChunkManager) -> None:
+        for i in range(side):
+            for j in range(side):
+                manager.load_chunk((i, j))
+
+    times = _measure(run, lambda: ChunkManager((0, 0), CHUNK_SIZE, CHUNK_SIZE, seed=SEED), config["repeats"])
+    return [_timing("micro/load_chunk", [t / (side * side) for t in times], calls=side * side)]
+
+
+def bench_memory(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Пиковая память (tracemalloc) при построении и расширении мира заданного размера.
+    """
+    results = []
+    for side in config["memory_sides"]:
+        gc.collect()
+        tracemalloc.start()
+        world = build_world(side)
+        for _ in range(max(config["iterations"])):
+            world.expand_structure()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append(_record(f"memory/chunks={side * side}", "peak_bytes", peak, chunks=side * side,
+                               edges=_edge_count(world), resident_bytes=world.resident_bytes()))
+    return results
+
+
+BENCHMARKS = {
+    "expand": bench_expand,
+    "line_intersection": bench_line_intersection,
+    "generate_child_rays": bench_generate_child_rays,
+    "generate_child_rays_batch": bench_generate_child_rays_batch,
+    "load_chunk": bench_load_chunk,
+    "memory": bench_memory,
+}
+
+
+def run_benchmarks(quick: bool = False, only: List[str] = None) -> Dict[str, Any]:
+    """
+    Выполняет бенчмарки (все или перечисленные в only) и возвращает результат для записи в JSON.
+    """
+    config = QUICK if quick else FULL
+    results = []
+    for name, bench in BENCHMARKS.items():
+        if only and name not in only:
+            continue
+        print(f"running {name}...", file=sys.stderr)
+        results.extend(bench(config))
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": SEED,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+
+def compare_results(old: Dict[str, Any], new: Dict[str, Any], threshold: float = 0.1) \
+        -> Tuple[List[Tuple[str, str, float, float, Optional[float]]], List[str], List[Tuple[str, str, float]],
+                 List[Tuple[str, str, float]]]:
+    """
+    Сопоставляет замеры двух прогонов по имени и метрике.
+
+    Returns:
+        (строки, регрессии, добавленные, удаленные): строки – (имя, метрика, старое значение, новое значение,
+        отношение), отношение None, если старое значение 0; регрессии – имена замеров, у которых отношение
+        больше 1 + threshold или значение выросло с нуля; добавленные и удаленные – (имя, метрика, значение)
+        замеров, которые есть только в новом или только в старом прогоне (замер со смененной метрикой
+        попадает в оба списка).
+    """
+    old_results = {(record["name"], record["metric"]): record for record in old["results"]}
+    new_results = {(record["name"], record["metric"]): record for record in new["results"]}
+    rows = []
+    regressions = []
+    added = []
+    for key, record in new_results.items():
+        previous = old_results.get(key)
+        if previous is None:
+            added.append((record["name"], record["metric"], record["value"]))
+            continue
+        if previous["value"]:
+            ratio = record["value"] / previous["value"]
+            grew = ratio > 1 + threshold
+        else:
+            # От нуля отношение не определено: регрессия – только появление ненулевого значения
+            ratio = None
+            grew = record["value"] > 0
+        rows.append((record["name"], record["metric"], previous["value"], record["value"], ratio))
+        if grew:
+            regressions.append(record["name"])
+    removed = [(record["name"], record["metric"], record["value"])
+               for key, record in old_results.items() if key not in new_results]
+    return rows, regressions, added, removed
+
+
+def _format_value(metric: str, value: float) -> str:
+    if metric == "seconds":
+        return f"{value * 1000:.4f} ms" if value < 1 else f"{value:.3f} s"
+    return f"{value / 1024:.1f} KiB"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Headless benchmarks of the cell structure generator")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run benchmarks and write JSON results")
+    run_parser.add_argument("-o", "--output", default="-", help="output file ('-' for stdout)")
+    run_parser.add_argument("--quick", action="store_true", help="smaller parameter matrix")
+    run_parser.add_argument("--only", nargs="*", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative increase reported as a regression (default 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        report = run_benchmarks(args.quick, args.only)
+        text = json.dumps(report, indent=2)
+        if args.output == "-":
+            print(text)
+        else:
+            with open(args.output, "w") as file:
+                file.write(text + "\n")
+        return
+
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    rows, regressions, added, removed = compare_results(old, new, args.threshold)
+    width = max((len(row[0]) for row in rows + added + removed), default=10)
+    for name, metric, old_value, new_value, ratio in rows:
+        mark = "  REGRESSION" if name in regressions else ""
+        change = f"x{ratio:.2f}" if ratio is not None else "x n/a"
+        print(f"{name:<{width}}  {_format_value(metric, old_value):>14}  {_format_value(metric, new_value):>14}"
+              f"  {change}{mark}")
+    for label, records in (("added", added), ("removed", removed)):
+        for name, metric, value in records:
+            print(f"{name:<{width}}  {label} ({metric}): {_format_value(metric, value)}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
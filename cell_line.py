@@ -12,11 +12,45 @@ class CellLine:
         start (CellPoint): начальная точка линии.
         end (CellPoint): конечная точка линии.
         polygon_membership (int): количество полигонов, к которым принадлежит эта линия.
+
+    Линия может быть представлением ребра в ChunkGeometry (см. view): тогда polygon_membership
+    хранится в геометрии чанка.
     """
+
+    __slots__ = ("start", "end", "_polygon_membership", "_geometry", "_index")
+
     def __init__(self, start: CellPoint, end: CellPoint) -> None:
         self.start: CellPoint = start
         self.end: CellPoint = end
-        self.polygon_membership: int = 0
+        self._polygon_membership: int = 0
+        self._geometry = None
+        self._index: int = -1
+
+    @classmethod
+    def view(cls, geometry, index: int, start: CellPoint, end: CellPoint) -> "CellLine":
+        """
+        Создаёт представление ребра index геометрии чанка.
+        """
+        line = cls.__new__(cls)
+        line.start = start
+        line.end = end
+        line._polygon_membership = 0
+        line._geometry = geometry
+        line._index = index
+        return line
+
+    @property
+    def polygon_membership(self) -> int:
+        if self._geometry is None:
+            return self._polygon_membership
+        return self._geometry.membership[self._index]
+
+    @polygon_membership.setter
+    def polygon_membership(self, value: int) -> None:
+        if self._geometry is None:
+            self._polygon_membership = value
+        else:
+            self._geometry.membership[self._index] = value
 
     def add_polygon_membership(self) -> None:
         """
@@ -6,16 +6,50 @@ class CellPoint:
     """
     Класс, представляющий точку в чанке с целочисленными координатами.
 
+    Точка может быть свободной или представлением вершины в ChunkGeometry (см. view):
+    тогда флаг has_emitted хранится в битовом поле геометрии и общий у всех представлений
+    этой вершины. Свободная точка, добавленная в чанк, сама становится таким представлением.
+
     Атрибуты:
         x (int): x-координата.
         y (int): y-координата.
         has_emitted (bool): флаг, показывающий, испустила ли точка лучи.
     """
 
+    __slots__ = ("x", "y", "_has_emitted", "_geometry", "_index")
+
     def __init__(self, x: int, y: int) -> None:
         self.x: int = int(x)
         self.y: int = int(y)
-        self.has_emitted: bool = False
+        self._has_emitted: bool = False
+        self._geometry = None
+        self._index: int = -1
+
+    @classmethod
+    def view(cls, geometry, index: int, x: int, y: int) -> "CellPoint":
+        """
+        Создаёт представление вершины index геометрии чанка с координатами (x, y).
+        """
+        point = cls.__new__(cls)
+        point.x = x
+        point.y = y
+        point._has_emitted = False
+        point._geometry = geometry
+        point._index = index
+        return point
+
+    @property
+    def has_emitted(self) -> bool:
+        if self._geometry is None:
+            return self._has_emitted
+        return self._geometry.is_emitted(self._index)
+
+    @has_emitted.setter
+    def has_emitted(self, value: bool) -> None:
+        if self._geometry is None:
+            self._has_emitted = bool(value)
+        else:
+            self._geometry.set_emitted(self._index, value)
 
     @property
     def position(self) -> Tuple[int, int]:
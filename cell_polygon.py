@@ -0,0 +1,57 @@
+# cell_polygon.py
+from typing import List, Tuple
+
+from cell_point import CellPoint
+
+
+class CellPolygon:
+    """
+    Класс, представляющий полигональную ячейку структуры – ограниченную грань графа линий.
+
+    Атрибуты:
+        points (List[CellPoint]): вершины ячейки в порядке обхода границы. Порядок таков,
+            что ориентированная площадь (формула шнурования) положительна.
+    """
+
+    def __init__(self, points: List[CellPoint]) -> None:
+        self.points: List[CellPoint] = points
+
+    def signed_area(self) -> float:
+        """
+        Возвращает ориентированную площадь многоугольника по формуле шнурования.
+        """
+        points = self.points
+        total = 0
+        for k, p in enumerate(points):
+            q = points[(k + 1) % len(points)]
+            total += p.x * q.y - q.x * p.y
+        return total / 2
+
+    def area(self) -> float:
+        """
+        Возвращает площадь ячейки.
+        """
+        return abs(self.signed_area())
+
+    def centroid(self) -> Tuple[float, float]:
+        """
+        Возвращает центр масс ячейки.
+        """
+        points = self.points
+        area6 = 0
+        cx = cy = 0
+        for k, p in enumerate(points):
+            q = points[(k + 1) % len(points)]
+            cross = p.x * q.y - q.x * p.y
+            area6 += cross
+            cx += (p.x + q.x) * cross
+            cy += (p.y + q.y) * cross
+        if area6 == 0:
+            return (sum(p.x for p in points) / len(points), sum(p.y for p in points) / len(points))
+        return cx / (3 * area6), cy / (3 * area6)
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __repr__(self) -> str:
+        return f"CellPolygon({len(self.points)} points, area={self.area():.1f})"
@@ -1,5 +1,8 @@
 import math
 import random
+
+import numpy as np
+
 from cell_point import CellPoint
 
 
@@ -33,13 +36,81 @@ def line_intersection(p1: CellPoint, p2: CellPoint, p3: CellPoint, p4: CellPoint
     return None
 
 
-def generate_initial_rays(parent_point: CellPoint, ray_count=2, min_length=30, max_length=50):
+def segment_intersections_batch(rays, segments, tol=1e-6, nearest=False):
+    """
+    Векторизованный аналог line_intersection: проверяет один луч или массив лучей
+    против массива отрезков за одну операцию NumPy.
+
+    rays – массив (4,) или (M, 4) вида (x1, y1, x2, y2), где (x1, y1) – начало луча.
+    segments – массив (N, 4) вида (x3, y3, x4, y4), общий для всех лучей, или (M, N, 4) –
+    свои N отрезков для каждого луча (например, кандидаты из пространственного индекса);
+    строки из NaN ничего не пересекают и дополняют списки кандидатов до общей длины.
+    Допуск tol и исключение отрезков, у которых есть общий конец с началом луча,
+    совпадают с line_intersection.
+
+    По умолчанию для каждого луча возвращается первое попадание в порядке массива segments
+    (так работает последовательное усечение в ChunkManager.expand_structure); при nearest=True –
+    попадание с наименьшим параметром t вдоль луча.
+
+    Возвращает (t, index): параметр точки пересечения вдоль луча и индекс отрезка.
+    Если пересечений нет, t = nan, index = -1. Для одного луча возвращаются скаляры,
+    для массива лучей – массивы длины M.
+    """
+    rays = np.asarray(rays, dtype=np.float64)
+    single = rays.ndim == 1
+    if single:
+        rays = rays[np.newaxis]
+    segments = np.asarray(segments, dtype=np.float64)
+    if segments.size == 0:
+        if single:
+            return math.nan, -1
+        return np.full(len(rays), np.nan), np.full(len(rays), -1, dtype=np.intp)
+    if segments.ndim != 3:
+        segments = segments.reshape(-1, 4)
+
+    # Формулы те же, что в line_intersection; для целых координат все промежуточные
+    # значения точны, поэтому результат совпадает со скалярной версией бит в бит.
+    x1 = rays[:, 0, np.newaxis]
+    y1 = rays[:, 1, np.newaxis]
+    dx = x1 - rays[:, 2, np.newaxis]
+    dy = y1 - rays[:, 3, np.newaxis]
+    x3, y3, x4, y4 = (segments[..., k] for k in range(4))
+    ex = x3 - x4
+    ey = y3 - y4
+    ax = x1 - x3
+    ay = y1 - y3
+
+    denom = dx * ey - dy * ex
+    hit = np.abs(denom) >= tol
+    # Новый отрезок исходит из конца проверяемого отрезка
+    hit &= (np.abs(ax) >= 1e-6) | (np.abs(ay) >= 1e-6)
+    hit &= (np.abs(x1 - x4) >= 1e-6) | (np.abs(y1 - y4) >= 1e-6)
+    denom = np.where(hit, denom, 1.0)
+    t = (ax * ey - ay * ex) / denom
+    u = (ax * dy - ay * dx) / denom
+    hit &= (t >= -tol) & (t <= 1 + tol) & (u >= -tol) & (u <= 1 + tol)
+
+    rows = np.arange(len(rays))
+    if nearest:
+        index = np.argmin(np.where(hit, t, np.inf), axis=1)
+    else:
+        index = np.argmax(hit, axis=1)
+    found = hit[rows, index]
+    t_hit = np.where(found, t[rows, index], np.nan)
+    index = np.where(found, index, -1)
+    if single:
+        return float(t_hit[0]), int(index[0])
+    return t_hit, index
+
+
+def generate_initial_rays(parent_point: CellPoint, ray_count=2, min_length=30, max_length=50, rng=random):
     """
     Генерирует ray_count лучей из parent_point, равномерно распределенных по окружности.
     Чтобы сумма лучей была 0, для каждой пары (напр., при четном ray_count) применяем компенсирующее смещение.
     Здесь мы будем генерировать лучи как пары: для каждого луча вычисляем случайное смещение, и противоположный луч
     получает отрицательное смещение.
     Возвращает список лучей: каждый луч – кортеж (dx, dy) и также возвращается базовый угол (в радианах).
+    rng – источник случайных чисел (модуль random или экземпляр random.Random).
     """
     rays = []
     # ray_count должно быть четным
@@ -48,11 +119,11 @@ def generate_initial_rays(parent_point: CellPoint, ray_count=2, min_length=30, m
     base_angle_step = (2 * math.pi) / ray_count
     for i in range(ray_count // 2):
         base_angle = i * base_angle_step
-        offset = random.uniform(-0.1, 0.1)  # маленькое смещение в радианах (примерно ±6°)
+        offset = rng.uniform(-0.1, 0.1)  # маленькое смещение в радианах (примерно ±6°)
         angle1 = base_angle + offset
         angle2 = base_angle + math.pi - offset  # противоположное направление
-        length1 = random.uniform(min_length, max_length)
-        length2 = random.uniform(min_length, max_length)
+        length1 = rng.uniform(min_length, max_length)
+        length2 = rng.uniform(min_length, max_length)
         rays.append(((math.cos(angle1) * length1, math.sin(angle1) * length1), angle1))
         rays.append(((math.cos(angle2) * length2, math.sin(angle2) * length2), angle2))
     return rays
@@ -60,21 +131,22 @@ def generate_initial_rays(parent_point: CellPoint, ray_count=2, min_length=30, m
 
 def generate_child_rays(start_point: CellPoint, base_direction: float, child_count: int = 2,
                         min_length: float = 30, max_length: float = 50,
-                        max_deviation: float = math.radians(80)) -> list:
+                        max_deviation: float = math.radians(80), rng=random) -> list:
     """
     Генерирует child_count лучей из start_point.
     Направление каждого луча основывается на base_direction (в радианах) с отклонением не более max_deviation.
 
     Возвращает список лучей, где каждый луч представлен как список [start_point, end_point],
     а end_point – объект CellPoint с целочисленными координатами.
+    rng – источник случайных чисел (модуль random или экземпляр random.Random).
     """
     rays = []
     for _ in range(child_count):
         # Вычисляем случайное отклонение
-        deviation = random.uniform(-max_deviation, max_deviation)
+        deviation = rng.uniform(-max_deviation, max_deviation)
         new_angle = base_direction + deviation
         # Выбираем случайную длину луча
-        length = random.uniform(min_length, max_length)
+        length = rng.uniform(min_length, max_length)
         dx = math.cos(new_angle) * length
         dy = math.sin(new_angle) * length
         # Вычисляем координаты конечной точки и округляем до целых чисел
@@ -85,6 +157,128 @@ def generate_child_rays(start_point: CellPoint, base_direction: float, child_cou
     return rays
 
 
+def child_ray_ends(start_points, base_directions, uniforms, min_length: float = 30, max_length: float = 50,
+                   max_deviation: float = math.radians(80)) -> np.ndarray:
+    """
+    Векторная часть generate_child_rays_batch: концы лучей по заранее полученным случайным числам.
+
+    uniforms – массив (N, k, 2) чисел из [0, 1): для каждого из k лучей точки – отклонение
+    и длина, как rng.uniform(-max_deviation, max_deviation) и rng.uniform(min_length, max_length)
+    в generate_child_rays. Возвращает массив (N * k, 2) int64 концов лучей; лучи одной точки идут подряд.
+    """
+    start_points = np.asarray(start_points, dtype=np.float64).reshape(-1, 2)
+    base_directions = np.asarray(base_directions, dtype=np.float64)
+    angles = base_directions[:, None] + (2 * uniforms[..., 0] - 1) * max_deviation
+    lengths = min_length + (max_length - min_length) * uniforms[..., 1]
+    ends = np.empty(angles.shape + (2,), dtype=np.float64)
+    ends[..., 0] = start_points[:, None, 0] + np.cos(angles) * lengths
+    ends[..., 1] = start_points[:, None, 1] + np.sin(angles) * lengths
+    # np.rint, как и round, округляет половины к четному
+    return np.rint(ends).astype(np.int64).reshape(-1, 2)
+
+
+def generate_child_rays_batch(start_points, base_directions, child_count: int = 2,
+                              min_length: float = 30, max_length: float = 50,
+                              max_deviation: float = math.radians(80), rng=None) -> np.ndarray:
+    """
+    Пакетный вариант generate_child_rays: по child_count лучей из каждой из N точек одним вызовом NumPy.
+
+    start_points – массив (N, 2) координат точек, base_directions – массив N базовых направлений
+    (в радианах); отклонения и длины распределены так же, как в generate_child_rays.
+    rng – numpy.random.Generator (по умолчанию – np.random.default_rng() без зерна).
+
+    Returns:
+        np.ndarray: массив (N * child_count, 2) int64 концов лучей; лучи одной точки идут подряд.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    count = len(base_directions)
+    return child_ray_ends(start_points, base_directions, rng.random((count, child_count, 2)),
+                          min_length, max_length, max_deviation)
+
+
+_MASK64 = (1 << 64) - 1
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_SHIFTS = (np.uint64(30), np.uint64(27), np.uint64(31), np.uint64(11))
+
+
+def _splitmix64(z: np.ndarray) -> np.ndarray:
+    z = z + _GOLDEN
+    z = (z ^ (z >> _SHIFTS[0])) * _MIX1
+    z = (z ^ (z >> _SHIFTS[1])) * _MIX2
+    return z ^ (z >> _SHIFTS[2])
+
+
+def _splitmix64_int(z: int) -> int:
+    z = (z + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def hashed_uniforms(seed: int, key, points, shape) -> np.ndarray:
+    """
+    Возвращает для каждой из N точек массив shape чисел из [0, 1), однозначно определяемых
+    (seed, key, координаты точки) – счетчиковый генератор на основе splitmix64.
+    В отличие от общего генератора, числа точки не зависят от того, в каком пакете и после
+    каких точек она обрабатывается.
+
+    Returns:
+        np.ndarray: массив (N,) + shape float64.
+    """
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    state = seed & _MASK64
+    for value in key:
+        state = _splitmix64_int(state ^ (value & _MASK64))
+    size = int(np.prod(shape))
+    with np.errstate(over="ignore"):
+        state = _splitmix64(np.uint64(state) ^ points[:, 0].astype(np.uint64))
+        state = _splitmix64(state ^ points[:, 1].astype(np.uint64))
+        bits = _splitmix64(state[:, None] + np.arange(size, dtype=np.uint64) * _GOLDEN)
+    # 53 старших бита – равномерное число с плавающей точкой из [0, 1)
+    return ((bits >> _SHIFTS[3]).astype(np.float64) * (1.0 / (1 << 53))).reshape((len(points),) + tuple(shape))
+
+
+def closest_point_on_segment(px: float, py: float, x1: float, y1: float, x2: float, y2: float):
+    """
+    Возвращает (t, квадрат расстояния) для ближайшей к (px, py) точки отрезка (x1, y1) – (x2, y2):
+    t из [0, 1] – ее параметр вдоль отрезка (0 – начало, 1 – конец).
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else min(max(((px - x1) * dx + (py - y1) * dy) / length2, 0.0), 1.0)
+    cx = x1 + t * dx - px
+    cy = y1 + t * dy - py
+    return t, cx * cx + cy * cy
+
+
+def segment_intersects_rect(x1: float, y1: float, x2: float, y2: float,
+                            min_x: float, min_y: float, max_x: float, max_y: float) -> bool:
+    """
+    Проверяет, есть ли у отрезка (x1, y1) – (x2, y2) общие точки с прямоугольником
+    [min_x, max_x] x [min_y, max_y] (отсечение Лианга – Барски).
+    """
+    t0, t1 = 0.0, 1.0
+    dx = x2 - x1
+    dy = y2 - y1
+    for p, q in ((-dx, x1 - min_x), (dx, max_x - x1), (-dy, y1 - min_y), (dy, max_y - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        r = q / p
+        if p < 0:
+            t0 = max(t0, r)
+        else:
+            t1 = min(t1, r)
+        if t0 > t1:
+            return False
+    return True
+
+
 def calculate_angle(x1, y1, x2, y2):
     dx = x2 - x1
     dy = y2 - y1
@@ -1,7 +1,11 @@
 # chunk.py
-from typing import Optional, List, Tuple, Set
+from collections import deque
+from typing import Deque, Optional, Tuple
 from cell_point import CellPoint
 from cell_line import CellLine
+from chunk_geometry import ChunkGeometry, ChunkLines
+from chunk_lod import ChunkLOD
+from spatial_index import SegmentGrid
 
 
 class Chunk:
@@ -14,8 +18,16 @@ class Chunk:
         width (int): Ширина чанка.
         height (int): Высота чанка.
         loaded (bool): Флаг, указывающий, загружен ли чанк.
-        lines (List[CellLine]): Список линий, находящихся в чанке.
+        lines (ChunkLines): Последовательность линий чанка (представления рёбер geometry).
         grid_pos (Optional[Tuple[int, int]]): Позиция чанка в сетке (например, (i, j)).
+        geometry (ChunkGeometry): компактное хранилище вершин и рёбер чанка.
+        frontier (Deque[int]): очередь рёбер, конечные точки которых еще не испускали лучи,
+            в порядке добавления.
+        index (SegmentGrid): пространственный индекс линий чанка; идентификатор отрезка
+            в индексе совпадает с позицией линии в lines. Через него же ищутся вершины
+            чанка рядом с точкой: каждая вершина – конец хотя бы одного отрезка.
+        lod (Optional[ChunkLOD]): упрощенные представления линий для отдаленного вида; строятся
+            ChunkManager, когда чанк закончил расширение (см. ChunkManager.chunk_lod).
     """
     def __init__(self, x: int, y: int, width: int, height: int,
                  need_expand: bool = True, grid_pos: Optional[Tuple[int, int]] = None) -> None:
@@ -25,7 +37,14 @@ class Chunk:
         self.height: int = height
         self.need_expand: bool = need_expand
         self.grid_pos: Optional[Tuple[int, int]] = grid_pos
-        self.lines: Set[CellLine] = []
+        self.geometry: ChunkGeometry = ChunkGeometry(key=grid_pos)
+        self.index: SegmentGrid = SegmentGrid()
+        self.frontier: Deque[int] = deque()
+        self.lod: Optional[ChunkLOD] = None
+
+    @property
+    def lines(self) -> ChunkLines:
+        return ChunkLines(self.geometry)
 
     def contains(self, point: CellPoint) -> bool:
         """
@@ -40,10 +59,37 @@ class Chunk:
 
     def add_line(self, line: CellLine) -> None:
         """
-        Добавляет линию в чанк.
+        Добавляет линию в чанк и регистрирует её в пространственном индексе.
+
+        Концы линии становятся вершинами geometry (общие вершины не дублируются),
+        а сама линия, если она не принадлежит другому чанку, – представлением нового ребра.
+        Если конечная точка еще не испускала лучи, ребро ставится во фронтир.
         """
-        self.lines.append(line)
+        geometry = self.geometry
+        edge = geometry.add_edge(geometry.intern(line.start), geometry.intern(line.end))
+        if line._geometry is None:
+            geometry.membership[edge] = min(line._polygon_membership, 255)
+            line._geometry = geometry
+            line._index = edge
+        self.update_index(edge)
+        if not geometry.end_emitted(edge):
+            self.frontier.append(edge)
 
+    def update_index(self, edge_start: int) -> None:
+        """
+        Регистрирует в пространственном индексе чанка рёбра geometry, начиная с edge_start.
+        """
+        geometry = self.geometry
+        for edge in range(edge_start, geometry.edge_count):
+            self.index.insert(*geometry.segment(edge))
+
+    def nbytes(self) -> int:
+        """
+        Возвращает приблизительный объём памяти, занимаемый геометрией, индексом, фронтиром и LOD чанка.
+        """
+        # 8 байт на элемент deque – указатель на малое целое
+        lod = 0 if self.lod is None else self.lod.nbytes()
+        return self.geometry.nbytes() + self.index.nbytes() + 8 * len(self.frontier) + lod
 
     def __repr__(self) -> str:
         return (f"Chunk(x={self.x}, "
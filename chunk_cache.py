@@ -0,0 +1,123 @@
+# chunk_cache.py
+import zlib
+from array import array
+from typing import NamedTuple, Tuple
+
+from chunk import Chunk
+
+
+class ChunkParts(NamedTuple):
+    """
+    Массивы чанка в виде байтов (int32 в порядке байтов платформы), без битового поля has_emitted.
+
+    Атрибуты:
+        xy: координаты вершин, по две на вершину.
+        edges: индексы вершин рёбер, по два на ребро.
+        membership: polygon_membership, байт на ребро.
+        links: ссылки на общие вершины, по четыре числа (индекс, i дома, j дома, индекс в доме).
+        frontier: рёбра фронтира в порядке очереди.
+    """
+    xy: bytes
+    edges: bytes
+    membership: bytes
+    links: bytes
+    frontier: bytes
+
+
+def chunk_parts(chunk: Chunk) -> ChunkParts:
+    """
+    Возвращает массивы чанка в виде ChunkParts.
+    """
+    geometry = chunk.geometry
+    links = array("i")
+    for index, (home_key, home_index) in geometry.links.items():
+        links.extend((index, home_key[0], home_key[1], home_index))
+    return ChunkParts(geometry.xy.tobytes(), geometry.edges.tobytes(), bytes(geometry.membership),
+                      links.tobytes(), array("i", chunk.frontier).tobytes())
+
+
+def fill_chunk(chunk: Chunk, parts: ChunkParts, emitted: bytearray, need_expand: bool) -> None:
+    """
+    Заполняет пустой чанк массивами parts и битовым полем emitted (используется без копирования)
+    и перестраивает списки рёбер вершин и пространственные индексы.
+    """
+    geometry = chunk.geometry
+    geometry.xy.frombytes(parts.xy)
+    geometry.edges.frombytes(parts.edges)
+    geometry.membership.extend(parts.membership)
+    geometry.emitted = emitted
+    link_values = array("i")
+    link_values.frombytes(parts.links)
+    for k in range(0, len(link_values), 4):
+        index, home_i, home_j, home_index = link_values[k:k + 4]
+        ref = ((home_i, home_j), home_index)
+        geometry.links[index] = ref
+        geometry._linked[ref] = index
+    frontier = array("i")
+    frontier.frombytes(parts.frontier)
+    chunk.frontier.extend(frontier)
+    chunk.need_expand = need_expand
+    geometry.extend_adjacency()
+    chunk.update_index(0)
+
+
+class EvictedChunk:
+    """
+    Сжатая запись чанка, вытесненного из памяти ChunkManager.
+
+    Координаты вершин, рёбра, счётчики polygon_membership, ссылки на общие вершины и фронтир
+    хранятся одним блоком zlib. Битовое поле has_emitted остаётся несжатым: пока чанк вытеснен,
+    он продолжает быть домом для вершин, на которые ссылаются другие чанки, и их флаги
+    читаются и пишутся прямо сюда (атрибут emitted совместим с ChunkGeometry.emitted).
+
+    Атрибуты:
+        key (Tuple[int, int]): ключ чанка.
+        need_expand (bool): флаг need_expand чанка.
+        emitted (bytearray): битовое поле has_emitted вершин чанка.
+        data (bytes): сжатые массивы чанка.
+    """
+
+    __slots__ = ("key", "need_expand", "emitted", "data")
+
+    def __init__(self, key: Tuple[int, int], need_expand: bool, emitted: bytearray, data: bytes) -> None:
+        self.key: Tuple[int, int] = key
+        self.need_expand: bool = need_expand
+        self.emitted: bytearray = emitted
+        self.data: bytes = data
+
+    @classmethod
+    def from_chunk(cls, chunk: Chunk) -> "EvictedChunk":
+        """
+        Упаковывает чанк в запись.
+        """
+        parts = chunk_parts(chunk)
+        header = array("i", [len(part) for part in parts]).tobytes()
+        return cls(chunk.grid_pos, chunk.need_expand, chunk.geometry.emitted,
+                   zlib.compress(header + b"".join(parts), 1))
+
+    def parts(self) -> ChunkParts:
+        """
+        Распаковывает массивы чанка в том же виде, что и chunk_parts.
+        """
+        raw = zlib.decompress(self.data)
+        header = array("i")
+        header.frombytes(raw[:len(ChunkParts._fields) * header.itemsize])
+        offset = len(ChunkParts._fields) * header.itemsize
+        parts = []
+        for size in header:
+            parts.append(raw[offset:offset + size])
+            offset += size
+        return ChunkParts(*parts)
+
+    def restore_into(self, chunk: Chunk) -> None:
+        """
+        Заполняет пустой чанк с тем же ключом данными записи и перестраивает его индекс.
+        """
+        # Тот же объект bytearray: флаги, записанные через ссылки во время вытеснения, сохраняются
+        fill_chunk(chunk, self.parts(), self.emitted, self.need_expand)
+
+    def nbytes(self) -> int:
+        return len(self.data) + len(self.emitted)
+
+    def __repr__(self) -> str:
+        return f"EvictedChunk(key={self.key}, need_expand={self.need_expand}, bytes={self.nbytes()})"
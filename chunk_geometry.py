@@ -0,0 +1,319 @@
+# chunk_geometry.py
+from array import array
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cell_line import CellLine
+from cell_point import CellPoint
+
+# Ссылка на вершину: (ключ чанка-владельца, индекс вершины в его геометрии)
+VertexRef = Tuple[Optional[Tuple[int, int]], int]
+
+
+class ChunkGeometry:
+    """
+    Компактное хранилище геометрии чанка в виде структуры массивов.
+
+    Вершины хранятся в растущем массиве int32 (x, y попеременно), рёбра – парами индексов вершин,
+    флаг has_emitted – битовым полем, счётчик polygon_membership – байтом на ребро.
+    Объекты CellPoint/CellLine, которые возвращают point() и line(), – лёгкие представления
+    поверх этих массивов: флаги и счётчики читаются и записываются прямо в хранилище.
+
+    Для обхода графа за O(степени) рёбра каждой вершины связаны в список: first хранит первое
+    «гнездо» вершины, next – следующее гнездо той же вершины (гнездо 2 * e – начало ребра e,
+    2 * e + 1 – его конец, -1 – конец списка).
+
+    Одна и та же вершина может использоваться рёбрами нескольких чанков. Её «дом» – геометрия,
+    в которую она попала первой; остальные геометрии хранят копию координат и ссылку на дом
+    в links, а флаг has_emitted такой вершины читается и пишется в доме (через resolver).
+
+    Атрибуты:
+        key (Optional[Tuple[int, int]]): ключ чанка, которому принадлежит геометрия.
+        resolver (Optional[Callable]): функция ключ -> ChunkGeometry для разрешения ссылок links.
+        xy (array): координаты вершин (int32), по две на вершину.
+        edges (array): индексы вершин рёбер (int32), по два на ребро.
+        membership (bytearray): polygon_membership для каждого ребра.
+        emitted (bytearray): битовое поле has_emitted для вершин.
+        links (Dict[int, VertexRef]): локальная вершина -> её дом в другой геометрии.
+        first (array): первое гнездо списка рёбер для каждой вершины (int32).
+        next (array): следующее гнездо для каждого гнезда рёбер (int32).
+    """
+
+    def __init__(self, key: Optional[Tuple[int, int]] = None,
+                 resolver: Optional[Callable[[Tuple[int, int]], Optional["ChunkGeometry"]]] = None) -> None:
+        self.key: Optional[Tuple[int, int]] = key
+        self.resolver = resolver
+        self.xy: array = array("i")
+        self.edges: array = array("i")
+        self.membership: bytearray = bytearray()
+        self.emitted: bytearray = bytearray()
+        self.links: Dict[int, VertexRef] = {}
+        self._linked: Dict[VertexRef, int] = {}
+        self.first: array = array("i")
+        self.next: array = array("i")
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.xy) >> 1
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edges) >> 1
+
+    # --- Вершины ---
+
+    def add_vertex(self, x: int, y: int, emitted: bool = False) -> int:
+        """
+        Добавляет новую вершину и возвращает её индекс.
+        """
+        index = len(self.xy) >> 1
+        self.xy.append(x)
+        self.xy.append(y)
+        self.first.append(-1)
+        if index & 7 == 0:
+            self.emitted.append(0)
+        if emitted:
+            self.emitted[index >> 3] |= 1 << (index & 7)
+        return index
+
+    def home_of(self, index: int) -> VertexRef:
+        """
+        Возвращает ссылку на дом вершины index.
+        """
+        return self.links.get(index) or (self.key, index)
+
+    def intern(self, point: CellPoint) -> int:
+        """
+        Возвращает локальный индекс вершины для point, при необходимости добавляя её.
+
+        Свободная точка (не привязанная к хранилищу) добавляется как новая вершина и сама
+        становится представлением этой вершины. Точка из другой геометрии добавляется как
+        копия со ссылкой на свой дом; повторное добавление той же вершины возвращает тот же индекс.
+        """
+        geometry = point._geometry
+        if geometry is self:
+            return point._index
+        if geometry is None:
+            index = self.add_vertex(point.x, point.y, point._has_emitted)
+            point._geometry = self
+            point._index = index
+            return index
+
+        home = geometry.home_of(point._index)
+        if home[0] is not None and home[0] == self.key:
+            return home[1]
+        if home[0] is None:
+            # Дом без ключа (отдельный чанк вне менеджера) сослаться на нельзя – копируем вершину
+            return self.add_vertex(point.x, point.y, point.has_emitted)
+        index = self._linked.get(home)
+        if index is None:
+            index = self.add_vertex(point.x, point.y, point.has_emitted)
+            self.links[index] = home
+            self._linked[home] = index
+        return index
+
+    def _home_geometry(self, index: int) -> Tuple["ChunkGeometry", int]:
+        link = self.links.get(index)
+        if link is not None and self.resolver is not None:
+            home = self.resolver(link[0])
+            if home is not None:
+                return home, link[1]
+        return self, index
+
+    def is_emitted(self, index: int) -> bool:
+        if index in self.links:
+            geometry, index = self._home_geometry(index)
+            return bool(geometry.emitted[index >> 3] >> (index & 7) & 1)
+        return bool(self.emitted[index >> 3] >> (index & 7) & 1)
+
+    def set_emitted(self, index: int, value: bool = True) -> None:
+        targets = [(self, index)]
+        if index in self.links:
+            # Локальная копия тоже обновляется: она пригодится, если дом будет недоступен
+            targets.append(self._home_geometry(index))
+        for geometry, i in targets:
+            if value:
+                geometry.emitted[i >> 3] |= 1 << (i & 7)
+            else:
+                geometry.emitted[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def sync_links(self) -> None:
+        """
+        Обновляет локальные копии флагов has_emitted связанных вершин значениями из их домов.
+        Нужно перед тем, как геометрия копируется туда, где дома недоступны (например, в другой процесс).
+        """
+        for index in self.links:
+            geometry, home_index = self._home_geometry(index)
+            if geometry is not self:
+                self.set_emitted(index, bool(geometry.emitted[home_index >> 3] >> (home_index & 7) & 1))
+
+    def point(self, index: int) -> CellPoint:
+        """
+        Возвращает представление CellPoint для вершины index.
+        """
+        return CellPoint.view(self, index, self.xy[2 * index], self.xy[2 * index + 1])
+
+    # --- Рёбра ---
+
+    def add_edge(self, start: int, end: int) -> int:
+        """
+        Добавляет ребро между вершинами start и end и возвращает его индекс.
+        """
+        index = len(self.edges) >> 1
+        self.edges.append(start)
+        self.edges.append(end)
+        self.membership.append(0)
+        self._link_edge(index)
+        return index
+
+    def _link_edge(self, index: int) -> None:
+        first = self.first
+        for slot in (2 * index, 2 * index + 1):
+            vertex = self.edges[slot]
+            self.next.append(-1)
+            self.next[slot] = first[vertex]
+            first[vertex] = slot
+
+    def extend_adjacency(self) -> None:
+        """
+        Достраивает списки рёбер вершин для вершин и рёбер, добавленных в массивы напрямую
+        (минуя add_vertex/add_edge).
+        """
+        self.first.extend([-1] * (self.vertex_count - len(self.first)))
+        for index in range(len(self.next) >> 1, self.edge_count):
+            self._link_edge(index)
+
+    def incident_edges(self, index: int) -> List[int]:
+        """
+        Возвращает индексы рёбер геометрии, инцидентных вершине index (новые – первыми).
+        """
+        edges = []
+        slot = self.first[index]
+        while slot >= 0:
+            edges.append(slot >> 1)
+            slot = self.next[slot]
+        return edges
+
+    def other_end(self, edge: int, index: int) -> int:
+        """
+        Возвращает вершину ребра edge, противоположную вершине index.
+        """
+        start = self.edges[2 * edge]
+        return self.edges[2 * edge + 1] if start == index else start
+
+    def end_emitted(self, index: int) -> bool:
+        """
+        Возвращает has_emitted конечной вершины ребра index без создания представлений.
+        """
+        return self.is_emitted(self.edges[2 * index + 1])
+
+    def line(self, index: int) -> CellLine:
+        """
+        Возвращает представление CellLine для ребра index.
+        """
+        return CellLine.view(self, index, self.point(self.edges[2 * index]), self.point(self.edges[2 * index + 1]))
+
+    def segment(self, index: int) -> Tuple[int, int, int, int]:
+        """
+        Возвращает координаты ребра index в виде (x1, y1, x2, y2).
+        """
+        xy = self.xy
+        start = 2 * self.edges[2 * index]
+        end = 2 * self.edges[2 * index + 1]
+        return xy[start], xy[start + 1], xy[end], xy[end + 1]
+
+    def segments(self) -> np.ndarray:
+        """
+        Возвращает новый массив (N, 4) float64 координат рёбер (x1, y1, x2, y2)
+        для segment_intersections_batch.
+        """
+        if not self.edges:
+            return np.empty((0, 4), dtype=np.float64)
+        xy = np.frombuffer(self.xy, dtype=np.intc).reshape(-1, 2)
+        edges = np.frombuffer(self.edges, dtype=np.intc)
+        return xy[edges].reshape(-1, 4).astype(np.float64)
+
+    def export_delta(self, vertex_start: int, edge_start: int) -> tuple:
+        """
+        Возвращает изменения геометрии с момента, когда в ней было vertex_start вершин
+        и edge_start рёбер: новые вершины, рёбра и ссылки, а также битовое поле has_emitted целиком.
+        Результат применяется к исходной геометрии через apply_delta.
+        """
+        new_links = {index: ref for index, ref in self.links.items() if index >= vertex_start}
+        return (self.xy[2 * vertex_start:].tobytes(), self.edges[2 * edge_start:].tobytes(),
+                bytes(self.membership[edge_start:]), bytes(self.emitted), new_links)
+
+    def apply_delta(self, delta: tuple) -> List[int]:
+        """
+        Применяет изменения, полученные export_delta от копии этой геометрии.
+        Флаги has_emitted только добавляются; для связанных вершин они передаются в дома.
+
+        Returns:
+            List[int]: индексы добавленных рёбер.
+        """
+        xy, edges, membership, emitted, new_links = delta
+        edge_start = self.edge_count
+        self.xy.frombytes(xy)
+        self.edges.frombytes(edges)
+        self.membership.extend(membership)
+        for index, ref in new_links.items():
+            self.links[index] = ref
+            self._linked[ref] = index
+        self.extend_adjacency()
+
+        old = np.zeros(len(emitted), dtype=np.uint8)
+        old[:len(self.emitted)] = np.frombuffer(self.emitted, dtype=np.uint8)
+        new = np.frombuffer(emitted, dtype=np.uint8)
+        self.emitted = bytearray((old | new).tobytes())
+        if self.links:
+            changed = np.flatnonzero(np.unpackbits(new & ~old, bitorder="little"))
+            for index in changed.tolist():
+                if index in self.links:
+                    self.set_emitted(index)
+        return list(range(edge_start, self.edge_count))
+
+    def __getstate__(self) -> dict:
+        # resolver ссылается на менеджер чанков и в копию не переносится
+        state = dict(self.__dict__)
+        state["resolver"] = None
+        return state
+
+    def nbytes(self) -> int:
+        """
+        Возвращает объём данных в массивах хранилища (без учёта links).
+        """
+        return (len(self.xy) + len(self.edges) + len(self.first) + len(self.next)) * self.xy.itemsize + \
+            len(self.membership) + len(self.emitted)
+
+    def __repr__(self) -> str:
+        return f"ChunkGeometry(key={self.key}, vertices={self.vertex_count}, edges={self.edge_count})"
+
+
+class ChunkLines(Sequence):
+    """
+    Последовательность CellLine-представлений рёбер геометрии чанка (только для чтения).
+    """
+
+    def __init__(self, geometry: ChunkGeometry) -> None:
+        self.geometry: ChunkGeometry = geometry
+
+    def __len__(self) -> int:
+        return self.geometry.edge_count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.geometry.line(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+        return self.geometry.line(index)
+
+    def __iter__(self) -> Iterator[CellLine]:
+        line = self.geometry.line
+        for index in range(len(self)):
+            yield line(index)
+
+    def __repr__(self) -> str:
+        return f"ChunkLines({list(self)})"
@@ -0,0 +1,139 @@
+# chunk_lod.py
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class ChunkLOD:
+    """
+    Упрощенные представления линий чанка для отрисовки и экспорта при отдалении.
+
+    Уровень 0 – сами линии чанка (в ChunkLOD не хранятся). Уровни 1..len(CELL_SIZES) – линии
+    после кластеризации вершин: каждый конец линии заменяется центром ячейки мировой сетки
+    со стороной CELL_SIZES[level - 1], линии, ставшие точками, и повторы отбрасываются.
+    Сетка общая для всех чанков, поэтому упрощенные линии соседних чанков сходятся в тех же
+    точках. Последний уровень – растр плотности: суммарная длина линий в каждой ячейке
+    со стороной width / DENSITY_SIZE. Растр покрывает чанк и выступающие за него части
+    его линий, его сетка выровнена по углу чанка.
+
+    Уровень выбирается по масштабу (пикселей экрана на единицу мира) – см. select: чем меньше
+    масштаб, тем грубее уровень, пока ошибка упрощения меньше PIXEL_TOLERANCE пикселей.
+
+    Атрибуты:
+        x, y, width, height (int): границы чанка.
+        edge_count (int): число линий чанка, по которым построены уровни.
+        levels (Tuple[np.ndarray, ...]): отрезки (N, 4) int32 уровней 1..len(CELL_SIZES).
+        density (np.ndarray): растр плотности (строки, столбцы) uint8; 255 – линии покрывают
+            ячейку с плотностью DENSITY_SATURATION и больше.
+        density_origin (Tuple[float, float]): мировые координаты левого верхнего угла растра.
+        density_cell (float): сторона ячейки растра в единицах мира.
+    """
+
+    __slots__ = ("x", "y", "width", "height", "edge_count", "levels", "density", "density_origin",
+                 "density_cell")
+
+    # Стороны ячеек кластеризации вершин уровней 1, 2, ...
+    CELL_SIZES = (8, 16, 32)
+    # Число ячеек растра плотности на сторону чанка
+    DENSITY_SIZE = 16
+    # Длина линий в ячейке (в сторонах ячейки), при которой растр насыщается
+    DENSITY_SATURATION = 2.0
+    # Допустимый размер ячейки уровня на экране в пикселях
+    PIXEL_TOLERANCE = 2.0
+
+    def __init__(self, x: int, y: int, width: int, height: int, segments: np.ndarray) -> None:
+        self.x: int = x
+        self.y: int = y
+        self.width: int = width
+        self.height: int = height
+        self.edge_count: int = len(segments)
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        self.levels: Tuple[np.ndarray, ...] = tuple(self.simplify(segments, cell) for cell in self.CELL_SIZES)
+        self.density_cell: float = width / self.DENSITY_SIZE
+        self.density_origin: Tuple[float, float] = (x, y)
+        self.density: np.ndarray = np.zeros((math.ceil(height / self.density_cell), self.DENSITY_SIZE),
+                                             dtype=np.uint8)
+        self._build_density(segments)
+
+    @staticmethod
+    def simplify(segments: np.ndarray, cell: float) -> np.ndarray:
+        """
+        Кластеризует концы отрезков по мировой сетке со стороной cell и возвращает
+        различные невырожденные отрезки между центрами ячеек (N, 4) int32.
+        """
+        if not len(segments):
+            return np.empty((0, 4), dtype=np.int32)
+        snapped = (np.floor(np.asarray(segments, dtype=np.float64) / cell) * cell + cell // 2).astype(np.int32)
+        snapped = snapped[(snapped[:, 0] != snapped[:, 2]) | (snapped[:, 1] != snapped[:, 3])]
+        # Одинаковые отрезки в обоих направлениях – один отрезок
+        swap = (snapped[:, 0] > snapped[:, 2]) | ((snapped[:, 0] == snapped[:, 2]) & (snapped[:, 1] > snapped[:, 3]))
+        snapped[swap] = snapped[swap][:, [2, 3, 0, 1]]
+        # Строка из четырех int32 сравнивается как одно 16-байтовое значение – быстрее unique(axis=0)
+        rows = np.ascontiguousarray(snapped).view(np.dtype((np.void, 16))).ravel()
+        return np.unique(rows).view(np.int32).reshape(-1, 4)
+
+    def _build_density(self, segments: np.ndarray) -> None:
+        if not len(segments):
+            return
+        cell = self.density_cell
+        # Растр расширяется целыми ячейками, чтобы вместить части линий за границами чанка
+        pad_left = max(0, math.ceil((self.x - min(segments[:, 0].min(), segments[:, 2].min())) / cell))
+        pad_top = max(0, math.ceil((self.y - min(segments[:, 1].min(), segments[:, 3].min())) / cell))
+        pad_right = max(0, math.ceil((max(segments[:, 0].max(), segments[:, 2].max()) - self.x - self.width) / cell))
+        pad_bottom = max(0, math.ceil((max(segments[:, 1].max(), segments[:, 3].max()) - self.y - self.height) / cell))
+        columns = self.DENSITY_SIZE + pad_left + pad_right
+        rows = math.ceil(self.height / cell) + pad_top + pad_bottom
+        origin_x = self.x - pad_left * cell
+        origin_y = self.y - pad_top * cell
+
+        # Каждый отрезок заменяется точками с шагом не больше половины ячейки, каждая несет свою долю длины
+        lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+        counts = np.maximum(np.ceil(2 * lengths / cell).astype(np.int64), 1)
+        owner = np.repeat(np.arange(len(segments)), counts)
+        t = (np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts) + 0.5) / counts[owner]
+        xs = segments[owner, 0] + (segments[owner, 2] - segments[owner, 0]) * t
+        ys = segments[owner, 1] + (segments[owner, 3] - segments[owner, 1]) * t
+        column = np.clip(((xs - origin_x) // cell).astype(np.int64), 0, columns - 1)
+        row = np.clip(((ys - origin_y) // cell).astype(np.int64), 0, rows - 1)
+        length = np.bincount(row * columns + column, weights=(lengths / counts)[owner], minlength=rows * columns)
+        scaled = np.minimum(length / (cell * self.DENSITY_SATURATION), 1.0) * 255
+        self.density = np.round(scaled).astype(np.uint8).reshape(rows, columns)
+        self.density_origin = (origin_x, origin_y)
+
+    @property
+    def density_level(self) -> int:
+        return len(self.CELL_SIZES) + 1
+
+    def level_for_scale(self, scale: float, density: bool = True) -> int:
+        """
+        Возвращает уровень для масштаба scale (пикселей экрана на единицу мира): самый грубый,
+        ячейка которого на экране не больше PIXEL_TOLERANCE пикселей, и растр плотности,
+        если density и ячейка растра не больше пикселя.
+        """
+        if density and self.density_cell * scale <= 1:
+            return self.density_level
+        level = 0
+        for n, cell in enumerate(self.CELL_SIZES, start=1):
+            if cell * scale <= self.PIXEL_TOLERANCE:
+                level = n
+        return level
+
+    def select(self, scale: float, density: bool = True) -> Tuple[int, Optional[np.ndarray]]:
+        """
+        Возвращает (уровень, данные) для масштаба scale: для уровня 0 данные – None (нужны линии
+        чанка), для упрощенных уровней – отрезки (N, 4), для растра – self.density.
+        """
+        level = self.level_for_scale(scale, density)
+        if level == 0:
+            return 0, None
+        if level == self.density_level:
+            return level, self.density
+        return level, self.levels[level - 1]
+
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels) + self.density.nbytes
+
+    def __repr__(self) -> str:
+        sizes = ", ".join(str(len(level)) for level in self.levels)
+        return f"ChunkLOD(edges={self.edge_count}, levels=[{sizes}], density={self.density.shape})"
@@ -1,11 +1,29 @@
 # chunk_manager.py
 import math
-from typing import Tuple, Dict, Any, List
+import os
+import pickle
+import random
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, Dict, Any, List, Optional, Union, Callable
 
-from CellAlgoritm.cell_line import CellLine
-from CellAlgoritm.cell_point import CellPoint
-from CellAlgoritm.cell_structure_utils import line_intersection, calculate_angle, generate_child_rays, distance
+import numpy as np
+
+from cell_line import CellLine
+from cell_point import CellPoint
+from cell_polygon import CellPolygon
+from cell_structure_utils import line_intersection, calculate_angle, generate_child_rays, distance, \
+    segment_intersections_batch, child_ray_ends, hashed_uniforms, closest_point_on_segment, segment_intersects_rect
 from chunk import Chunk
+from chunk_cache import EvictedChunk, chunk_parts, fill_chunk
+from chunk_geometry import ChunkGeometry
+from chunk_lod import ChunkLOD
+from chunk_store import SpillFile, StoredChunk, WorldFile, write_world
+from chunk_versions import ChunkDelta, ChunkState, WorldVersion, chunk_delta
+from half_edge import HalfEdgeMesh
+from instrumentation import Instrumentation
+from spatial_index import SegmentGrid
 
 
 class ChunkManager:
@@ -17,13 +35,95 @@ class ChunkManager:
         chunk_width (int): ширина каждого чанка.
         chunk_height (int): высота каждого чанка.
         chunks (Dict[Tuple[int, int], Chunk]): словарь, где ключ – пара (i, j), а значение – объект Chunk.
+        seed (Optional[int]): зерно мира. Если задано, случайные числа для каждого испускания
+            выводятся из (seed, grid_pos, точка) – см. emission_rng; иначе используется глобальный random.
+        max_resident_bytes (Optional[int]): ограничение памяти чанков в памяти вместе с записями
+            вне памяти. При превышении давно не использованные чанки, удаленные от последнего
+            загруженного, вытесняются в сжатые записи evicted, а самые старые записи – во временный
+            файл (SpillFile); чанки восстанавливаются при обращении. None – без ограничения.
+        evicted (Dict[Tuple[int, int], Union[EvictedChunk, StoredChunk]]): чанки вне памяти –
+            вытесненные, вынесенные во временный файл или еще не прочитанные из файла мира (см. open).
+        instrumentation (Optional[Instrumentation]): сбор статистики расширения; None – выключен
+            (см. enable_instrumentation).
+        expand_cursor (Optional[Tuple[int, int]]): чанк, с которого продолжит проход expand_structure,
+            прерванный бюджетом; None – следующий вызов начнет новый проход с первого чанка.
+            Линии прерванного посреди чанка прохода добавляются в чанки, когда его проход завершится
+            (или раньше – при save, snapshot, unload_chunks, discard_chunks и расширении с workers).
+        faces (Optional[HalfEdgeMesh]): полурёберная структура для выделения ячеек; None – ячейки
+            не выделяются (см. enable_faces).
+        lod_enabled (bool): строить ли LOD чанков (Chunk.lod), когда они заканчивают расширение
+            (см. enable_lod).
+        child_count, child_min_length, child_max_length, child_max_deviation: параметры дочерних
+            лучей этого менеджера (см. configure_rays); по умолчанию – CHILD_COUNT и т. д.
     """
 
-    def __init__(self, origin: Tuple[int, int], chunk_width: int, chunk_height: int) -> None:
+    # Сколько точек фронтира обрабатывается одной пакетной операцией в режиме truncation="batch"
+    BATCH_BLOCK = 256
+    # Параметры дочерних лучей по умолчанию: число, диапазон длин и наибольшее отклонение
+    # от направления родительской линии в радианах (см. configure_rays)
+    CHILD_COUNT = 3
+    CHILD_MIN_LENGTH = 40
+    CHILD_MAX_LENGTH = 60
+    CHILD_MAX_DEVIATION = math.radians(90)
+    # Генерация дочерних лучей: "scalar" – generate_child_rays для каждой точки со своим emission_rng;
+    # "batch" – child_ray_ends для блока точек одним вызовом NumPy со случайными числами
+    # из emission_uniforms (другая последовательность случайных чисел, то же распределение)
+    RAY_GENERATION = "scalar"
+    # Сколько точек фронтира обрабатывается одним блоком в режиме усечения "index" (и при
+    # RAY_GENERATION="batch" в режиме "brute"); бюджет времени проверяется после каждого блока
+    RAY_BLOCK = 32
+    # Начальный радиус поиска nearest_point/nearest_line; радиус удваивается, пока не найдется ответ
+    QUERY_RADIUS = 32
+
+    def __init__(self, origin: Tuple[int, int], chunk_width: int, chunk_height: int,
+                 seed: Optional[int] = None, max_resident_bytes: Optional[int] = None) -> None:
         self.origin: Tuple[int, int] = origin
         self.chunk_width: int = chunk_width
         self.chunk_height: int = chunk_height
+        self.child_count: int = self.CHILD_COUNT
+        self.child_min_length: float = self.CHILD_MIN_LENGTH
+        self.child_max_length: float = self.CHILD_MAX_LENGTH
+        self.child_max_deviation: float = self.CHILD_MAX_DEVIATION
         self.chunks: Dict[Tuple[int, int], Chunk] = {}  # ключ: (i, j), значение: объект Chunk
+        self.seed: Optional[int] = seed
+        self.max_resident_bytes: Optional[int] = max_resident_bytes
+        self.evicted: Dict[Tuple[int, int], Union[EvictedChunk, StoredChunk]] = {}
+        # Записи evicted, которые могут держать данные в памяти, от старых к новым (см. _record_bytes),
+        # и временный файл для записей, вынесенных из памяти
+        self._records: Dict[Tuple[int, int], Union[EvictedChunk, StoredChunk]] = {}
+        self._spill: Optional[SpillFile] = None
+        # Порядок создания чанков: по нему идет расширение, даже если чанк вытеснялся и восстанавливался
+        self._creation_order: Dict[Tuple[int, int], int] = {}
+        self._creation_count: int = 0
+        # Диапазон ключей всех созданных чанков (min_i, min_j, max_i, max_j) – граница поиска запросов
+        self._key_bounds: Optional[Tuple[int, int, int, int]] = None
+        self._restored: bool = False
+        self._last_used: Dict[Tuple[int, int], int] = {}
+        self._clock: int = 0
+        self._focus: Tuple[int, int] = (0, 0)
+        # Расширяющиеся чанки, еще не прочитанные из файла мира
+        self._pending: List[Tuple[int, int]] = []
+        self._world_file: Optional[WorldFile] = None
+        self.instrumentation: Optional[Instrumentation] = None
+        self.expand_cursor: Optional[Tuple[int, int]] = None
+        self._chunk_interrupted: bool = False
+        # Проход чанка, прерванный бюджетом: (ключ, новые линии прохода, их индекс, их массив отрезков
+        # для режима "batch"); линии попадут в чанки, когда проход чанка завершится
+        self._interrupted_pass: Optional[tuple] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_workers: int = 0
+        self._ray_rng: Optional[np.random.Generator] = None
+        self.faces: Optional[HalfEdgeMesh] = None
+        # Число ребер каждого чанка, уже переданных в faces, их полурёбра в faces и ячейки по чанкам
+        self._face_edges: Dict[Tuple[int, int], int] = {}
+        self._mesh_edges: Dict[Tuple[int, int], List[int]] = {}
+        self._cell_chunks: Dict[int, Tuple[int, int]] = {}
+        self._chunk_cells: Dict[Tuple[int, int], Dict[int, None]] = {}
+        self.lod_enabled: bool = False
+        # Версии мира (см. snapshot) и состояния чанков последней снятой или восстановленной версии
+        self._versions: Dict[int, WorldVersion] = {}
+        self._next_version: int = 0
+        self._last_states: Dict[Tuple[int, int], ChunkState] = {}
 
     def get_chunk_key_for_point(self, point: CellPoint) -> Tuple[int, int]:
         """
@@ -69,18 +169,394 @@ class ChunkManager:
             key: ключ чанка (i, j).
         """
         if key not in self.chunks:
-            x = self.origin[0] + key[0] * self.chunk_width
-            y = self.origin[1] + key[1] * self.chunk_height
-            self.chunks[key] = Chunk(x, y, self.chunk_width, self.chunk_height, need_expand=True, grid_pos=key)
-        else:
-            self.chunks[key].need_expand = True
+            if key in self.evicted:
+                self._restore_chunk(key)
+            else:
+                self.chunks[key] = self._create_chunk(key, need_expand=True)
+        self.chunks[key].need_expand = True
 
         # Создаем соседние чанки как незагруженные, если их еще нет
         for nkey in self.get_neighbor_keys(key):
             if nkey not in self.chunks:
-                x = self.origin[0] + nkey[0] * self.chunk_width
-                y = self.origin[1] + nkey[1] * self.chunk_height
-                self.chunks[nkey] = Chunk(x, y, self.chunk_width, self.chunk_height, need_expand=False, grid_pos=nkey)
+                if nkey in self.evicted:
+                    self._restore_chunk(nkey)
+                else:
+                    self.chunks[nkey] = self._create_chunk(nkey, need_expand=False)
+
+        self._focus = key
+        self._touch([key] + self.get_neighbor_keys(key))
+        self._enforce_memory_cap()
+
+    def _create_chunk(self, key: Tuple[int, int], need_expand: bool) -> Chunk:
+        """
+        Создает чанк с ключом key; ссылки на общие вершины в его геометрии разрешаются через менеджер.
+        """
+        x = self.origin[0] + key[0] * self.chunk_width
+        y = self.origin[1] + key[1] * self.chunk_height
+        chunk = Chunk(x, y, self.chunk_width, self.chunk_height, need_expand=need_expand, grid_pos=key)
+        chunk.geometry.resolver = self._geometry_for_key
+        if key not in self._creation_order:
+            self._creation_order[key] = self._creation_count
+            self._creation_count += 1
+        self._extend_key_bounds(key[0], key[1], key[0], key[1])
+        return chunk
+
+    def _extend_key_bounds(self, min_i: int, min_j: int, max_i: int, max_j: int) -> None:
+        bounds = self._key_bounds
+        if bounds is not None:
+            min_i, min_j = min(min_i, bounds[0]), min(min_j, bounds[1])
+            max_i, max_j = max(max_i, bounds[2]), max(max_j, bounds[3])
+        self._key_bounds = (min_i, min_j, max_i, max_j)
+
+    def _geometry_for_key(self, key: Tuple[int, int]) -> Union[ChunkGeometry, EvictedChunk, StoredChunk, None]:
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            return chunk.geometry
+        # Флаги has_emitted вытесненного чанка остаются доступны через его запись; запись из файла
+        # при этом заводит их копию в памяти
+        record = self.evicted.get(key)
+        if record is not None and key not in self._records:
+            self._track_record(key, record)
+        return record
+
+    def emission_rng(self, point: CellPoint, key: Optional[Tuple[int, int]] = None) -> Any:
+        """
+        Возвращает источник случайных чисел для испускания лучей из point в чанке key
+        (по умолчанию – в чанке, куда попадает точка). При заданном seed это новый random.Random,
+        однозначно определяемый (seed, key, point), поэтому лучи точки не зависят от порядка
+        расширения других чанков и от вытеснения; без seed – глобальный модуль random.
+        Усечение лучей зависит от линий, уже существующих к моменту испускания, поэтому мир
+        воспроизводится при той же последовательности вызовов. Вызовы с бюджетом max_steps
+        и time_budget_ms, продолжающие прерванный проход (см. expand_cursor), дают тот же мир,
+        что и один проход без бюджета, если между ними мир не меняется (load_chunk и т. п.).
+        """
+        if self.seed is None:
+            return random
+        if key is None:
+            key = self.get_chunk_key_for_point(point)
+        return random.Random(f"{self.seed}:{key[0]}:{key[1]}:{point.x}:{point.y}")
+
+    def emission_uniforms(self, points: List[Tuple[int, int]], key: Tuple[int, int], shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        Пакетный аналог emission_rng: для каждой из точек points чанка key возвращает массив shape
+        случайных чисел из [0, 1). При заданном seed числа точки однозначно определяются
+        (seed, key, точка) – см. hashed_uniforms; без seed берутся из общего numpy.random.Generator.
+
+        Returns:
+            np.ndarray: массив (len(points),) + shape float64.
+        """
+        if self.seed is None:
+            if self._ray_rng is None:
+                self._ray_rng = np.random.default_rng()
+            return self._ray_rng.random((len(points),) + tuple(shape))
+        return hashed_uniforms(self.seed, key, points, shape)
+
+    # --- Параметры лучей ---
+
+    def configure_rays(self, child_count: Optional[int] = None, min_length: Optional[float] = None,
+                       max_length: Optional[float] = None, max_deviation: Optional[float] = None) -> None:
+        """
+        Задает параметры дочерних лучей этого менеджера (None – оставить текущее значение).
+
+        Аргументы:
+            child_count: число дочерних лучей каждой точки фронтира.
+            min_length, max_length: диапазон длин дочерних лучей.
+            max_deviation: наибольшее отклонение луча от направления родительской линии в радианах.
+        """
+        child_count = self.child_count if child_count is None else child_count
+        min_length = self.child_min_length if min_length is None else min_length
+        max_length = self.child_max_length if max_length is None else max_length
+        max_deviation = self.child_max_deviation if max_deviation is None else max_deviation
+        if child_count < 1:
+            raise ValueError("child_count must be at least 1")
+        if not 0 < min_length <= max_length:
+            raise ValueError("Ray lengths must satisfy 0 < min_length <= max_length")
+        if max_deviation < 0:
+            raise ValueError("max_deviation must not be negative")
+        self.child_count = child_count
+        self.child_min_length = min_length
+        self.child_max_length = max_length
+        self.child_max_deviation = max_deviation
+
+    def ray_parameters(self) -> Dict[str, Any]:
+        """
+        Возвращает параметры дочерних лучей в виде аргументов configure_rays.
+        """
+        return {"child_count": self.child_count, "min_length": self.child_min_length,
+                "max_length": self.child_max_length, "max_deviation": self.child_max_deviation}
+
+    # --- Вытеснение чанков ---
+
+    def _touch(self, keys: List[Tuple[int, int]]) -> None:
+        self._clock += 1
+        for key in keys:
+            self._last_used[key] = self._clock
+
+    def resident_bytes(self) -> int:
+        """
+        Возвращает приблизительный объём памяти чанков, находящихся в памяти.
+        """
+        return sum(chunk.nbytes() for chunk in self.chunks.values())
+
+    def evicted_bytes(self) -> int:
+        """
+        Возвращает приблизительный объём памяти записей чанков вне памяти.
+        """
+        return sum(record.nbytes() for record in self.evicted.values())
+
+    def evict_chunk(self, key: Tuple[int, int]) -> None:
+        """
+        Вытесняет чанк key в сжатую запись. Чанк восстанавливается без потерь при load_chunk,
+        get_chunk_for_point или загрузке соседа.
+
+        Вытеснять можно только чанки, которые не расширяются и не соседствуют с расширяющимися
+        (need_expand с непустым фронтиром): иначе рост структуры пойдет без их линий.
+        """
+        if key in self._protected_keys():
+            raise ValueError(f"Chunk {key} is expanding or next to an expanding chunk")
+        self._evict(key)
+        self._enforce_memory_cap()
+
+    def _evict(self, key: Tuple[int, int]) -> None:
+        record = EvictedChunk.from_chunk(self.chunks.pop(key))
+        self.evicted[key] = record
+        self._track_record(key, record)
+        self._drop_faces(key)
+
+    def _track_record(self, key: Tuple[int, int], record: Union[EvictedChunk, StoredChunk]) -> None:
+        # Записи учитываются в max_resident_bytes от старых к новым (см. _spill_records)
+        if self.max_resident_bytes is not None:
+            self._records.pop(key, None)
+            self._records[key] = record
+
+    def unload_chunks(self, keys: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """
+        Выгружает чанки keys: снимает с них need_expand (их фронтир сохраняется и продолжит расти
+        при следующем load_chunk) и вытесняет в сжатые записи те из них, которые не соседствуют
+        с расширяющимися чанками. Остальные вытесняются при следующем вызове, когда их соседи
+        тоже будут выгружены.
+
+        Returns:
+            List[Tuple[int, int]]: ключи вытесненных чанков.
+        """
+        self._finish_interrupted_pass()
+        for key in keys:
+            # Чанк, уже вытесненный по max_resident_bytes, тоже не должен расти после восстановления
+            if key in self.evicted:
+                self.evicted[key].need_expand = False
+        keys = [key for key in keys if key in self.chunks]
+        for key in keys:
+            self.chunks[key].need_expand = False
+        protected = self._protected_keys()
+        evicted = []
+        for key in keys:
+            if key not in protected:
+                self._evict(key)
+                evicted.append(key)
+        self._enforce_memory_cap()
+        return evicted
+
+    def discard_chunks(self, keys: List[Tuple[int, int]]) -> None:
+        """
+        Удаляет чанки keys из мира без сохранения (например, после записи на диск).
+        Линии, которые позже начнутся в удаленном чанке, отбрасываются, как и линии вне всех чанков,
+        а копии его вершин в соседних чанках дальше используют свои локальные флаги has_emitted.
+        """
+        self._finish_interrupted_pass()
+        for key in keys:
+            self.chunks.pop(key, None)
+            self.evicted.pop(key, None)
+            self._records.pop(key, None)
+            self._last_used.pop(key, None)
+            self._creation_order.pop(key, None)
+            self._drop_faces(key)
+
+    def _restore_chunk(self, key: Tuple[int, int]) -> Chunk:
+        record = self.evicted.pop(key)
+        self._records.pop(key, None)
+        chunk = self._create_chunk(key, need_expand=record.need_expand)
+        record.restore_into(chunk)
+        self.chunks[key] = chunk
+        self._restored = True
+        return chunk
+
+    def _materialize_pending(self) -> None:
+        """
+        Читает из файла мира расширяющиеся чанки и их соседей перед шагом расширения.
+        """
+        for key in self._pending:
+            for k in [key] + self.get_neighbor_keys(key):
+                if k in self.evicted:
+                    self._restore_chunk(k)
+        self._pending = []
+
+    def _protected_keys(self) -> set:
+        protected = set()
+        for key, chunk in self.chunks.items():
+            if chunk.need_expand and chunk.frontier:
+                protected.add(key)
+                protected.update(self.get_neighbor_keys(key))
+        return protected
+
+    def _enforce_memory_cap(self) -> None:
+        """
+        Вытесняет чанки, пока объём чанков в памяти превышает max_resident_bytes: сначала давно
+        не использованные, среди них – самые удаленные от последнего загруженного чанка. Затем,
+        если вместе с записями вне памяти объём все еще больше, выносит самые старые записи
+        во временный файл.
+        """
+        if self.max_resident_bytes is None:
+            return
+        sizes = {key: chunk.nbytes() for key, chunk in self.chunks.items()}
+        total = sum(sizes.values())
+        if total > self.max_resident_bytes:
+            total = self._evict_resident(sizes, total)
+        excess = total + self._record_bytes() - self.max_resident_bytes
+        if excess > 0:
+            self._spill_records(excess)
+
+    def _evict_resident(self, sizes: Dict[Tuple[int, int], int], total: int) -> int:
+        """
+        Вытесняет незащищенные чанки в порядке _enforce_memory_cap, пока их объём больше
+        max_resident_bytes, и возвращает оставшийся объём.
+        """
+        # Последний загруженный чанк остается в памяти, даже пустой: вызывающий load_chunk продолжает с ним работать
+        protected = self._protected_keys() | {self._focus}
+        fi, fj = self._focus
+        candidates = sorted((key for key in self.chunks if key not in protected),
+                            key=lambda k: (self._last_used.get(k, 0), -max(abs(k[0] - fi), abs(k[1] - fj))))
+        for key in candidates:
+            if total <= self.max_resident_bytes:
+                break
+            self._evict(key)
+            total -= sizes[key]
+        return total
+
+    def _record_bytes(self) -> int:
+        """
+        Возвращает объём записей вне памяти, которые держат данные в памяти, и забывает остальные:
+        запись из файла снова попадет в _records, когда _geometry_for_key заведет копию ее флагов.
+        """
+        total = 0
+        for key, record in list(self._records.items()):
+            size = record.nbytes() if self.evicted.get(key) is record else 0
+            if size:
+                total += size
+            else:
+                del self._records[key]
+        return total
+
+    def _spill_records(self, excess: int) -> None:
+        """
+        Выносит самые старые записи из памяти, пока не освободится excess байт: запись из файла
+        с неизмененными флагами просто отбрасывает их копию, остальные дописываются в SpillFile
+        и заменяются записями StoredChunk на его строки.
+        """
+        for key, record in list(self._records.items()):
+            if excess <= 0:
+                break
+            excess -= record.nbytes()
+            del self._records[key]
+            if isinstance(record, StoredChunk) and record.release_emitted():
+                continue
+            if self._spill is None:
+                self._spill = SpillFile()
+            parts = record.parts()
+            row = self._spill.append(parts, record.emitted)
+            self.evicted[key] = StoredChunk(key, record.need_expand, len(parts.frontier) > 0, self._spill, row)
+
+    # --- Сохранение мира ---
+
+    def save(self, path: str) -> None:
+        """
+        Сохраняет все чанки (в памяти, вытесненные и еще не прочитанные) в файл мира path
+        в порядке их создания. Формат описан в chunk_store.
+
+        Чанки пишутся в файл по одному; еще не прочитанные из файла копируются без разбора.
+        Если path – файл, из которого мир открыт, его отображение освобождается до замены файла,
+        а записи чанков (в том числе в версиях, см. snapshot) переносятся на строки нового файла.
+        """
+        self._finish_interrupted_pass()
+        keys = sorted(list(self.chunks) + list(self.evicted), key=self._creation_order.__getitem__)
+        world = self._world_file
+        replaced = world is not None and os.path.exists(path) and os.path.samefile(world.path, path)
+        # Строки старого файла, скопированные в новый без изменений: строка -> новая строка
+        copied = {}
+
+        def records():
+            for row, key in enumerate(keys):
+                chunk = self.chunks.get(key)
+                if chunk is not None:
+                    yield key, chunk.need_expand, (chunk_parts(chunk), chunk.geometry.emitted)
+                    continue
+                record = self.evicted[key]
+                if isinstance(record, StoredChunk):
+                    if replaced and record.row_in(world) is not None:
+                        copied[record.row_in(world)] = row
+                    yield key, record.need_expand, record
+                else:
+                    yield key, record.need_expand, (record.parts(), record.emitted)
+
+        moved = {}
+
+        stored = []
+
+        def release():
+            # Версии могут ссылаться на строки, которых в новом файле нет: они переносятся в SpillFile
+            stored.extend(self._stored_records(world))
+            for record in stored:
+                old = record.row_in(world)
+                if old not in copied and old not in moved:
+                    if self._spill is None:
+                        self._spill = SpillFile()
+                    moved[old] = self._spill.append_raw(*world.raw(old))
+            world.close()
+
+        write_world(path, self.origin, self.chunk_width, self.chunk_height, self.seed, records(), len(keys),
+                    release if replaced else None)
+        if replaced:
+            self._world_file = WorldFile(path)
+            for record in stored:
+                old = record.row_in(world)
+                if old in copied:
+                    record.move(self._world_file, copied[old])
+                else:
+                    record.move(self._spill, moved[old])
+
+    def _stored_records(self, file: WorldFile) -> List[StoredChunk]:
+        """
+        Возвращает записи StoredChunk строк file в evicted и в версиях мира.
+        """
+        sources = list(self.evicted.values())
+        for version in self._versions.values():
+            sources.extend(state.source for state in version.states.values())
+        sources.extend(state.source for state in self._last_states.values())
+        stored = {id(record): record for record in sources
+                  if isinstance(record, StoredChunk) and record.row_in(file) is not None}
+        return list(stored.values())
+
+    @classmethod
+    def open(cls, path: str, max_resident_bytes: Optional[int] = None) -> "ChunkManager":
+        """
+        Открывает мир, сохраненный save. Файл отображается в память, и читаются только заголовки
+        чанков; сам чанк материализуется при первом обращении (load_chunk, get_chunk_for_point,
+        разрешение ссылки на общую вершину) или перед expand_structure, если он расширяется.
+        """
+        world = WorldFile(path)
+        manager = cls(world.origin, world.chunk_width, world.chunk_height, seed=world.seed,
+                      max_resident_bytes=max_resident_bytes)
+        records = world.records()
+        manager.evicted = {record.key: record for record in records}
+        manager._creation_order = {record.key: order for order, record in enumerate(records)}
+        manager._creation_count = len(records)
+        manager._restored = True
+        manager._pending = [record.key for record in records if record.active]
+        manager._world_file = world
+        if records:
+            directory = world.directory
+            manager._extend_key_bounds(int(directory["i"].min()), int(directory["j"].min()),
+                                       int(directory["i"].max()), int(directory["j"].max()))
+        return manager
 
     def get_chunk_for_point(self, point: CellPoint) -> Any:
         """
@@ -93,6 +569,8 @@ class ChunkManager:
             Chunk или None: чанк, если найден, иначе None.
         """
         key = self.get_chunk_key_for_point(point)
+        if key in self.evicted:
+            self._restore_chunk(key)
         return self.chunks.get(key, None)
 
     def update_loaded_chunks(self) -> None:
@@ -112,54 +590,1246 @@ class ChunkManager:
         """
         return [c for c in self.chunks.values() if c.loaded]
 
-    def expand_structure(self, connection_threshold=300):
-        for chunk in self.chunks.values():
-            if not chunk.need_expand:
+    @staticmethod
+    def _snap_to_line(p_end: CellPoint, target: CellPoint, line: CellLine) -> Optional[CellPoint]:
+        """
+        Если луч (p_end, target) пересекает line, возвращает ближайший к точке пересечения конец line,
+        иначе None.
+        """
+        inter = line_intersection(p_end, target, line.start, line.end)
+        if inter is None:
+            return None
+        return line.start if distance(inter, line.start) < distance(inter, line.end) else line.end
+
+    @classmethod
+    def _truncate_ray(cls, p_end: CellPoint, target: CellPoint, lines: List[CellLine], index: SegmentGrid,
+                      use_index: bool = True, tally: Optional[List[int]] = None, after: int = -1) -> CellPoint:
+        """
+        Последовательно проверяет луч (p_end, target) на пересечение с линиями lines.
+        При каждом пересечении конец луча заменяется ближайшим к точке пересечения концом
+        задетой линии, и проверка продолжается со следующей линии уже для нового луча.
+
+        Аргументы:
+            index: пространственный индекс тех же линий (идентификатор отрезка = позиция в lines).
+            use_index: проверять только линии, чьи ограничивающие прямоугольники пересекаются
+                с текущим лучом. Остальные линии не могут его пересечь, поэтому результат
+                совпадает с полным перебором (use_index=False).
+            tally: если задан, к tally[0] прибавляется число проверок пересечения, к tally[1] – число попаданий.
+            after: проверять только линии с позицией больше after (линии до нее заведомо
+                не пересекают луч, см. _indexed_first_hits).
+
+        Returns:
+            CellPoint: итоговый конец луча.
+        """
+        if not use_index:
+            hits = 0
+            for line in lines:
+                snapped = cls._snap_to_line(p_end, target, line)
+                if snapped is not None:
+                    target = snapped
+                    hits += 1
+            if tally is not None:
+                tally[0] += len(lines)
+                tally[1] += hits
+            return target
+
+        while True:
+            candidates = index.query_segment(p_end.x, p_end.y, target.x, target.y, after=after)
+            for line_id in candidates:
+                snapped = cls._snap_to_line(p_end, target, lines[line_id])
+                if snapped is not None:
+                    if tally is not None:
+                        tally[0] += candidates.index(line_id) + 1
+                        tally[1] += 1
+                    # Луч изменился – перезапрашиваем кандидатов после задетой линии
+                    target = snapped
+                    after = line_id
+                    break
+            else:
+                if tally is not None:
+                    tally[0] += len(candidates)
+                return target
+
+    @classmethod
+    def _truncate_ray_batch(cls, p_end: CellPoint, target: CellPoint, lines: List[CellLine],
+                            segments: np.ndarray, hit: Optional[int] = None,
+                            tally: Optional[List[int]] = None) -> CellPoint:
+        """
+        То же, что _truncate_ray, но каждая проверка луча против оставшихся линий выполняется
+        одним вызовом segment_intersections_batch по массиву segments (N, 4).
+
+        Аргументы:
+            hit: заранее найденная первая задетая линия (позиция в lines) или -1, если исходный луч
+                ничего не задевает; None – искать с начала. Проверки, выполненные при поиске hit,
+                в tally не учитываются.
+            tally: как в _truncate_ray; пакетная проверка луча против k отрезков считается за k проверок.
+        """
+        position = 0
+        while True:
+            if hit is None:
+                _, hit = segment_intersections_batch((p_end.x, p_end.y, target.x, target.y),
+                                                     segments[position:])
+                if tally is not None:
+                    tally[0] += len(segments) - position
+                if hit >= 0:
+                    hit += position
+            if hit < 0:
+                return target
+            snapped = cls._snap_to_line(p_end, target, lines[hit])
+            if snapped is not None:
+                if tally is not None:
+                    tally[1] += 1
+                target = snapped
+            position = hit + 1
+            hit = None
+
+    @staticmethod
+    def _first_hits(emissions: List[Tuple[CellPoint, List[CellPoint]]], segments: np.ndarray,
+                    block_size: int = 1 << 20) -> List[int]:
+        """
+        Для всех лучей прохода (в порядке испускания) одной пакетной операцией находит первый
+        по порядку отрезок из segments, который пересекает исходный луч, или -1.
+        """
+        rays = np.array([(p_end.x, p_end.y, target.x, target.y)
+                         for p_end, targets in emissions for target in targets], dtype=np.float64)
+        if len(rays) == 0:
+            return []
+        # Лучи обрабатываются блоками, чтобы матрица (лучи x отрезки) не росла без ограничений
+        rows = max(1, block_size // max(1, len(segments)))
+        return [int(hit) for start in range(0, len(rays), rows)
+                for hit in segment_intersections_batch(rays[start:start + rows], segments)[1]]
+
+    @staticmethod
+    def _indexed_first_hits(emissions: List[Tuple[CellPoint, List[CellPoint]]],
+                            sources: List[Tuple[Any, SegmentGrid]], offsets: List[int],
+                            segments: np.ndarray) -> Tuple[List[int], List[List[int]]]:
+        """
+        Как _first_hits, но каждый луч проверяется только против кандидатов из индексов sources:
+        кандидаты лучей блока дополняются строкой NaN (последняя строка segments) до общей длины
+        и проверяются одним вызовом segment_intersections_batch.
+
+        Аргументы:
+            offsets: позиция первой линии каждого источника в segments.
+
+        Returns:
+            Tuple[List[int], List[List[int]]]: первая задетая линия каждого луча (позиция в segments
+                или -1) и кандидаты каждого луча по возрастанию позиций.
+        """
+        rays = []
+        candidates = []
+        for p_end, targets in emissions:
+            for target in targets:
+                rays.append((p_end.x, p_end.y, target.x, target.y))
+                found = []
+                for (_, index), offset in zip(sources, offsets):
+                    found.extend(offset + n for n in index.query_segment(p_end.x, p_end.y, target.x, target.y))
+                candidates.append(found)
+        if not rays:
+            return [], []
+        ids = np.full((len(rays), max(map(len, candidates))), len(segments) - 1, dtype=np.intp)
+        for row, found in enumerate(candidates):
+            ids[row, :len(found)] = found
+        _, columns = segment_intersections_batch(np.array(rays, dtype=np.float64), segments[ids])
+        return np.where(columns >= 0, ids[np.arange(len(rays)), columns], -1).tolist(), candidates
+
+    @classmethod
+    def _truncate_candidates(cls, p_end: CellPoint, target: CellPoint, sources: List[Tuple[Any, SegmentGrid]],
+                             offsets: List[int], candidates: List[int], hit: int,
+                             tally: Optional[List[int]] = None) -> CellPoint:
+        """
+        Усекает луч линиями sources, начиная с первой задетой линии hit (см. _indexed_first_hits).
+        Пока конец луча остается в прямоугольнике исходного луча, кандидаты нового луча входят
+        в candidates, поэтому проверяются только они; иначе проверка продолжается через индексы.
+        """
+        if hit < 0:
+            return target
+        min_x, max_x = min(p_end.x, target.x), max(p_end.x, target.x)
+        min_y, max_y = min(p_end.y, target.y), max(p_end.y, target.y)
+        tests = hits = 0
+        for global_id in candidates[candidates.index(hit):]:
+            source = bisect_right(offsets, global_id) - 1
+            local = global_id - offsets[source]
+            tests += 1
+            snapped = cls._snap_to_line(p_end, target, sources[source][0][local])
+            if snapped is None:
+                continue
+            hits += 1
+            target = snapped
+            if not (min_x <= target.x <= max_x and min_y <= target.y <= max_y):
+                if tally is not None:
+                    tally[0] += tests
+                    tally[1] += hits
+                for lines, index in sources[source:]:
+                    target = cls._truncate_ray(p_end, target, lines, index, tally=tally, after=local)
+                    local = -1
+                return target
+        if tally is not None:
+            tally[0] += tests
+            tally[1] += hits
+        return target
+
+    def _pop_emissions(self, chunk: Chunk, count: int) -> List[Tuple[CellPoint, List[CellPoint]]]:
+        """
+        Снимает с фронтира чанка до count точек, которые еще не испускали лучи, помечает их
+        как испустившие и генерирует их дочерние лучи.
+
+        Returns:
+            List[Tuple[CellPoint, List[CellPoint]]]: пары (точка, концы ее лучей) в порядке фронтира.
+        """
+        emissions = []
+        popped = []
+        batch = self.RAY_GENERATION == "batch"
+        geometry = chunk.geometry
+        frontier = chunk.frontier
+        while frontier and len(emissions) + len(popped) < count:
+            edge = frontier.popleft()
+            # Вершина могла испустить лучи через другое ребро, пока ребро ждало в очереди
+            if geometry.end_emitted(edge):
+                continue
+            chunk_line = geometry.line(edge)
+            p_start = chunk_line.start
+            p_end = chunk_line.end
+            p_end.has_emitted = True
+            if batch:
+                popped.append((p_start, p_end))
                 continue
+            base_direction = calculate_angle(p_start.x, p_start.y, p_end.x, p_end.y)
+            target_points = generate_child_rays(p_end, base_direction, child_count=self.child_count,
+                                                min_length=self.child_min_length, max_length=self.child_max_length,
+                                                max_deviation=self.child_max_deviation,
+                                                rng=self.emission_rng(p_end, chunk.grid_pos))
+            emissions.append((p_end, target_points))
+
+        if popped:
+            k = self.child_count
+            starts = [(p_end.x, p_end.y) for _, p_end in popped]
+            directions = np.arctan2([p_end.y - p_start.y for p_start, p_end in popped],
+                                    [p_end.x - p_start.x for p_start, p_end in popped])
+            ends = child_ray_ends(starts, directions, self.emission_uniforms(starts, chunk.grid_pos, (k, 2)),
+                                  min_length=self.child_min_length, max_length=self.child_max_length,
+                                  max_deviation=self.child_max_deviation).tolist()
+            for n, (_, p_end) in enumerate(popped):
+                emissions.append((p_end, [CellPoint(x, y) for x, y in ends[n * k:(n + 1) * k]]))
+        return emissions
+
+    def _expand_chunk(self, chunk: Chunk, truncation: str, max_steps: Optional[int] = None,
+                      deadline: Optional[float] = None, connection_threshold: Optional[float] = None) -> int:
+        """
+        Испускает лучи из точек фронтира чанка, пока фронтир не опустеет или не исчерпается бюджет
+        (max_steps испусканий или момент deadline по time.perf_counter), и добавляет новые линии
+        в чанки их начальных точек. Если задан connection_threshold, конец каждого луча перед
+        усечением сваривается с ближайшей вершиной (см. _weld_target).
+
+        Returns:
+            int: число точек, испустивших лучи.
+        """
+        # Линии чанка и соседних чанков с их индексами, в порядке обхода соседей
+        neighbor_keys = self.get_neighbor_keys(chunk.grid_pos)
+        self._touch([chunk.grid_pos] + neighbor_keys)
+        sources = [(chunk.lines, chunk.index)]
+        for neighbor_key in neighbor_keys:
+            if neighbor_key in self.chunks:
+                neighbor_chunk = self.chunks[neighbor_key]
+                sources.append((neighbor_chunk.lines, neighbor_chunk.index))
+
+        stats = None if self.instrumentation is None else self.instrumentation.current
+        interrupted = self._interrupted_pass
+        if interrupted is not None and interrupted[0] == chunk.grid_pos:
+            # Продолжение прерванного бюджетом прохода: его линии по-прежнему новые линии прохода
+            _, new_lines, new_index, new_segments = interrupted
+            self._interrupted_pass = None
+        else:
+            self._finish_interrupted_pass()
             new_lines = []
-            for chunk_line in chunk.lines:
-                p_start = chunk_line.start
-                p_end = chunk_line.end
-                if p_end.has_emitted:
-                    continue
-                p_end.has_emitted = True
-                base_direction = calculate_angle(p_start.x, p_start.y, p_end.x, p_end.y)
-                target_points = generate_child_rays(p_end, base_direction, child_count=3, min_length=40, max_length=60,
-                                           max_deviation=math.radians(90))
-                for i in range(len(target_points)):
-                    for line in chunk.lines:
-                        inter = line_intersection(p_end, target_points[i], line.start, line.end)
-                        if inter is not None:
-                            target_points[i] = line.start if distance(inter, line.start) < \
-                                                  distance(inter, line.end) else line.end
-                            # target_points[i].has_emitted = True
-
-                    neighbor_keys = self.get_neighbor_keys(chunk.grid_pos)
-                    for neighbor_key in neighbor_keys:
-                        if neighbor_key in self.chunks:
-                            neighbor_chunk = self.chunks[neighbor_key]
-                            for line in neighbor_chunk.lines:
-                                inter = line_intersection(p_end, target_points[i], line.start, line.end)
-                                if inter is not None:
-                                    target_points[i] = line.start if distance(inter, line.start) < \
-                                                          distance(inter, line.end) else line.end
-                                    # target_points[i].has_emitted = True
-
-                    for line in new_lines:
-                        inter = line_intersection(p_end, target_points[i], line.start, line.end)
-                        if inter is not None:
-                            target_points[i] = line.start if distance(inter, line.start) < \
-                                                  distance(inter, line.end) else line.end
-                            # target_points[i].has_emitted = True
-
-                    new_line = CellLine(p_end, target_points[i])
-                    new_lines.append(new_line)
-
-            for line in new_lines:
-                target_chunk = self.get_chunk_for_point(line.start)
-                if target_chunk is not None:
-                    target_chunk.add_line(line)
+            new_index = SegmentGrid()
+            new_segments = None
+        static_lines = static_segments = first_hits = ray_candidates = offsets = None
+        if truncation == "index":
+            # Первое пересечение лучей блока с линиями чанка и соседей ищется одной пакетной
+            # операцией по кандидатам из индексов; скалярно проверяются только линии после него
+            offsets = []
+            parts = []
+            for lines, _ in sources:
+                offsets.append(sum(map(len, parts)))
+                parts.append(lines.geometry.segments())
+            parts.append(np.full((1, 4), np.nan))
+            static_segments = np.concatenate(parts)
+            block = self.RAY_BLOCK
+        elif truncation == "batch":
+            # Линии чанка и соседей не меняются до конца прохода, а лучи генерируются блоками заранее:
+            # их направления и длины не зависят от результатов усечения.
+            static_lines = [line for lines, _ in sources for line in lines]
+            static_segments = np.concatenate([lines.geometry.segments() for lines, _ in sources])
+            if new_segments is None:
+                new_segments = np.empty((self.child_count * len(chunk.frontier), 4), dtype=np.float64)
+            block = self.BATCH_BLOCK
+        elif self.RAY_GENERATION == "batch":
+            block = self.RAY_BLOCK
+        else:
+            block = 1
+
+        steps = 0
+        while chunk.frontier:
+            count = block if max_steps is None else min(block, max_steps - steps)
+            if count <= 0:
+                break
+            if stats is not None:
+                started = time.perf_counter()
+            emissions = self._pop_emissions(chunk, count)
+            steps += len(emissions)
+            if stats is not None:
+                stats.phase_seconds["generate"] += time.perf_counter() - started
+                started = time.perf_counter()
+            if truncation == "batch":
+                first_hits = iter(self._first_hits(emissions, static_segments))
+                if stats is not None:
+                    stats.phase_seconds["chunk_lines"] += time.perf_counter() - started
+                    stats.tallies["chunk_lines"][0] += \
+                        len(static_segments) * sum(len(targets) for _, targets in emissions)
+            elif truncation == "index":
+                hits, candidates = self._indexed_first_hits(emissions, sources, offsets, static_segments)
+                first_hits = iter(hits)
+                ray_candidates = iter(candidates)
+                if stats is not None:
+                    stats.phase_seconds["chunk_lines"] += time.perf_counter() - started
+                    stats.tallies["chunk_lines"][0] += sum(map(len, candidates))
+
+            for p_end, target_points in emissions:
+                excluded = None
+                for target in target_points:
+                    hit = None if first_hits is None else next(first_hits)
+                    found = None if ray_candidates is None else next(ray_candidates)
+                    if connection_threshold is not None:
+                        if excluded is None:
+                            excluded = self._weld_exclusions(p_end, sources, new_lines, new_index)
+                        if stats is not None:
+                            started = time.perf_counter()
+                        welded = self._weld_target(target, connection_threshold, sources, new_lines, new_index,
+                                                   excluded)
+                        if stats is not None:
+                            stats.phase_seconds["weld"] += time.perf_counter() - started
+                        if welded is not target:
+                            # Луч изменился – заранее найденное первое пересечение недействительно
+                            target = welded
+                            hit = None
+
+                    if stats is not None:
+                        target = self._truncate_measured(p_end, target, truncation, sources, new_lines, new_index,
+                                                         static_lines, static_segments, new_segments, offsets, found,
+                                                         hit, stats)
+                    elif truncation == "batch":
+                        target = self._truncate_ray_batch(p_end, target, static_lines, static_segments, hit)
+                        target = self._truncate_ray_batch(p_end, target, new_lines,
+                                                          new_segments[:len(new_lines)])
+                    elif hit is not None:
+                        target = self._truncate_candidates(p_end, target, sources, offsets, found, hit)
+                        target = self._truncate_ray(p_end, target, new_lines, new_index)
+                    else:
+                        for lines, index in sources:
+                            target = self._truncate_ray(p_end, target, lines, index, truncation == "index")
+                        target = self._truncate_ray(p_end, target, new_lines, new_index, truncation == "index")
+
+                    if excluded is not None:
+                        # При сварке граф не получает повторных линий: луч, пришедший после усечения
+                        # в вершину, уже соединенную с p_end, поглощается
+                        if (target.x, target.y) in excluded:
+                            continue
+                        excluded.add((target.x, target.y))
+                    if truncation == "batch":
+                        new_segments[len(new_lines)] = (p_end.x, p_end.y, target.x, target.y)
+                    new_lines.append(CellLine(p_end, target))
+                    new_index.insert(p_end.x, p_end.y, target.x, target.y)
+
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+        # Фронтир до добавления новых линий: непуст, только если бюджет прервал расширение чанка
+        self._chunk_interrupted = bool(chunk.frontier)
+        if self._chunk_interrupted:
+            # Линии добавятся в чанки после завершения прохода: до тех пор фронтир чанка не растет,
+            # а следующий вызов усекает лучи ими как линиями прохода, поэтому результат не зависит
+            # от того, на сколько вызовов бюджет разбил проход
+            self._interrupted_pass = (chunk.grid_pos, new_lines, new_index, new_segments)
+            return steps
+        if stats is not None:
+            started = time.perf_counter()
+        self._route_lines(new_lines)
+        if stats is not None:
+            stats.phase_seconds["routing"] += time.perf_counter() - started
+        return steps
+
+    def _route_lines(self, lines: List[CellLine]) -> None:
+        """
+        Добавляет линии прохода в чанки их начальных точек; линии вне всех чанков отбрасываются.
+        """
+        for line in lines:
+            target_chunk = self.get_chunk_for_point(line.start)
+            if target_chunk is not None:
+                target_chunk.add_line(line)
+
+    def _finish_interrupted_pass(self) -> None:
+        """
+        Добавляет в чанки линии прохода, прерванного бюджетом. Продолжение прохода (см. expand_cursor)
+        после этого усекает лучи ими как линиями чанков.
+        """
+        if self._interrupted_pass is not None:
+            lines = self._interrupted_pass[1]
+            self._interrupted_pass = None
+            self._route_lines(lines)
+
+    @staticmethod
+    def _weld_exclusions(p_end: CellPoint, sources: List[Tuple[Any, SegmentGrid]],
+                         new_lines: List[CellLine], new_index: SegmentGrid) -> set:
+        """
+        Возвращает координаты вершин, с которыми нельзя сваривать лучи из p_end: саму p_end и вершины,
+        уже соединенные с ней линиями чанка, соседей или этого прохода (повторная линия).
+        """
+        position = (p_end.x, p_end.y)
+        excluded = {position}
+        for segment_id in new_index.query_segment(p_end.x, p_end.y, p_end.x, p_end.y):
+            line = new_lines[segment_id]
+            if (line.start.x, line.start.y) == position:
+                excluded.add((line.end.x, line.end.y))
+            elif (line.end.x, line.end.y) == position:
+                excluded.add((line.start.x, line.start.y))
+        if p_end._geometry is None:
+            return excluded
+        home = p_end._geometry.home_of(p_end._index)
+        for lines, _ in sources:
+            geometry = lines.geometry
+            local = home[1] if geometry.key == home[0] else geometry._linked.get(home)
+            if geometry is p_end._geometry:
+                local = p_end._index
+            if local is None:
+                continue
+            xy = geometry.xy
+            for edge in geometry.incident_edges(local):
+                other = geometry.other_end(edge, local)
+                excluded.add((xy[2 * other], xy[2 * other + 1]))
+        return excluded
+
+    @staticmethod
+    def _weld_target(target: CellPoint, threshold: float, sources: List[Tuple[Any, SegmentGrid]],
+                     new_lines: List[CellLine], new_index: SegmentGrid, excluded: set) -> CellPoint:
+        """
+        Сварка вершин: возвращает вершину, ближайшую к target на расстоянии не больше threshold, –
+        представление вершины чанка или соседа либо конец линии, созданной в этом проходе, – или сам
+        target, если такой нет. Вершины ищутся через пространственные индексы отрезков (каждая вершина –
+        конец отрезка); при равных расстояниях выбирается первая в порядке обхода источников.
+        """
+        tx = target.x
+        ty = target.y
+        limit = threshold * threshold
+        best = target
+        best_distance = None
+        box = (tx - threshold, ty - threshold, tx + threshold, ty + threshold)
+        for lines, index in sources:
+            geometry = lines.geometry
+            xy = geometry.xy
+            edges = geometry.edges
+            for segment_id in index.query_segment(*box):
+                for vertex in (edges[2 * segment_id], edges[2 * segment_id + 1]):
+                    x = xy[2 * vertex]
+                    y = xy[2 * vertex + 1]
+                    d = (x - tx) * (x - tx) + (y - ty) * (y - ty)
+                    if d <= limit and (best_distance is None or d < best_distance) and (x, y) not in excluded:
+                        best = geometry.point(vertex)
+                        best_distance = d
+        for segment_id in new_index.query_segment(*box):
+            line = new_lines[segment_id]
+            for point in (line.start, line.end):
+                d = (point.x - tx) * (point.x - tx) + (point.y - ty) * (point.y - ty)
+                if d <= limit and (best_distance is None or d < best_distance) and (point.x, point.y) not in excluded:
+                    best = point
+                    best_distance = d
+        return best
+
+    def incident_lines(self, point: CellPoint) -> List[CellLine]:
+        """
+        Возвращает все линии, сходящиеся в вершине point (представлении вершины чанка), во всех чанках.
+        Стоимость пропорциональна степени вершины: линии, касающиеся вершины, хранятся в её чанке
+        или соседних, а копия вершины в каждом из них находится по ссылке на дом.
+        """
+        geometry = point._geometry
+        if geometry is None:
+            raise ValueError("Point is not a chunk vertex")
+        home = geometry.home_of(point._index)
+        center = self.get_chunk_key_for_point(point)
+        lines = []
+        for key in [center] + self.get_neighbor_keys(center):
+            if key in self.evicted:
+                self._restore_chunk(key)
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                continue
+            local = home[1] if key == home[0] else chunk.geometry._linked.get(home)
+            if chunk.geometry is geometry and home[0] is None:
+                local = point._index
+            if local is None:
+                continue
+            lines.extend(chunk.geometry.line(edge) for edge in chunk.geometry.incident_edges(local))
+        self._enforce_memory_cap()
+        return lines
+
+    def _truncate_measured(self, p_end: CellPoint, target: CellPoint, truncation: str,
+                           sources: List[Tuple[Any, SegmentGrid]], new_lines: List[CellLine], new_index: SegmentGrid,
+                           static_lines: Optional[List[CellLine]], static_segments: Optional[np.ndarray],
+                           new_segments: Optional[np.ndarray], offsets: Optional[List[int]],
+                           candidates: Optional[List[int]], first_hit: Optional[int], stats: Any) -> CellPoint:
+        """
+        Усекает луч так же, как _expand_chunk, и учитывает время, проверки и попадания по фазам
+        (см. instrumentation.PHASES).
+        """
+        clock = time.perf_counter
+        phases = stats.phase_seconds
+        tallies = stats.tallies
+        end = (target.x, target.y)
+        started = clock()
+        if truncation == "batch":
+            target = self._truncate_ray_batch(p_end, target, static_lines, static_segments, first_hit,
+                                              tallies["chunk_lines"])
+            now = clock()
+            phases["chunk_lines"] += now - started
+            started = now
+            target = self._truncate_ray_batch(p_end, target, new_lines, new_segments[:len(new_lines)],
+                                              tally=tallies["new_lines"])
+        elif first_hit is not None:
+            target = self._truncate_candidates(p_end, target, sources, offsets, candidates, first_hit,
+                                               tallies["chunk_lines"])
+            now = clock()
+            phases["chunk_lines"] += now - started
+            started = now
+            target = self._truncate_ray(p_end, target, new_lines, new_index, tally=tallies["new_lines"])
+        else:
+            use_index = truncation == "index"
+            for position, (lines, index) in enumerate(sources):
+                phase = "own_lines" if position == 0 else "neighbor_lines"
+                target = self._truncate_ray(p_end, target, lines, index, use_index, tallies[phase])
+                now = clock()
+                phases[phase] += now - started
+                started = now
+            target = self._truncate_ray(p_end, target, new_lines, new_index, use_index, tallies["new_lines"])
+        phases["new_lines"] += clock() - started
+        stats.rays += 1
+        if (target.x, target.y) != end:
+            stats.truncated += 1
+        return target
+
+    def expand_structure(self, connection_threshold: Optional[float] = 10, truncation: str = "index",
+                         max_steps: Optional[int] = None, time_budget_ms: Optional[float] = None,
+                         workers: Optional[int] = None) -> int:
+        """
+        Выполняет один шаг роста структуры во всех чанках с need_expand: каждая точка фронтира
+        чанка (конец линии, еще не испускавший лучи) испускает дочерние лучи. Стоимость шага
+        пропорциональна размеру фронтира, а не числу линий.
+
+        Аргументы:
+            connection_threshold: порог сварки вершин: конец луча, оказавшийся не дальше этого расстояния
+                от существующей вершины (или конца линии этого же прохода), заменяется этой вершиной,
+                и луч усекается уже до нее. Так лучи замыкаются на общие вершины, а не создают рядом
+                почти совпадающие. None – без сварки.
+            truncation: способ усечения лучей, результаты всех способов совпадают:
+                "index" – кандидаты отбираются через пространственные индексы чанков; первое
+                    пересечение лучей блока с линиями чанка и соседей находится одним вызовом
+                    segment_intersections_batch по кандидатам каждого луча;
+                "batch" – первое пересечение всех лучей блока с линиями чанка и соседей
+                    находится одним вызовом segment_intersections_batch, дальнейшие проверки
+                    луча – тоже пакетные;
+                "brute" – эталонный полный перебор всех линий.
+            max_steps: максимальное число испусканий за вызов (None – без ограничения).
+            time_budget_ms: ограничение времени вызова в миллисекундах (None – без ограничения).
+                Проверяется после каждого блока испусканий (RAY_BLOCK в режиме "index",
+                BATCH_BLOCK в режиме "batch"; в режиме "brute" – после каждого испускания, а при
+                RAY_GENERATION="batch" – после каждого блока RAY_BLOCK).
+                Необработанные точки остаются во фронтире и испустят лучи при следующем вызове,
+                который продолжит проход с прерванного чанка (см. expand_cursor).
+            workers: если задано, чанки расширяются по цветовым классам (см. _expand_colored)
+                в workers процессах; при workers=1 – последовательно в текущем процессе с тем же
+                результатом. Требует seed, чанки больше удвоенной длины самой длинной линии
+                (существующей в расширяемых чанках или дочерней) плюс connection_threshold
+                и несовместимо с max_steps/time_budget_ms. Без workers
+                чанки мира с seed обходятся в том же порядке цветовых классов, поэтому полный
+                проход дает тот же результат, что и с workers.
+
+        Returns:
+            int: число точек, испустивших лучи.
+        """
+        if truncation not in ("index", "batch", "brute"):
+            raise ValueError(f"Unknown truncation mode: {truncation!r}")
+        if workers is not None:
+            if self.seed is None:
+                raise ValueError("Parallel expansion requires a world seed")
+            if max_steps is not None or time_budget_ms is not None:
+                raise ValueError("max_steps and time_budget_ms are not supported with workers")
+            reach = 2 * max(self._longest_line(), self.child_max_length) + (connection_threshold or 0)
+            if min(self.chunk_width, self.chunk_height) <= reach:
+                # Иначе линия может начаться или пересечь луч вне окрестности 3x3 задачи
+                raise ValueError("Parallel expansion requires chunks larger than twice the maximum line length "
+                                 "plus connection_threshold")
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.begin_call()
+            started = time.perf_counter()
+        if workers is not None:
+            steps = self._expand_colored(truncation, workers, connection_threshold)
+        else:
+            steps = self._expand_serial(truncation, max_steps, time_budget_ms, connection_threshold)
+        if instrumentation is not None:
+            instrumentation.end_call(steps, time.perf_counter() - started)
+        return steps
+
+    def _longest_line(self) -> float:
+        """
+        Возвращает длину самой длинной линии чанков, которые расширит следующий проход.
+        """
+        longest = 0.0
+        for chunk in self.chunks.values():
+            if chunk.need_expand and chunk.frontier:
+                segments = chunk.geometry.segments()
+                if len(segments):
+                    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+                    longest = max(longest, float(lengths.max()))
+        return longest
+
+    def _expand_serial(self, truncation: str, max_steps: Optional[int], time_budget_ms: Optional[float],
+                       connection_threshold: Optional[float] = None) -> int:
+        """
+        Расширяет чанки с need_expand по очереди (см. expand_structure): без seed – в порядке
+        их создания, с seed – в порядке цветовых классов _expand_colored, поэтому результат
+        совпадает с expand_structure(workers=N).
+        """
+        self._materialize_pending()
+        deadline = None if time_budget_ms is None else time.perf_counter() + time_budget_ms / 1000
+        stats = None if self.instrumentation is None else self.instrumentation.current
+
+        chunks = list(self.chunks.values())
+        if self.seed is not None:
+            chunks.sort(key=lambda c: (self.color_of(c.grid_pos), c.grid_pos))
+        elif self._restored:
+            chunks.sort(key=lambda c: self._creation_order[c.grid_pos])
+        # Прерванный бюджетом проход продолжается с того же чанка, чтобы первые чанки
+        # не расширялись снова и снова за счет остальных
+        start = 0
+        if self.expand_cursor is not None:
+            keys = [chunk.grid_pos for chunk in chunks]
+            if self.expand_cursor in keys:
+                start = keys.index(self.expand_cursor)
+        self.expand_cursor = None
+        steps = 0
+        for position in range(start, len(chunks)):
+            chunk = chunks[position]
+            if not chunk.need_expand or not chunk.frontier:
+                continue
+            resumed = self._interrupted_pass is not None and self._interrupted_pass[0] == chunk.grid_pos
+            if self.seed is not None and not resumed:
+                # Как перед копированием окрестности в _expand_colored: локальные копии флагов
+                # has_emitted общих вершин совпадают, и мир побайтно равен параллельному
+                for key in [chunk.grid_pos] + self.get_neighbor_keys(chunk.grid_pos):
+                    if key in self.chunks:
+                        self.chunks[key].geometry.sync_links()
+            if stats is not None:
+                started = time.perf_counter()
+            chunk_steps = self._expand_chunk(chunk, truncation, None if max_steps is None else max_steps - steps,
+                                             deadline, connection_threshold)
+            steps += chunk_steps
+            if stats is not None:
+                stats.add_chunk(chunk.grid_pos, chunk_steps, time.perf_counter() - started)
+            if (max_steps is not None and steps >= max_steps) or \
+                    (deadline is not None and time.perf_counter() >= deadline):
+                if self._chunk_interrupted:
+                    self.expand_cursor = chunk.grid_pos
+                elif position + 1 < len(chunks):
+                    self.expand_cursor = chunks[position + 1].grid_pos
+                break
+        if self.faces is not None:
+            self.update_faces()
+        if self.lod_enabled:
+            self.update_lod()
+        self._enforce_memory_cap()
+        return steps
+
+    # --- Уровни детализации ---
+
+    def enable_lod(self, enabled: bool = True) -> None:
+        """
+        Включает построение LOD: после каждого expand_structure чанки, которые закончили расширение
+        (фронтир пуст) и получили линии с прошлого построения, получают новый Chunk.lod.
+        """
+        self.lod_enabled = enabled
+        if enabled:
+            self.update_lod()
+
+    def update_lod(self) -> None:
+        """
+        Перестраивает устаревший LOD расширяющихся чанков с пустым фронтиром.
+        """
+        for chunk in self.chunks.values():
+            if chunk.need_expand and not chunk.frontier and self._lod_stale(chunk):
+                self._build_lod(chunk)
+
+    @staticmethod
+    def _lod_stale(chunk: Chunk) -> bool:
+        return chunk.lod is None or chunk.lod.edge_count != chunk.geometry.edge_count
+
+    @staticmethod
+    def _build_lod(chunk: Chunk) -> ChunkLOD:
+        # Новый объект вместо изменения старого: снимки для отрисовки могут держать прежний LOD
+        chunk.lod = ChunkLOD(chunk.x, chunk.y, chunk.width, chunk.height, chunk.geometry.segments())
+        return chunk.lod
+
+    def chunk_lod(self, key: Tuple[int, int]) -> Optional[ChunkLOD]:
+        """
+        Возвращает актуальный LOD чанка key, при необходимости строя его (например, для чанка,
+        который не расширяется, или для экспорта); None – такого чанка нет.
+        """
+        if key in self.evicted:
+            self._restore_chunk(key)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            return None
+        return self._build_lod(chunk) if self._lod_stale(chunk) else chunk.lod
+
+    # --- Ячейки ---
+
+    def enable_faces(self, max_cell_edges: int = 256) -> HalfEdgeMesh:
+        """
+        Включает выделение ячеек – ограниченных граней графа линий (см. half_edge.HalfEdgeMesh).
+        Линии чанков в памяти сразу передаются в полурёберную структуру; дальше каждый вызов
+        expand_structure передает в нее только новые линии и обновляет только затронутые ими грани.
+        polygon_membership линий пересчитывается: это число ячеек, в границу которых входит линия.
+
+        В структуре только линии чанков в памяти: линии вытесненного или удаленного чанка
+        удаляются из нее вместе с ячейками, которых они касались, а линии восстановленного чанка
+        добавляются заново. Поэтому память структуры ограничена чанками в памяти, а ячейки
+        на границе вытесненных чанков появляются снова, когда те возвращаются в память.
+
+        Граф линий не всегда планарный: сварка и усечение оставляют редкие пересечения линий
+        вне вершин (десятки на мир из тысяч линий). Ячейки вокруг таких пересечений приблизительны –
+        грани обходятся так, будто пересечения нет.
+
+        Аргументы:
+            max_cell_edges: наибольшее число полурёбер в границе ячейки; более длинные грани
+                (в том числе внешняя граница структуры) ячейками не считаются.
+        """
+        self.faces = HalfEdgeMesh(max_cell_edges)
+        self._face_edges = {}
+        self._mesh_edges = {}
+        self._cell_chunks = {}
+        self._chunk_cells = {}
+        self.update_faces()
+        return self.faces
+
+    def update_faces(self) -> None:
+        """
+        Передает в faces линии, появившиеся в чанках в памяти после прошлого обновления, и обновляет
+        затронутые ими ячейки и polygon_membership. expand_structure вызывает его сам; вручную
+        он нужен, если линии добавлялись в чанки напрямую (Chunk.add_line).
+        """
+        mesh = self.faces
+        counts = self._face_edges
+        for key, chunk in self.chunks.items():
+            geometry = chunk.geometry
+            start = counts.get(key, 0)
+            if start == geometry.edge_count:
+                continue
+            if start == 0:
+                # Счетчики, сохраненные вместе с миром, считаются заново
+                geometry.membership[:] = bytes(len(geometry.membership))
+            xy = geometry.xy
+            edges = geometry.edges
+            mesh_edges = self._mesh_edges.setdefault(key, [])
+            for edge in range(start, geometry.edge_count):
+                a = edges[2 * edge]
+                b = edges[2 * edge + 1]
+                u = mesh.vertex(xy[2 * a], xy[2 * a + 1], geometry.home_of(a))
+                v = mesh.vertex(xy[2 * b], xy[2 * b + 1], geometry.home_of(b))
+                if u != v:
+                    mesh_edges.append(mesh.add_edge(u, v, (key, edge)))
+            counts[key] = geometry.edge_count
+        self._rebuild_faces()
+
+    def _drop_faces(self, key: Tuple[int, int]) -> None:
+        """
+        Удаляет из faces линии чанка key, покинувшего память, и обновляет затронутые ячейки.
+        """
+        self._face_edges.pop(key, None)
+        mesh_edges = self._mesh_edges.pop(key, None)
+        if self.faces is None or not mesh_edges:
+            return
+        for half_edge in mesh_edges:
+            self.faces.remove_edge(half_edge)
+        self._rebuild_faces()
+
+    def _rebuild_faces(self) -> None:
+        mesh = self.faces
+        removed, added = mesh.rebuild()
+        for cell, refs in removed.items():
+            self._add_membership(refs, -1)
+            del self._chunk_cells[self._cell_chunks.pop(cell)][cell]
+        for cell in added:
+            self._add_membership([mesh.edge_refs[edge] for edge in mesh.cell_edges(mesh.cells[cell])], 1)
+            cx, cy = CellPolygon([CellPoint(x, y) for x, y in mesh.cell_xy(cell)]).centroid()
+            key = (int((cx - self.origin[0]) // self.chunk_width), int((cy - self.origin[1]) // self.chunk_height))
+            self._cell_chunks[cell] = key
+            self._chunk_cells.setdefault(key, {})[cell] = None
+
+    def _add_membership(self, refs: List[Tuple[Tuple[int, int], int]], delta: int) -> None:
+        for key, index in refs:
+            chunk = self.chunks.get(key)
+            # Счетчики чанка вне памяти пересчитываются, когда он вернется (см. update_faces)
+            if chunk is None:
+                continue
+            membership = chunk.geometry.membership
+            membership[index] = min(max(membership[index] + delta, 0), 255)
+
+    def chunk_polygons(self, key: Tuple[int, int]) -> List[CellPolygon]:
+        """
+        Возвращает ячейки, центр масс которых лежит в чанке key, в порядке их появления.
+        Вершины ячеек – представления вершин чанков (для чанков вне памяти – свободные точки).
+        Требует enable_faces.
+        """
+        if self.faces is None:
+            raise ValueError("Cell extraction is disabled; call enable_faces() first")
+        self.update_faces()
+        return [self._cell_polygon(cell) for cell in self._chunk_cells.get(key, {})]
+
+    def _cell_polygon(self, cell: int) -> CellPolygon:
+        mesh = self.faces
+        points = []
+        for half_edge in mesh.cells[cell]:
+            vertex = mesh.origin(half_edge)
+            home_key, index = mesh.vertex_refs[vertex]
+            geometry = self._geometry_for_key(home_key)
+            if isinstance(geometry, ChunkGeometry):
+                points.append(geometry.point(index))
+            else:
+                points.append(CellPoint(mesh.xy[2 * vertex], mesh.xy[2 * vertex + 1]))
+        return CellPolygon(points)
 
+    # --- Запросы ---
+
+    def _keys_in_rect(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[Tuple[int, int]]:
+        """
+        Возвращает ключи чанков (в памяти и вытесненных), линии которых могут попасть в прямоугольник:
+        чанков, которые он пересекает, и их соседей (линия хранится в чанке своего начала и выходит
+        за его границы не дальше соседнего чанка).
+        """
+        bounds = self._key_bounds
+        if bounds is None:
+            return []
+        i0 = max(int((min_x - self.origin[0]) // self.chunk_width) - 1, bounds[0])
+        j0 = max(int((min_y - self.origin[1]) // self.chunk_height) - 1, bounds[1])
+        i1 = min(int((max_x - self.origin[0]) // self.chunk_width) + 1, bounds[2])
+        j1 = min(int((max_y - self.origin[1]) // self.chunk_height) + 1, bounds[3])
+        return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)
+                if (i, j) in self.chunks or (i, j) in self.evicted]
+
+    def _chunks_in_rect(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[Chunk]:
+        """
+        Возвращает чанки _keys_in_rect; вытесненные чанки восстанавливаются.
+        """
+        chunks = []
+        for key in self._keys_in_rect(min_x, min_y, max_x, max_y):
+            chunks.append(self.chunks[key] if key in self.chunks else self._restore_chunk(key))
+        return chunks
+
+    def _reach_distance(self, key: Tuple[int, int], x: float, y: float) -> float:
+        """
+        Возвращает нижнюю оценку расстояния от (x, y) до линий чанка key: до охватывающего
+        прямоугольника его индекса для чанка в памяти, до чанка вместе с соседями – для вытесненного.
+        """
+        chunk = self.chunks.get(key)
+        if chunk is not None:
+            if chunk.index.bounds is None:
+                return math.inf
+            left, top, right, bottom = chunk.index.bounds
+        else:
+            left = self.origin[0] + (key[0] - 1) * self.chunk_width
+            top = self.origin[1] + (key[1] - 1) * self.chunk_height
+            right = left + 3 * self.chunk_width
+            bottom = top + 3 * self.chunk_height
+        return math.hypot(max(left - x, 0, x - right), max(top - y, 0, y - bottom))
+
+    def _search_limit(self, x: float, y: float) -> float:
+        # Расстояние от точки до дальнего угла всех чанков вместе с соседями: дальше линий нет
+        min_i, min_j, max_i, max_j = self._key_bounds
+        left = self.origin[0] + (min_i - 1) * self.chunk_width
+        top = self.origin[1] + (min_j - 1) * self.chunk_height
+        right = self.origin[0] + (max_i + 2) * self.chunk_width
+        bottom = self.origin[1] + (max_j + 2) * self.chunk_height
+        return math.hypot(max(x - left, right - x), max(y - top, bottom - y))
+
+    def _nearest(self, x: float, y: float, max_distance: Optional[float], vertices: bool) -> Optional[tuple]:
+        """
+        Ищет ближайшую к (x, y) вершину (vertices=True) или линию, расширяя квадрат поиска вдвое,
+        пока в круге, вписанном в квадрат, не найдется кандидат. Чанки квадрата перебираются
+        по возрастанию _reach_distance, и перебор останавливается на первом чанке, который
+        не может дать ответа ближе уже найденного, – поэтому дальние чанки не просматриваются,
+        а вытесненные не восстанавливаются. Отрезки-кандидаты берутся из пространственных
+        индексов чанков.
+
+        Returns:
+            (квадрат расстояния, чанк, вершина или линия) или None.
+        """
+        if self._key_bounds is None:
+            return None
+        limit = self._search_limit(x, y)
+        radius = self.QUERY_RADIUS
+        while True:
+            if max_distance is not None:
+                radius = min(radius, max_distance)
+            box = (x - radius, y - radius, x + radius, y + radius)
+            best = None
+            for reach, key in sorted((self._reach_distance(key, x, y), key) for key in self._keys_in_rect(*box)):
+                if reach > radius or (best is not None and reach * reach > best[0]):
+                    break
+                chunk = self.chunks[key] if key in self.chunks else self._restore_chunk(key)
+                geometry = chunk.geometry
+                xy = geometry.xy
+                edges = geometry.edges
+                for segment_id in chunk.index.query_segment(*box):
+                    if vertices:
+                        for vertex in (edges[2 * segment_id], edges[2 * segment_id + 1]):
+                            dx = xy[2 * vertex] - x
+                            dy = xy[2 * vertex + 1] - y
+                            d = dx * dx + dy * dy
+                            if best is None or d < best[0]:
+                                best = (d, chunk, vertex)
+                    else:
+                        _, d = closest_point_on_segment(x, y, *geometry.segment(segment_id))
+                        if best is None or d < best[0]:
+                            best = (d, chunk, segment_id)
+            if best is not None and best[0] <= radius * radius:
+                # Чанк ответа вытесняется последним
+                self._touch([best[1].grid_pos])
+                return best
+            if radius >= limit or (max_distance is not None and radius >= max_distance):
+                return None
+            radius *= 2
+
+    def nearest_point(self, x: float, y: float, max_distance: Optional[float] = None) -> Optional[CellPoint]:
+        """
+        Возвращает вершину, ближайшую к точке (x, y) (представление вершины чанка), или None,
+        если вершин нет (или нет ближе max_distance).
+
+        Поиск идет по пространственным индексам чанков в квадрате вокруг точки, который удваивается,
+        пока в нем не найдется ответ; просматриваются только чанки, которые могут содержать вершину
+        ближе уже найденной. Поэтому его стоимость зависит от расстояния до ответа и плотности
+        линий рядом с ним, а не от размера мира. Вытесненные для ответа чанки после запроса
+        снова подчиняются max_resident_bytes.
+        """
+        found = self._nearest(x, y, max_distance, vertices=True)
+        point = None if found is None else found[1].geometry.point(found[2])
+        self._enforce_memory_cap()
+        return point
+
+    def nearest_line(self, x: float, y: float, max_distance: Optional[float] = None) -> Optional[CellLine]:
+        """
+        Возвращает линию, ближайшую к точке (x, y), или None, если линий нет (или нет ближе max_distance).
+        Поиск устроен так же, как в nearest_point.
+        """
+        found = self._nearest(x, y, max_distance, vertices=False)
+        line = None if found is None else found[1].geometry.line(found[2])
+        self._enforce_memory_cap()
+        return line
+
+    def lines_in_rect(self, min_x: float, min_y: float, max_x: float, max_y: float) -> List[CellLine]:
+        """
+        Возвращает линии, у которых есть общие точки с прямоугольником [min_x, max_x] x [min_y, max_y].
+        Кандидаты берутся из пространственных индексов чанков, которые пересекает прямоугольник,
+        и их соседей; после запроса восстановленные чанки снова подчиняются max_resident_bytes.
+        """
+        lines = []
+        for chunk in self._chunks_in_rect(min_x, min_y, max_x, max_y):
+            geometry = chunk.geometry
+            for segment_id in chunk.index.query_segment(min_x, min_y, max_x, max_y):
+                if segment_intersects_rect(*geometry.segment(segment_id), min_x, min_y, max_x, max_y):
+                    lines.append(geometry.line(segment_id))
+        self._enforce_memory_cap()
+        return lines
+
+    def cell_at(self, x: float, y: float) -> Optional[CellPolygon]:
+        """
+        Возвращает ячейку, которой принадлежит точка (x, y), или None, если точка не лежит
+        ни в одной ячейке. Требует enable_faces.
+
+        Отрезок от точки до ближайшей линии не пересекает других линий, поэтому ближайшая линия
+        лежит на границе грани с этой точкой; сторона линии (или угол вершины, если ближайшая
+        точка линии – ее конец) определяет полуребро этой грани.
+        """
+        if self.faces is None:
+            raise ValueError("Cell extraction is disabled; call enable_faces() first")
+        self.update_faces()
+        line = self.nearest_line(x, y)
+        if line is None:
+            return None
+        mesh = self.faces
+        start = mesh.vertex_ids.get((line.start.x, line.start.y))
+        end = mesh.vertex_ids.get((line.end.x, line.end.y))
+        if start is None or end is None:
+            return None
+        t, _ = closest_point_on_segment(x, y, line.start.x, line.start.y, line.end.x, line.end.y)
+        if start == end or t <= 0:
+            half_edge = mesh.corner_half_edge(start, x, y)
+        elif t >= 1:
+            half_edge = mesh.corner_half_edge(end, x, y)
+        else:
+            cross = (line.end.x - line.start.x) * (y - line.start.y) - (line.end.y - line.start.y) * (x - line.start.x)
+            half_edge = mesh.find_half_edge(start, end) if cross >= 0 else mesh.find_half_edge(end, start)
+        if half_edge < 0 or mesh.face_of[half_edge] < 0:
+            return None
+        return self._cell_polygon(mesh.face_of[half_edge])
+
+    # --- Версии ---
+
+    def snapshot(self) -> int:
+        """
+        Запоминает текущее состояние мира и возвращает номер версии.
+
+        Версии копируют только изменившееся: состояние чанка, не изменившегося с прошлой версии
+        (см. ChunkState.matches), берется из нее, поэтому версии разделяют неизмененные чанки,
+        и снимок после шага расширения стоит пропорционально числу чанков, которые этот шаг
+        затронул (load_chunk, expand_structure), а не размеру мира. Производные данные – ячейки
+        и LOD – в версию не входят и перестраиваются при restore.
+        """
+        self._finish_interrupted_pass()
+        previous = self._last_states
+        states = {}
+        for key, chunk in self.chunks.items():
+            state = previous.get(key)
+            states[key] = state if state is not None and state.matches(chunk) else ChunkState.from_chunk(chunk)
+        for key, record in self.evicted.items():
+            state = previous.get(key)
+            states[key] = state if state is not None and state.matches_record(record) \
+                else ChunkState.from_record(record)
+        version = self._next_version
+        self._next_version += 1
+        self._versions[version] = WorldVersion(states, frozenset(self.chunks), dict(self._creation_order),
+                                               self._key_bounds, self.expand_cursor, tuple(self._pending))
+        self._last_states = states
+        return version
+
+    def restore(self, version: int) -> None:
+        """
+        Возвращает мир к версии version (см. snapshot). Чанки, совпадающие с версией, остаются
+        как есть; остальные восстанавливаются из ее состояний, а чанки, которых в ней не было,
+        удаляются. Чанки, которые в версии были вне памяти, возвращаются в evicted.
+        """
+        world = self._versions.get(version)
+        if world is None:
+            raise KeyError(f"Unknown version: {version}")
+        states = world.states
+        for key in [key for key in self.chunks if key not in world.resident]:
+            del self.chunks[key]
+        for key in [key for key in self.evicted if key not in states or key in world.resident]:
+            del self.evicted[key]
+        for key, state in states.items():
+            if key in world.resident:
+                chunk = self.chunks.get(key)
+                if chunk is None or not state.matches(chunk):
+                    chunk = self._create_chunk(key, need_expand=state.need_expand)
+                    state.restore_into(chunk)
+                    self.chunks[key] = chunk
+            else:
+                record = self.evicted.get(key)
+                if record is None or not state.matches_record(record):
+                    record = state.record()
+                    self.evicted[key] = record
+                    self._track_record(key, record)
+
+        self._creation_order = dict(world.creation_order)
+        self._key_bounds = world.key_bounds
+        self.expand_cursor = world.expand_cursor
+        self._chunk_interrupted = False
+        self._interrupted_pass = None
+        self._pending = list(world.pending)
+        # Восстановленные чанки добавлены в конец словаря – расширение идет по порядку создания
+        self._restored = True
+        self._last_used = {key: used for key, used in self._last_used.items() if key in self.chunks}
+        self._touch(list(self.chunks))
+        self._last_states = states
+        if self.faces is not None:
+            self.enable_faces(self.faces.max_cell_edges)
+        if self.lod_enabled:
+            self.update_lod()
+        self._enforce_memory_cap()
+
+    def diff(self, a: int, b: int) -> List[ChunkDelta]:
+        """
+        Возвращает изменения чанков от версии a к версии b – по ChunkDelta на каждый чанк,
+        состояние которого различается. Разделяемые версиями чанки не сравниваются, а выросший
+        чанк передается только новыми вершинами и рёбрами, поэтому поток изменений между
+        соседними версиями компактен; клиент применяет его через chunk_versions.apply_chunk_delta.
+        """
+        for version in (a, b):
+            if version not in self._versions:
+                raise KeyError(f"Unknown version: {version}")
+        old = self._versions[a].states
+        new = self._versions[b].states
+        deltas = []
+        for key in list(old) + [key for key in new if key not in old]:
+            delta = chunk_delta(old.get(key), new.get(key))
+            if delta is not None:
+                deltas.append(delta)
+        return deltas
+
+    def drop_snapshot(self, version: int) -> None:
+        """
+        Забывает версию version; состояния чанков, которые не нужны другим версиям, освобождаются.
+        """
+        del self._versions[version]
+
+    # --- Статистика ---
+
+    def enable_instrumentation(self, callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> Instrumentation:
+        """
+        Включает сбор статистики расширения: время по фазам (instrumentation.PHASES), число проверок
+        пересечений и попаданий, время и число испусканий по чанкам. Если задан callback, после
+        каждого вызова expand_structure он получает статистику этого вызова (как "expansion" в stats()).
+
+        При workers статистика фаз и проверок в процессах пула не собирается – учитываются только
+        время и число испусканий по чанкам.
+        """
+        self.instrumentation = Instrumentation(callback)
+        return self.instrumentation
+
+    def disable_instrumentation(self) -> None:
+        """
+        Выключает сбор статистики; накопленные счетчики сбрасываются.
+        """
+        self.instrumentation = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Возвращает снимок статистики: число линий и размер фронтира каждого чанка в памяти,
+        число вытесненных чанков и объём памяти, а при включенном сборе – накопленные счетчики
+        расширения ("expansion", см. instrumentation.ExpansionCounters.as_dict).
+        """
+        snapshot = {
+            "chunks": {key: {"lines": chunk.geometry.edge_count, "frontier": len(chunk.frontier),
+                             "need_expand": chunk.need_expand}
+                       for key, chunk in self.chunks.items()},
+            "evicted": len(self.evicted),
+            "resident_bytes": self.resident_bytes(),
+            "expansion": None,
+        }
+        if self.instrumentation is not None:
+            snapshot["expansion"] = self.instrumentation.totals.as_dict()
+        return snapshot
+
+    @staticmethod
+    def color_of(key: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        Возвращает цветовой класс чанка в раскраске 3x3. Окрестности (чанк и 8 соседей) двух
+        разных чанков одного цвета не пересекаются.
+        """
+        return key[0] % 3, key[1] % 3
+
+    def _get_executor(self, workers: int) -> ProcessPoolExecutor:
+        if self._executor is None or self._executor_workers != workers:
+            self.close()
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+            self._executor_workers = workers
+        return self._executor
+
+    def close(self) -> None:
+        """
+        Останавливает пул процессов параллельного расширения, если он был создан.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+            self._executor_workers = 0
+
+    def _expand_colored(self, truncation: str, workers: int, connection_threshold: Optional[float] = None) -> int:
+        """
+        Расширяет чанки по цветовым классам 3x3 (см. color_of): чанки одного класса не делят
+        окрестностей, поэтому их можно расширять одновременно. Для каждого чанка окрестность
+        копируется в задачу, задача выполняется в пуле процессов (или в текущем процессе
+        при workers=1), а изменения применяются после завершения всех задач класса в порядке
+        ключей. Случайные числа выводятся из seed, ключа чанка и точки (см. emission_rng),
+        поэтому результат не зависит от числа процессов.
+
+        Окрестность передается массивами чанков (см. chunk_parts). Размер чанков проверяет
+        expand_structure: линии расширения не выходят за окрестность 3x3.
+
+        Returns:
+            int: число точек, испустивших лучи.
+        """
+        self._materialize_pending()
+        self._finish_interrupted_pass()
+        steps = 0
+        for color in [(ci, cj) for ci in range(3) for cj in range(3)]:
+            keys = sorted(key for key, chunk in self.chunks.items()
+                          if chunk.need_expand and chunk.frontier and self.color_of(key) == color)
+            if not keys:
+                continue
+            payloads = []
+            for key in keys:
+                neighborhood_keys = [key] + self.get_neighbor_keys(key)
+                self._touch(neighborhood_keys)
+                neighborhood = []
+                for k in neighborhood_keys:
+                    chunk = self.chunks.get(k)
+                    if chunk is not None:
+                        chunk.geometry.sync_links()
+                        # Только массивы: индексы и списки рёбер вершин задача строит сама
+                        neighborhood.append((k, chunk.need_expand, chunk_parts(chunk), bytes(chunk.geometry.emitted)))
+                payloads.append(pickle.dumps((self.origin, self.chunk_width, self.chunk_height, self.seed,
+                                              self.ray_parameters(), self.RAY_GENERATION, key, neighborhood,
+                                              truncation, connection_threshold)))
+            if workers > 1:
+                results = list(self._get_executor(workers).map(_expand_neighborhood, payloads))
+            else:
+                results = [_expand_neighborhood(payload) for payload in payloads]
+
+            for key, (chunk_steps, deltas, seconds) in zip(keys, results):
+                steps += chunk_steps
+                if self.instrumentation is not None:
+                    self.instrumentation.current.add_chunk(key, chunk_steps, seconds)
+                for delta_key, (geometry_delta, frontier) in deltas.items():
+                    chunk = self.chunks[delta_key]
+                    edge_start = chunk.geometry.edge_count
+                    chunk.geometry.apply_delta(geometry_delta)
+                    chunk.update_index(edge_start)
+                    chunk.frontier.clear()
+                    chunk.frontier.extend(frontier)
+        if self.faces is not None:
+            self.update_faces()
+        if self.lod_enabled:
+            self.update_lod()
+        self._enforce_memory_cap()
+        return steps
 
     def __repr__(self) -> str:
-        return f"ChunkManager(origin={self.origin}, chunk_size=({self.chunk_width}x{self.chunk_height}), total_chunks={len(self.chunks)})"
\ No newline at end of file
+        return f"ChunkManager(origin={self.origin}, chunk_size=({self.chunk_width}x{self.chunk_height}), total_chunks={len(self.chunks)}, evicted={len(self.evicted)})"
+
+
+def _expand_neighborhood(payload: bytes):
+    """
+    Задача параллельного расширения: восстанавливает окрестность чанка из массивов payload
+    (с индексами и списками рёбер вершин), расширяет
+    центральный чанк и возвращает (число испусканий, изменения по каждому чанку окрестности).
+    Изменения чанка – (дельта геометрии, новый фронтир). Третий элемент результата – время
+    расширения центрального чанка в секундах.
+    """
+    origin, chunk_width, chunk_height, seed, ray_parameters, ray_generation, key, neighborhood, truncation, \
+        connection_threshold = pickle.loads(payload)
+    manager = ChunkManager(origin, chunk_width, chunk_height, seed=seed)
+    manager.configure_rays(**ray_parameters)
+    manager.RAY_GENERATION = ray_generation
+    marks = {}
+    for chunk_key, need_expand, parts, emitted in neighborhood:
+        chunk = manager._create_chunk(chunk_key, need_expand)
+        fill_chunk(chunk, parts, bytearray(emitted), need_expand)
+        manager.chunks[chunk_key] = chunk
+        marks[chunk_key] = (chunk.geometry.vertex_count, chunk.geometry.edge_count)
+
+    center = manager.chunks[key]
+    started = time.perf_counter()
+    steps = manager._expand_chunk(center, truncation, connection_threshold=connection_threshold)
+    seconds = time.perf_counter() - started
+    deltas = {}
+    for chunk_key, chunk in manager.chunks.items():
+        deltas[chunk_key] = (chunk.geometry.export_delta(*marks[chunk_key]), list(chunk.frontier))
+    return steps, deltas, seconds
@@ -0,0 +1,406 @@
+# chunk_store.py
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+from chunk import Chunk
+from chunk_cache import ChunkParts, fill_chunk
+
+# Формат файла мира (все числа little-endian):
+#   заголовок файла FILE_HEADER;
+#   таблица заголовков чанков CHUNK_HEADER в порядке создания чанков;
+#   данные чанков: xy (int32, по два на вершину), edges (int32, по два на ребро),
+#   membership (байт на ребро), emitted (битовое поле вершин),
+#   links (int32, по четыре на общую вершину: индекс, i дома, j дома, индекс в доме),
+#   frontier (int32 на ребро фронтира). Данные каждого чанка выровнены по 8 байтам.
+MAGIC = b"CELLWRLD"
+FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<8sIIiiiiqQ")
+FLAG_HAS_SEED = 1
+
+CHUNK_HEADER = np.dtype([
+    ("i", "<i4"), ("j", "<i4"),
+    ("x", "<i4"), ("y", "<i4"), ("width", "<i4"), ("height", "<i4"),
+    ("flags", "<u4"),
+    ("vertices", "<u4"), ("edges", "<u4"), ("links", "<u4"), ("frontier", "<u4"),
+    ("reserved", "<u4"),
+    ("offset", "<u8"),
+])
+CHUNK_NEED_EXPAND = 1
+
+
+def _swap_ints(data: bytes) -> bytes:
+    # Файл хранит int32 в little-endian; на big-endian платформах порядок байтов меняется
+    if sys.byteorder == "little":
+        return data
+    values = array("i")
+    values.frombytes(data)
+    values.byteswap()
+    return values.tobytes()
+
+
+def _part_sizes(vertices: int, edges: int, links: int, frontier: int) -> List[int]:
+    # Размеры в порядке записи: xy, edges, membership, emitted, links, frontier
+    return [8 * vertices, 8 * edges, edges, (vertices + 7) >> 3, 16 * links, 4 * frontier]
+
+
+# Число вершин, рёбер, общих вершин и длина фронтира чанка – размеры его данных в файле
+Counts = Tuple[int, int, int, int]
+
+
+def _chunk_blob(parts: ChunkParts, emitted: bytes) -> Tuple[Counts, bytes]:
+    # Данные чанка в формате файла мира, выровненные по 8 байтам
+    blob = b"".join((_swap_ints(parts.xy), _swap_ints(parts.edges), parts.membership, bytes(emitted),
+                     _swap_ints(parts.links), _swap_ints(parts.frontier)))
+    counts = (len(parts.xy) // 8, len(parts.edges) // 8, len(parts.links) // 16, len(parts.frontier) // 4)
+    return counts, blob + bytes(-len(blob) % 8)
+
+
+def _with_emitted(counts: Counts, blob: bytes, emitted: bytes) -> bytes:
+    # Данные чанка с другим битовым полем has_emitted
+    start = sum(_part_sizes(counts[0], counts[1], 0, 0)[:3])
+    return blob[:start] + bytes(emitted) + blob[start + len(emitted):]
+
+
+def _split_blob(data: bytes, sizes: List[int]) -> Tuple[ChunkParts, bytearray]:
+    # Обратное к _chunk_blob: массивы чанка и копия битового поля has_emitted
+    offset = 0
+    parts = []
+    for size in sizes:
+        parts.append(data[offset:offset + size])
+        offset += size
+    xy, edges, membership, emitted, links, frontier = parts
+    return ChunkParts(_swap_ints(xy), _swap_ints(edges), membership, _swap_ints(links), _swap_ints(frontier)), \
+        bytearray(emitted)
+
+
+class WorldFile:
+    """
+    Файл мира, отображенный в память. Заголовки чанков читаются как массив numpy без копирования,
+    а данные чанка копируются из отображения только при его материализации.
+
+    Атрибуты:
+        path (str): путь к файлу.
+        origin (Tuple[int, int]): origin менеджера чанков.
+        chunk_width (int): ширина чанка.
+        chunk_height (int): высота чанка.
+        seed (Optional[int]): зерно мира.
+        directory (np.ndarray): заголовки чанков (dtype CHUNK_HEADER) в порядке создания.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < FILE_HEADER.size:
+            raise ValueError(f"{path} is not a chunk world file")
+        magic, version, flags, origin_x, origin_y, width, height, seed, count = \
+            FILE_HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk world file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported chunk world format version: {version}")
+        self.origin: Tuple[int, int] = (origin_x, origin_y)
+        self.chunk_width: int = width
+        self.chunk_height: int = height
+        self.seed: Optional[int] = seed if flags & FLAG_HAS_SEED else None
+        self.directory: np.ndarray = np.frombuffer(self._map, dtype=CHUNK_HEADER, count=count,
+                                                   offset=FILE_HEADER.size)
+
+    def keys(self) -> List[Tuple[int, int]]:
+        """
+        Возвращает ключи чанков в порядке их создания.
+        """
+        return list(zip(self.directory["i"].tolist(), self.directory["j"].tolist()))
+
+    def records(self) -> List["StoredChunk"]:
+        """
+        Возвращает записи всех чанков файла в порядке их создания.
+        """
+        flags = self.directory["flags"].tolist()
+        frontier = self.directory["frontier"].tolist()
+        return [StoredChunk(key, bool(flags[row] & CHUNK_NEED_EXPAND), frontier[row] > 0, self, row)
+                for row, key in enumerate(self.keys())]
+
+    def counts(self, row: int) -> Tuple[int, int, int]:
+        """
+        Возвращает (число вершин, число рёбер, длина фронтира) чанка row из его заголовка.
+        """
+        header = self.directory[row]
+        return int(header["vertices"]), int(header["edges"]), int(header["frontier"])
+
+    def read_emitted(self, row: int) -> bytes:
+        """
+        Копирует из файла только битовое поле has_emitted чанка row.
+        """
+        header = self.directory[row]
+        vertices, edges = int(header["vertices"]), int(header["edges"])
+        offset = int(header["offset"]) + sum(_part_sizes(vertices, edges, 0, 0)[:3])
+        return self._map[offset:offset + _part_sizes(vertices, 0, 0, 0)[3]]
+
+    def read(self, row: int) -> Tuple[ChunkParts, bytearray]:
+        """
+        Копирует из файла массивы чанка row и его битовое поле has_emitted.
+        """
+        counts, blob = self.raw(row)
+        return _split_blob(blob, _part_sizes(*counts))
+
+    def raw(self, row: int) -> Tuple[Counts, bytes]:
+        """
+        Копирует данные чанка row в формате файла без разбора.
+        """
+        header = self.directory[row]
+        counts = (int(header["vertices"]), int(header["edges"]), int(header["links"]), int(header["frontier"]))
+        offset = int(header["offset"])
+        size = sum(_part_sizes(*counts))
+        return counts, self._map[offset:offset + size + (-size % 8)]
+
+    def close(self) -> None:
+        """
+        Освобождает отображение файла; после этого записи файла читать нельзя.
+        """
+        # Массив заголовков ссылается на отображение и не дал бы его закрыть
+        self.directory = np.zeros(0, dtype=CHUNK_HEADER)
+        self._map.close()
+
+    def __repr__(self) -> str:
+        return f"WorldFile(path={self.path!r}, chunks={len(self.directory)})"
+
+
+class SpillFile:
+    """
+    Временный файл для записей вытесненных чанков, вынесенных из памяти сверх
+    ChunkManager.max_resident_bytes. Данные чанка дописываются в формате файла мира, заголовки
+    строк хранятся в памяти, а записи читаются через StoredChunk так же, как строки WorldFile.
+    Строки не перезаписываются, поэтому ссылки на них (в том числе из версий мира) остаются верны.
+    Файл удаляется при закрытии.
+    """
+
+    def __init__(self) -> None:
+        self._file = tempfile.TemporaryFile()
+        self._size: int = 0
+        # Смещение, число вершин, рёбер, общих вершин и длина фронтира – по пять чисел на строку
+        self._rows: array = array("q")
+
+    def __len__(self) -> int:
+        return len(self._rows) // 5
+
+    def append(self, parts: ChunkParts, emitted: bytes) -> int:
+        """
+        Дописывает массивы чанка и его битовое поле has_emitted и возвращает номер строки.
+        """
+        return self.append_raw(*_chunk_blob(parts, emitted))
+
+    def append_raw(self, counts: Counts, blob: bytes) -> int:
+        """
+        Дописывает данные чанка в формате файла мира (см. WorldFile.raw) и возвращает номер строки.
+        """
+        self._file.seek(self._size)
+        self._file.write(blob)
+        row = len(self)
+        self._rows.append(self._size)
+        self._rows.extend(counts)
+        self._size += len(blob)
+        return row
+
+    def _header(self, row: int) -> Tuple[int, int, int, int, int]:
+        return tuple(self._rows[5 * row:5 * row + 5])
+
+    def _read_at(self, offset: int, size: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def counts(self, row: int) -> Tuple[int, int, int]:
+        _, vertices, edges, _, frontier = self._header(row)
+        return vertices, edges, frontier
+
+    def read_emitted(self, row: int) -> bytes:
+        offset, vertices, edges, _, _ = self._header(row)
+        sizes = _part_sizes(vertices, edges, 0, 0)
+        return self._read_at(offset + sum(sizes[:3]), sizes[3])
+
+    def read(self, row: int) -> Tuple[ChunkParts, bytearray]:
+        counts, blob = self.raw(row)
+        return _split_blob(blob, _part_sizes(*counts))
+
+    def raw(self, row: int) -> Tuple[Counts, bytes]:
+        offset, *counts = self._header(row)
+        size = sum(_part_sizes(*counts))
+        return tuple(counts), self._read_at(offset, size + (-size % 8))
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __repr__(self) -> str:
+        return f"SpillFile(chunks={len(self)}, bytes={self._size})"
+
+
+class StoredChunk:
+    """
+    Запись чанка, еще не прочитанного из файла мира (или вынесенного в SpillFile). Используется
+    менеджером чанков так же, как EvictedChunk: чанк материализуется при первом обращении к нему.
+
+    Битовое поле has_emitted копируется из файла при первом чтении атрибута emitted: чанк может
+    быть домом для вершин уже материализованных соседей, и их флаги пишутся в эту копию.
+
+    Атрибуты:
+        key (Tuple[int, int]): ключ чанка.
+        need_expand (bool): флаг need_expand чанка.
+        active (bool): чанк расширяется (need_expand и непустой фронтир на момент сохранения).
+    """
+
+    __slots__ = ("key", "need_expand", "active", "_file", "_row", "_emitted")
+
+    def __init__(self, key: Tuple[int, int], need_expand: bool, has_frontier: bool,
+                 file: Union[WorldFile, SpillFile], row: int) -> None:
+        self.key: Tuple[int, int] = key
+        self.need_expand: bool = need_expand
+        self.active: bool = need_expand and has_frontier
+        self._file: Union[WorldFile, SpillFile] = file
+        self._row: int = row
+        self._emitted: Optional[bytearray] = None
+
+    @property
+    def emitted(self) -> bytearray:
+        if self._emitted is None:
+            self._emitted = bytearray(self._file.read_emitted(self._row))
+        return self._emitted
+
+    def emitted_bytes(self) -> bytes:
+        """
+        Возвращает копию битового поля has_emitted, не заводя собственную копию записи.
+        """
+        return bytes(self._emitted) if self._emitted is not None else self._file.read_emitted(self._row)
+
+    def counts(self) -> Tuple[int, int, int]:
+        """
+        Возвращает (число вершин, число рёбер, длина фронтира) чанка без чтения его массивов.
+        """
+        return self._file.counts(self._row)
+
+    def parts(self) -> ChunkParts:
+        """
+        Читает массивы чанка в том же виде, что и chunk_parts.
+        """
+        return self._file.read(self._row)[0]
+
+    def raw(self) -> Tuple[Counts, bytes]:
+        """
+        Возвращает данные чанка в формате файла мира, не разбирая их; битовое поле has_emitted
+        берется из копии записи, если она есть.
+        """
+        counts, blob = self._file.raw(self._row)
+        if self._emitted is not None:
+            blob = _with_emitted(counts, blob, self._emitted)
+        return counts, blob
+
+    def row_in(self, file: Union[WorldFile, SpillFile]) -> Optional[int]:
+        """
+        Возвращает строку записи, если она хранится в file, иначе None.
+        """
+        return self._row if self._file is file else None
+
+    def move(self, file: Union[WorldFile, SpillFile], row: int) -> None:
+        """
+        Переносит запись на строку row файла file с теми же массивами (см. ChunkManager.save).
+        """
+        self._file = file
+        self._row = row
+
+    def sibling(self, need_expand: bool, emitted: bytes) -> "StoredChunk":
+        """
+        Возвращает новую запись той же строки файла с флагом need_expand и своей копией emitted.
+        """
+        record = StoredChunk(self.key, need_expand, self._file.counts(self._row)[2] > 0, self._file, self._row)
+        record._emitted = bytearray(emitted)
+        return record
+
+    def release_emitted(self) -> bool:
+        """
+        Отбрасывает копию битового поля has_emitted, если она совпадает с файлом.
+
+        Returns:
+            bool: True, если у записи больше нет копии.
+        """
+        if self._emitted is not None and self._emitted == self._file.read_emitted(self._row):
+            self._emitted = None
+        return self._emitted is None
+
+    def same_row(self, other: "StoredChunk") -> bool:
+        return self._file is other._file and self._row == other._row
+
+    def restore_into(self, chunk: Chunk) -> None:
+        """
+        Заполняет пустой чанк с тем же ключом данными из файла и перестраивает его индекс.
+        """
+        parts, emitted = self._file.read(self._row)
+        fill_chunk(chunk, parts, self.emitted if self._emitted is not None else emitted, self.need_expand)
+
+    def nbytes(self) -> int:
+        return 0 if self._emitted is None else len(self._emitted)
+
+    def __repr__(self) -> str:
+        return f"StoredChunk(key={self.key}, need_expand={self.need_expand}, row={self._row})"
+
+
+def write_world(path: str, origin: Tuple[int, int], chunk_width: int, chunk_height: int, seed: Optional[int],
+                records: Iterable[Tuple[Tuple[int, int], bool, Union[Tuple[ChunkParts, bytes], StoredChunk]]],
+                count: Optional[int] = None, before_replace: Optional[Callable[[], None]] = None) -> None:
+    """
+    Записывает файл мира. records – (ключ, need_expand, данные) в порядке создания чанков, где
+    данные – массивы и битовое поле has_emitted либо StoredChunk, чьи данные копируются из его
+    файла без разбора.
+
+    Если задано число записей count, записи пишутся в файл по одной по мере получения и не
+    накапливаются в памяти; иначе records сначала собирается в список.
+
+    Файл сначала пишется рядом под временным именем и затем атомарно заменяет path; перед заменой
+    вызывается before_replace (например, чтобы освободить отображение заменяемого файла).
+    """
+    if seed is not None and not -(1 << 63) <= seed < (1 << 63):
+        raise ValueError("World seed must fit into a signed 64-bit integer")
+    if count is None:
+        records = list(records)
+        count = len(records)
+    directory = np.zeros(count, dtype=CHUNK_HEADER)
+    offset = FILE_HEADER.size + directory.nbytes
+    file_header = FILE_HEADER.pack(MAGIC, FORMAT_VERSION, 0 if seed is None else FLAG_HAS_SEED,
+                                   origin[0], origin[1], chunk_width, chunk_height,
+                                   0 if seed is None else seed, count)
+    temp_path = f"{path}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(file_header)
+            # Таблица заголовков записывается после данных, когда известны их размеры
+            file.seek(offset)
+            row = -1
+            for row, (key, need_expand, data) in enumerate(records):
+                if row >= count:
+                    raise ValueError(f"More than {count} chunk records")
+                counts, blob = data.raw() if isinstance(data, StoredChunk) else _chunk_blob(*data)
+                header = directory[row]
+                header["i"], header["j"] = key
+                header["x"] = origin[0] + key[0] * chunk_width
+                header["y"] = origin[1] + key[1] * chunk_height
+                header["width"], header["height"] = chunk_width, chunk_height
+                header["flags"] = CHUNK_NEED_EXPAND if need_expand else 0
+                header["vertices"], header["edges"], header["links"], header["frontier"] = counts
+                header["offset"] = offset
+                file.write(blob)
+                offset += len(blob)
+            if row + 1 != count:
+                raise ValueError(f"Expected {count} chunk records, got {row + 1}")
+            file.seek(FILE_HEADER.size)
+            file.write(directory.tobytes())
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    if before_replace is not None:
+        before_replace()
+    os.replace(temp_path, path)
@@ -0,0 +1,182 @@
+# chunk_streamer.py
+import math
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from chunk_manager import ChunkManager
+
+# Прямоугольник поля зрения в мировых координатах: (x, y, ширина, высота)
+View = Tuple[float, float, float, float]
+
+
+class StreamTick(NamedTuple):
+    """
+    Результат одного такта ChunkStreamer.update.
+
+    Атрибуты:
+        loaded: ключи чанков, загруженных в этом такте, в порядке приоритета.
+        unloaded: ключи чанков, вытесненных в этом такте.
+        pending: сколько чанков кольца загрузки еще ждут своей очереди.
+        steps: число точек, испустивших лучи в этом такте.
+    """
+    loaded: List[Tuple[int, int]]
+    unloaded: List[Tuple[int, int]]
+    pending: int
+    steps: int
+
+
+class ChunkStreamer:
+    """
+    Потоковая загрузка чанков вокруг движущегося поля зрения.
+
+    Кольцо загрузки – чанки, которые пересекает поле зрения, расширенное на load_margin чанков,
+    а также то же поле, сдвинутое на velocity * lookahead_s (куда камера придет). Чанки кольца,
+    которые еще не загружены, загружаются не больше max_loads_per_tick за такт: сначала ближние
+    к центру поля зрения, при равном расстоянии – лежащие по направлению движения.
+    Кольцо выгрузки – загруженные чанки дальше unload_margin чанков от поля зрения: они выгружаются
+    (ChunkManager.unload_chunks) не больше max_unloads_per_tick за такт, начиная с еще растущих,
+    среди них – с самых дальних.
+    unload_margin больше load_margin, поэтому чанки на границе колец не загружаются и не выгружаются
+    попеременно. После этого расширение идет не дольше expand_budget_ms.
+
+    Структура растет только от фронтира, поэтому камера, обгоняющая расширение, оставила бы
+    загружаемые чанки пустыми: до них не дорастет ни один чанк. Если задан seeder, он засевает
+    загруженный чанк кольца, который пуст и у которого нет расширяющихся соседей с непустым фронтиром.
+
+    Стоимость такта ограничена: загрузок и выгрузок не больше заданного числа, расширение –
+    по времени, а обход кольца и загруженных чанков зависит от размера поля зрения, а не мира.
+
+    Мир, построенный потоково, не воспроизводится даже при заданном seed: сколько испусканий
+    успевает за такт, зависит от expand_budget_ms и скорости машины, а когда загружается
+    и выгружается чанк – от пути камеры и частоты тактов. Лучи каждой точки те же (см.
+    ChunkManager.emission_rng), но их усечение зависит от линий, уже построенных к моменту
+    испускания.
+
+    Атрибуты:
+        chunk_manager (ChunkManager): менеджер чанков.
+        load_margin (int): ширина кольца загрузки вокруг поля зрения в чанках.
+        unload_margin (int): расстояние в чанках, дальше которого чанки выгружаются.
+        max_loads_per_tick (int): наибольшее число загрузок за такт.
+        max_unloads_per_tick (int): наибольшее число выгрузок за такт.
+        lookahead_s (float): на сколько секунд вперед по скорости расширяется кольцо загрузки.
+        direction_weight (float): вес направления движения в приоритете загрузки (0 – только расстояние).
+        expand_budget_ms (Optional[float]): бюджет expand_structure за такт; None – без расширения.
+        seeder (Optional[Callable[[ChunkManager, Tuple[int, int]], None]]): засевает чанк, до которого
+            структура не может дорасти (например, generate_world.seed_chunk); None – не засевать.
+    """
+
+    def __init__(self, chunk_manager: ChunkManager, load_margin: int = 1, unload_margin: int = 3,
+                 max_loads_per_tick: int = 2, max_unloads_per_tick: int = 8, lookahead_s: float = 0.5,
+                 direction_weight: float = 0.5, expand_budget_ms: Optional[float] = 4.0,
+                 seeder: Optional[Callable[[ChunkManager, Tuple[int, int]], None]] = None) -> None:
+        if unload_margin <= load_margin:
+            raise ValueError("unload_margin must be greater than load_margin")
+        self.chunk_manager: ChunkManager = chunk_manager
+        self.load_margin: int = load_margin
+        self.unload_margin: int = unload_margin
+        self.max_loads_per_tick: int = max_loads_per_tick
+        self.max_unloads_per_tick: int = max_unloads_per_tick
+        self.lookahead_s: float = lookahead_s
+        self.direction_weight: float = direction_weight
+        self.expand_budget_ms: Optional[float] = expand_budget_ms
+        self.seeder: Optional[Callable[[ChunkManager, Tuple[int, int]], None]] = seeder
+
+    def key_range(self, view: View) -> Tuple[int, int, int, int]:
+        """
+        Возвращает диапазон ключей (i0, j0, i1, j1) чанков, которые пересекает view (включительно).
+        """
+        manager = self.chunk_manager
+        x, y, width, height = view
+        i0 = math.floor((x - manager.origin[0]) / manager.chunk_width)
+        j0 = math.floor((y - manager.origin[1]) / manager.chunk_height)
+        i1 = math.floor((x + max(width, 1) - 1 - manager.origin[0]) / manager.chunk_width)
+        j1 = math.floor((y + max(height, 1) - 1 - manager.origin[1]) / manager.chunk_height)
+        return i0, j0, i1, j1
+
+    def ring_distance(self, key: Tuple[int, int], view: View) -> int:
+        """
+        Возвращает расстояние в чанках (по Чебышеву) от чанка key до чанков, которые пересекает view.
+        """
+        i0, j0, i1, j1 = self.key_range(view)
+        i, j = key
+        return max(i0 - i, i - i1, j0 - j, j - j1, 0)
+
+    def load_ring(self, view: View, velocity: Tuple[float, float] = (0.0, 0.0)) -> List[Tuple[int, int]]:
+        """
+        Возвращает ключи кольца загрузки для поля зрения view и скорости velocity (пикселей в секунду).
+        """
+        x, y, width, height = view
+        ahead = (x + velocity[0] * self.lookahead_s, y + velocity[1] * self.lookahead_s, width, height)
+        margin = self.load_margin
+        keys = {}
+        for rect in (view, ahead):
+            i0, j0, i1, j1 = self.key_range(rect)
+            for i in range(i0 - margin, i1 + margin + 1):
+                for j in range(j0 - margin, j1 + margin + 1):
+                    keys[(i, j)] = None
+        return list(keys)
+
+    def priority(self, key: Tuple[int, int], view: View, velocity: Tuple[float, float] = (0.0, 0.0)) -> float:
+        """
+        Возвращает приоритет загрузки чанка (меньше – раньше): расстояние от центра поля зрения
+        до центра чанка, уменьшенное для чанков впереди по направлению движения.
+        """
+        manager = self.chunk_manager
+        x, y, width, height = view
+        dx = manager.origin[0] + (key[0] + 0.5) * manager.chunk_width - (x + width / 2)
+        dy = manager.origin[1] + (key[1] + 0.5) * manager.chunk_height - (y + height / 2)
+        score = math.hypot(dx, dy)
+        speed = math.hypot(velocity[0], velocity[1])
+        if speed > 0:
+            score -= self.direction_weight * (dx * velocity[0] + dy * velocity[1]) / speed
+        return score
+
+    def stranded(self, key: Tuple[int, int]) -> bool:
+        """
+        Проверяет, что загруженный чанк key пуст и структура до него не дорастет: ни у него,
+        ни у соседей, которые расширяются, нет фронтира.
+        """
+        manager = self.chunk_manager
+        if manager.chunks[key].geometry.vertex_count:
+            return False
+        for nkey in manager.get_neighbor_keys(key):
+            chunk = manager.chunks.get(nkey)
+            if chunk is not None and chunk.need_expand and chunk.frontier:
+                return False
+        return True
+
+    def update(self, view: View, velocity: Tuple[float, float] = (0.0, 0.0)) -> StreamTick:
+        """
+        Выполняет один такт: выгружает дальние чанки, загружает самые приоритетные чанки кольца
+        загрузки, засевает пустые чанки кольца, до которых структура не дорастет (см. seeder),
+        и расширяет структуру в пределах expand_budget_ms.
+        """
+        manager = self.chunk_manager
+        # Сначала выгружаются еще растущие чанки: уже выгруженные, но оставленные в памяти соседи
+        # растущих не должны занимать места такта, иначе дальние чанки растут без конца
+        far = [(manager.chunks[key].need_expand, distance, key) for key, distance in
+               ((key, self.ring_distance(key, view)) for key in manager.chunks)
+               if distance > self.unload_margin]
+        far.sort(reverse=True)
+        unloaded = manager.unload_chunks([key for _, _, key in far[:self.max_unloads_per_tick]])
+
+        ring = self.load_ring(view, velocity)
+        pending = [key for key in ring if key not in manager.chunks or not manager.chunks[key].need_expand]
+        pending.sort(key=lambda k: self.priority(k, view, velocity))
+        loaded = pending[:self.max_loads_per_tick]
+        for key in loaded:
+            manager.load_chunk(key)
+        if self.seeder is not None:
+            # Проверяется все кольцо: рост вокруг загруженного чанка может затухнуть, не дойдя до него
+            for key in ring:
+                chunk = manager.chunks.get(key)
+                if chunk is not None and chunk.need_expand and self.stranded(key):
+                    self.seeder(manager, key)
+
+        steps = 0
+        if self.expand_budget_ms is not None:
+            steps = manager.expand_structure(time_budget_ms=self.expand_budget_ms)
+        return StreamTick(loaded, unloaded, len(pending) - len(loaded), steps)
+
+    def __repr__(self) -> str:
+        return (f"ChunkStreamer(load_margin={self.load_margin}, unload_margin={self.unload_margin}, "
+                f"max_loads_per_tick={self.max_loads_per_tick})")
@@ -0,0 +1,216 @@
+# chunk_versions.py
+import zlib
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+
+from chunk import Chunk
+from chunk_cache import ChunkParts, EvictedChunk, fill_chunk
+from chunk_store import StoredChunk
+
+
+class ChunkState:
+    """
+    Неизменяемое состояние чанка в версии мира (см. ChunkManager.snapshot).
+
+    Массивы хранятся сжатыми в том же формате, что у EvictedChunk, а битовое поле has_emitted –
+    копией в bytes. Состояние не меняется после создания, поэтому одно и то же состояние
+    разделяют все версии, в которых чанк не менялся; новое создается только для чанков,
+    которые изменились с прошлой версии (см. matches).
+
+    Состояние чанка, еще не прочитанного из файла мира (StoredChunk), не копирует его массивы:
+    они остаются в файле и читаются из него по parts, поэтому первый снимок после
+    ChunkManager.open не сжимает заново весь мир.
+
+    Атрибуты:
+        key (Tuple[int, int]): ключ чанка.
+        need_expand (bool): флаг need_expand чанка.
+        emitted (bytes): битовое поле has_emitted вершин чанка.
+        data (Optional[bytes]): сжатые массивы чанка (см. EvictedChunk); None – массивы в файле мира.
+        vertex_count, edge_count, frontier_size (int): размеры массивов – для быстрого сравнения.
+        membership_crc (int): CRC32 счетчиков polygon_membership (0 для записи из файла мира).
+        source (Union[EvictedChunk, StoredChunk, None]): запись вне памяти, из которой получено
+            состояние; None – состояние снято с чанка в памяти.
+    """
+
+    __slots__ = ("key", "need_expand", "emitted", "data", "vertex_count", "edge_count", "frontier_size",
+                 "membership_crc", "source")
+
+    def __init__(self, key: Tuple[int, int], need_expand: bool, emitted: bytes, data: Optional[bytes],
+                 vertex_count: int, edge_count: int, frontier_size: int, membership_crc: int,
+                 source: Union[EvictedChunk, StoredChunk, None] = None) -> None:
+        self.key: Tuple[int, int] = key
+        self.need_expand: bool = need_expand
+        self.emitted: bytes = emitted
+        self.data: Optional[bytes] = data
+        self.vertex_count: int = vertex_count
+        self.edge_count: int = edge_count
+        self.frontier_size: int = frontier_size
+        self.membership_crc: int = membership_crc
+        self.source: Union[EvictedChunk, StoredChunk, None] = source
+
+    @classmethod
+    def from_chunk(cls, chunk: Chunk) -> "ChunkState":
+        """
+        Снимает состояние чанка в памяти.
+        """
+        record = EvictedChunk.from_chunk(chunk)
+        geometry = chunk.geometry
+        return cls(chunk.grid_pos, chunk.need_expand, bytes(geometry.emitted), record.data, geometry.vertex_count,
+                   geometry.edge_count, len(chunk.frontier), zlib.crc32(geometry.membership))
+
+    @classmethod
+    def from_record(cls, record: Union[EvictedChunk, StoredChunk]) -> "ChunkState":
+        """
+        Снимает состояние чанка вне памяти. Сжатые данные EvictedChunk и массивы в файле мира
+        не меняются, пока запись существует, и используются без копирования.
+        """
+        if isinstance(record, StoredChunk):
+            vertex_count, edge_count, frontier_size = record.counts()
+            return cls(record.key, record.need_expand, record.emitted_bytes(), None, vertex_count, edge_count,
+                       frontier_size, 0, record)
+        parts = record.parts()
+        return cls(record.key, record.need_expand, bytes(record.emitted), record.data, len(parts.xy) // 8,
+                   len(parts.edges) // 8, len(parts.frontier) // 4, zlib.crc32(parts.membership), record)
+
+    def matches(self, chunk: Chunk) -> bool:
+        """
+        Проверяет, что чанк в памяти не изменился с момента снятия состояния.
+
+        Массивы чанка только растут, а фронтир меняется только вместе с числом рёбер
+        или своей длиной, поэтому достаточно сравнить размеры, флаги и CRC счетчиков.
+        """
+        geometry = chunk.geometry
+        return (self.source is None and chunk.need_expand == self.need_expand
+                and geometry.vertex_count == self.vertex_count and geometry.edge_count == self.edge_count
+                and len(chunk.frontier) == self.frontier_size and geometry.emitted == self.emitted
+                and zlib.crc32(geometry.membership) == self.membership_crc)
+
+    def matches_record(self, record: Union[EvictedChunk, StoredChunk]) -> bool:
+        """
+        Проверяет, что запись вне памяти – та же, из которой снято состояние, и ее флаги не менялись.
+        """
+        # Запись, созданная restore из этого состояния, разделяет с ним сжатые данные или строку файла
+        if isinstance(record, StoredChunk):
+            same = isinstance(self.source, StoredChunk) and self.source.same_row(record)
+            emitted = record.emitted_bytes()
+        else:
+            same = self.source is record or (self.data is not None and record.data is self.data)
+            emitted = record.emitted
+        return same and record.need_expand == self.need_expand and emitted == self.emitted
+
+    def parts(self) -> ChunkParts:
+        if self.data is None:
+            return self.source.parts()
+        return EvictedChunk(self.key, self.need_expand, bytearray(), self.data).parts()
+
+    def record(self) -> Union[EvictedChunk, StoredChunk]:
+        """
+        Возвращает новую запись вне памяти с этим состоянием (со своей копией флагов has_emitted).
+        """
+        if self.data is None:
+            return self.source.sibling(self.need_expand, self.emitted)
+        return EvictedChunk(self.key, self.need_expand, bytearray(self.emitted), self.data)
+
+    def restore_into(self, chunk: Chunk) -> None:
+        """
+        Заполняет пустой чанк с тем же ключом этим состоянием.
+        """
+        fill_chunk(chunk, self.parts(), bytearray(self.emitted), self.need_expand)
+
+    def nbytes(self) -> int:
+        return (0 if self.data is None else len(self.data)) + len(self.emitted)
+
+    def __repr__(self) -> str:
+        return (f"ChunkState(key={self.key}, need_expand={self.need_expand}, vertices={self.vertex_count}, "
+                f"edges={self.edge_count}, bytes={self.nbytes()})")
+
+
+class WorldVersion(NamedTuple):
+    """
+    Версия мира: состояния всех чанков и служебное состояние ChunkManager.
+
+    Атрибуты:
+        states: ключ чанка -> его ChunkState.
+        resident: ключи чанков, которые были в памяти.
+        creation_order: порядок создания чанков.
+        key_bounds: диапазон ключей созданных чанков.
+        expand_cursor: чанк, с которого продолжится прерванный проход расширения.
+        pending: расширяющиеся чанки, еще не прочитанные из файла мира.
+    """
+    states: Dict[Tuple[int, int], ChunkState]
+    resident: frozenset
+    creation_order: Dict[Tuple[int, int], int]
+    key_bounds: Optional[Tuple[int, int, int, int]]
+    expand_cursor: Optional[Tuple[int, int]]
+    pending: Tuple[Tuple[int, int], ...]
+
+
+class ChunkDelta(NamedTuple):
+    """
+    Изменение одного чанка между двумя версиями (см. ChunkManager.diff).
+
+    Виды изменений:
+        "add" – чанк появился: parts и emitted – его полное состояние;
+        "update" – чанк вырос: parts.xy и parts.edges – только вершины с индекса vertex_start
+            и рёбра с индекса edge_start, parts.links – только новые ссылки, остальные поля – целиком;
+        "replace" – массивы изменились не только добавлением: полное состояние;
+        "remove" – чанка нет в новой версии: parts и emitted пусты.
+
+    Атрибуты:
+        key: ключ чанка.
+        kind: вид изменения.
+        need_expand: флаг need_expand в новой версии.
+        vertex_start, edge_start: с каких вершин и рёбер начинаются массивы parts.
+        parts: массивы (в формате chunk_parts).
+        emitted: битовое поле has_emitted в новой версии.
+    """
+    key: Tuple[int, int]
+    kind: str
+    need_expand: bool
+    vertex_start: int
+    edge_start: int
+    parts: ChunkParts
+    emitted: bytes
+
+    def nbytes(self) -> int:
+        return sum(len(part) for part in self.parts) + len(self.emitted)
+
+
+EMPTY_PARTS = ChunkParts(b"", b"", b"", b"", b"")
+
+
+def chunk_delta(old: Optional[ChunkState], new: Optional[ChunkState]) -> Optional[ChunkDelta]:
+    """
+    Возвращает изменение чанка от состояния old к состоянию new (None – состояния совпадают).
+    """
+    if old is new:
+        return None
+    if new is None:
+        return ChunkDelta(old.key, "remove", False, 0, 0, EMPTY_PARTS, b"")
+    parts = new.parts()
+    if old is None:
+        return ChunkDelta(new.key, "add", new.need_expand, 0, 0, parts, new.emitted)
+    old_parts = old.parts()
+    if old_parts == parts and old.emitted == new.emitted and old.need_expand == new.need_expand:
+        return None
+    # Вершины, рёбра и ссылки только дописываются в конец массивов
+    if parts.xy.startswith(old_parts.xy) and parts.edges.startswith(old_parts.edges) \
+            and parts.links.startswith(old_parts.links):
+        tail = ChunkParts(parts.xy[len(old_parts.xy):], parts.edges[len(old_parts.edges):], parts.membership,
+                          parts.links[len(old_parts.links):], parts.frontier)
+        return ChunkDelta(new.key, "update", new.need_expand, old.vertex_count, old.edge_count, tail, new.emitted)
+    return ChunkDelta(new.key, "replace", new.need_expand, 0, 0, parts, new.emitted)
+
+
+def apply_chunk_delta(parts: Optional[ChunkParts], delta: ChunkDelta) -> Optional[Tuple[ChunkParts, bytes]]:
+    """
+    Применяет изменение delta к массивам чанка parts (None – чанка не было) и возвращает
+    (новые массивы, новое битовое поле has_emitted) или None, если чанк удален.
+    Так клиент, получивший поток ChunkDelta, восстанавливает чанки новой версии.
+    """
+    if delta.kind == "remove":
+        return None
+    if delta.kind != "update":
+        return delta.parts, delta.emitted
+    tail = delta.parts
+    return ChunkParts(parts.xy + tail.xy, parts.edges + tail.edges, tail.membership, parts.links + tail.links,
+                      tail.frontier), delta.emitted
@@ -0,0 +1,59 @@
+# conftest.py
+from typing import Callable, Dict, Optional, Tuple
+
+import pytest
+
+from chunk_manager import ChunkManager
+from generate_world import seed_chunk
+
+
+def build_seeded_world(side: int = 3, seed: Optional[int] = 1, iterations: int = 8,
+                       max_resident_bytes: Optional[int] = None, **expand_kwargs) -> ChunkManager:
+    """
+    Строит мир side x side чанков со стартовыми точками generate_world и выполняет
+    iterations вызовов expand_structure с аргументами expand_kwargs.
+    """
+    manager = ChunkManager((0, 0), 250, 250, seed=seed, max_resident_bytes=max_resident_bytes)
+    keys = [(i, j) for j in range(side) for i in range(side)]
+    for key in keys:
+        manager.load_chunk(key)
+    for key in keys:
+        seed_chunk(manager, key, seeds_per_chunk=1, ray_count=3, min_length=50, max_length=80)
+    for _ in range(iterations):
+        manager.expand_structure(**expand_kwargs)
+    return manager
+
+
+def world_state(manager: ChunkManager) -> Dict[Tuple[int, int], tuple]:
+    """
+    Возвращает содержимое всех чанков мира (в памяти и вне ее) для сравнения миров.
+    Вытесненные чанки при этом восстанавливаются в память как есть (load_chunk включил бы их рост).
+    """
+    for key in list(manager.evicted):
+        manager._restore_chunk(key)
+    state = {}
+    for key, chunk in manager.chunks.items():
+        geometry = chunk.geometry
+        emitted = bytes(geometry.is_emitted(index) for index in range(geometry.vertex_count))
+        state[key] = (chunk.need_expand, geometry.xy.tobytes(), geometry.edges.tobytes(), emitted,
+                      tuple(chunk.frontier))
+    return state
+
+
+@pytest.fixture
+def make_world() -> Callable[..., ChunkManager]:
+    managers = []
+
+    def make(*args, **kwargs) -> ChunkManager:
+        manager = build_seeded_world(*args, **kwargs)
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.close()
+
+
+@pytest.fixture
+def state_of() -> Callable[[ChunkManager], Dict[Tuple[int, int], tuple]]:
+    return world_state
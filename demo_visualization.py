@@ -3,58 +3,287 @@ import pygame
 import sys
 import math
 import random
+import time
+from typing import Dict, List, Optional, Tuple
 
 from cell_point import CellPoint
 from cell_line import CellLine
 from cell_structure_utils import line_intersection, generate_initial_rays, generate_child_rays, calculate_angle
 from chunk import Chunk
 from chunk_manager import ChunkManager
+from chunk_streamer import ChunkStreamer
+from generate_world import seed_chunk
+from generation_worker import ChunkSnapshot, GenerationWorker
 
 
 # --- Визуализация через Pygame ---
 
+class ChunkRenderer:
+    """
+    Кэширующая отрисовка снимков чанков (ChunkSnapshot), которые публикует GenerationWorker.
+
+    Для каждого чанка в поле зрения хранится заранее нарисованная поверхность с его границей,
+    линиями и точками. Поверхность перерисовывается, только когда пришел снимок чанка новой версии
+    или изменился масштаб, а кадр собирается заново, только если изменился хотя бы один видимый чанк
+    или само поле зрения. Поэтому время кадра зависит от числа видимых чанков, а не от размера мира.
+
+    При отдалении (zoom < 1) чанк рисуется уровнем своего LOD, выбранным по масштабу
+    (ChunkLOD.select): упрощенными линиями или растром плотности, так что стоимость перерисовки
+    чанка падает вместе с его размером на экране.
+
+    Атрибуты:
+        origin (Tuple[int, int]): origin сетки чанков.
+        chunk_width (int): ширина чанка.
+        chunk_height (int): высота чанка.
+        viewport_size (Tuple[int, int]): размер области отрисовки в пикселях.
+        zoom (float): масштаб – пикселей экрана на единицу мира.
+        margin (float): поля поверхности вокруг чанка в единицах мира: линии выходят за границы
+            чанка не дальше наибольшей длины линии, плюс радиус точки.
+        chunks (Dict[Tuple[int, int], ChunkSnapshot]): последние снимки чанков.
+        surfaces (Dict[Tuple[int, int], Tuple[tuple, float, pygame.Surface, Tuple[float, float]]]):
+            ключ видимого чанка -> (версия снимка, масштаб, поверхность, мировые координаты
+            ее левого верхнего угла).
+    """
+
+    # Радиус точки в единицах мира
+    POINT_RADIUS = 5
+    BACKGROUND = (30, 30, 30)
+    LINE_COLOR = (0, 255, 255)
+    # Точки рисуются, только пока масштаб не меньше POINT_ZOOM
+    POINT_ZOOM = 0.5
+
+    def __init__(self, origin: Tuple[int, int], chunk_width: int, chunk_height: int,
+                 viewport_size: Tuple[int, int], zoom: float = 1.0, max_line_length: float = 80) -> None:
+        self.origin: Tuple[int, int] = origin
+        self.chunk_width: int = chunk_width
+        self.chunk_height: int = chunk_height
+        self.viewport_size: Tuple[int, int] = viewport_size
+        self.zoom: float = zoom
+        self.margin: float = max_line_length + self.POINT_RADIUS
+        self.chunks: Dict[Tuple[int, int], ChunkSnapshot] = {}
+        self.surfaces: Dict[Tuple[int, int], Tuple[tuple, float, pygame.Surface, Tuple[float, float]]] = {}
+        self._last_frame: Optional[tuple] = None
+
+    def update(self, snapshots: List[ChunkSnapshot]) -> None:
+        for snapshot in snapshots:
+            self.chunks[snapshot.key] = snapshot
+
+    def view(self, offset: Tuple[float, float]) -> Tuple[float, float, float, float]:
+        """
+        Возвращает поле зрения со сдвигом offset (мировые координаты левого верхнего угла экрана)
+        в мировых координатах: (x, y, ширина, высота).
+        """
+        return offset[0], offset[1], self.viewport_size[0] / self.zoom, self.viewport_size[1] / self.zoom
+
+    def to_world(self, offset: Tuple[float, float], x: float, y: float) -> Tuple[float, float]:
+        """
+        Переводит точку экрана (x, y) в мировые координаты.
+        """
+        return offset[0] + x / self.zoom, offset[1] + y / self.zoom
+
+    def prune(self, offset: Tuple[float, float], keep: int) -> None:
+        """
+        Забывает снимки чанков дальше keep чанков от поля зрения со сдвигом offset.
+        """
+        x, y, width, height = self.view(offset)
+        i0, j0 = self.key_at(x, y)
+        i1, j1 = self.key_at(x + width, y + height)
+        for key in [key for key in self.chunks
+                    if not (i0 - keep <= key[0] <= i1 + keep and j0 - keep <= key[1] <= j1 + keep)]:
+            del self.chunks[key]
+
+    def key_at(self, x: float, y: float) -> Tuple[int, int]:
+        """
+        Возвращает ключ чанка, в который попадает точка (x, y) (как ChunkManager.get_chunk_key_for_point).
+        """
+        return (math.floor((x - self.origin[0]) / self.chunk_width),
+                math.floor((y - self.origin[1]) / self.chunk_height))
+
+    def visible_keys(self, offset: Tuple[float, float] = (0, 0)) -> List[Tuple[int, int]]:
+        """
+        Возвращает ключи известных чанков, поверхности которых попадают в поле зрения со сдвигом offset.
+        """
+        margin = self.margin
+        x, y, width, height = self.view(offset)
+        i0, j0 = self.key_at(x - margin, y - margin)
+        i1, j1 = self.key_at(x + width + margin, y + height + margin)
+        return [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1) if (i, j) in self.chunks]
+
+    def render_chunk(self, chunk: ChunkSnapshot) -> Tuple[pygame.Surface, Tuple[float, float]]:
+        """
+        Рисует чанк в текущем масштабе на прозрачной поверхности с полями margin
+        (для растра плотности – на поверхности размером с растр).
+
+        Returns:
+            (поверхность, мировые координаты ее левого верхнего угла).
+        """
+        zoom = self.zoom
+        level, data = (0, None)
+        if chunk.need_expand and chunk.lod is not None:
+            level, data = chunk.lod.select(zoom)
+        if data is not None and data.ndim == 2 and data.shape[1] != 4:
+            # Растр плотности: яркость ячейки – ее альфа
+            rows, columns = data.shape
+            cell = chunk.lod.density_cell
+            left, top = chunk.lod.density_origin
+            raster = pygame.Surface((columns, rows), pygame.SRCALPHA)
+            raster.fill(self.LINE_COLOR)
+            pygame.surfarray.pixels_alpha(raster)[:] = data.T
+            surface = pygame.transform.scale(raster, (max(1, round(columns * cell * zoom)),
+                                                      max(1, round(rows * cell * zoom))))
+        else:
+            left, top = chunk.x - self.margin, chunk.y - self.margin
+            surface = pygame.Surface((max(1, round((chunk.width + 2 * self.margin) * zoom)),
+                                      max(1, round((chunk.height + 2 * self.margin) * zoom))), pygame.SRCALPHA)
+        color = (0, 255, 0) if chunk.need_expand else (255, 0, 0)
+        pygame.draw.rect(surface, color, pygame.Rect(round((chunk.x - left) * zoom), round((chunk.y - top) * zoom),
+                                                     max(1, round(chunk.width * zoom)),
+                                                     max(1, round(chunk.height * zoom))),
+                         max(1, round(3 * zoom)))
+        if chunk.need_expand and (data is None or data.shape[1] == 4):
+            segments = (chunk.segments if data is None else data).tolist()
+            width = max(1, round(2 * zoom))
+            for x1, y1, x2, y2 in segments:
+                pygame.draw.line(surface, self.LINE_COLOR, ((x1 - left) * zoom, (y1 - top) * zoom),
+                                 ((x2 - left) * zoom, (y2 - top) * zoom), width)
+            if level == 0 and zoom >= self.POINT_ZOOM:
+                radius = max(1, round(self.POINT_RADIUS * zoom))
+                for x1, y1, x2, y2 in segments:
+                    for x, y in ((x1, y1), (x2, y2)):
+                        col = (255, 255, 0) if chunk.contains(x, y) else (255, 0, 0)
+                        pygame.draw.circle(surface, col, ((x - left) * zoom, (y - top) * zoom), radius)
+        return surface, (left, top)
+
+    def draw(self, screen: pygame.Surface, offset: Tuple[float, float] = (0, 0),
+             budget_ms: Optional[float] = None) -> bool:
+        """
+        Перерисовывает устаревшие поверхности видимых чанков и, если что-то изменилось,
+        собирает кадр из поверхностей.
+
+        Аргументы:
+            offset: мировые координаты левого верхнего угла экрана.
+            budget_ms: ограничение времени на перерисовку поверхностей; чанки, до которых не дошла
+                очередь, показываются в прежнем виде (в том числе в прежнем масштабе)
+                и перерисовываются в следующих кадрах.
+
+        Returns:
+            bool: True, если кадр был собран заново и его нужно вывести на экран.
+        """
+        deadline = None if budget_ms is None else time.perf_counter() + budget_ms / 1000
+        zoom = self.zoom
+        keys = self.visible_keys(offset)
+        changed = False
+        for key in keys:
+            chunk = self.chunks[key]
+            cached = self.surfaces.get(key)
+            if cached is not None and cached[0] == chunk.version and cached[1] == zoom:
+                continue
+            if deadline is not None and time.perf_counter() >= deadline and cached is not None:
+                continue
+            surface, position = self.render_chunk(chunk)
+            self.surfaces[key] = (chunk.version, zoom, surface, position)
+            changed = True
+
+        frame = (offset, zoom, tuple(keys))
+        if not changed and frame == self._last_frame:
+            return False
+        # Поверхности чанков, ушедших из поля зрения, не храним
+        visible = set(keys)
+        for key in [key for key in self.surfaces if key not in visible]:
+            del self.surfaces[key]
+
+        screen.fill(self.BACKGROUND)
+        for key in keys:
+            _, surface_zoom, surface, (left, top) = self.surfaces[key]
+            if surface_zoom != zoom:
+                # Устаревшая поверхность другого масштаба растягивается до перерисовки
+                surface = pygame.transform.scale(surface, (max(1, round(surface.get_width() * zoom / surface_zoom)),
+                                                           max(1, round(surface.get_height() * zoom / surface_zoom))))
+            screen.blit(surface, (round((left - offset[0]) * zoom), round((top - offset[1]) * zoom)))
+        self._last_frame = frame
+        return True
+
+
+# Бюджеты кадра: разбор очереди снимков и перерисовка поверхностей чанков
+DRAIN_BUDGET_MS = 2.0
+RENDER_BUDGET_MS = 6.0
+# Скорость камеры при прокрутке стрелками, пикселей экрана в секунду
+PAN_SPEED = 400
+# Масштаб колесом мыши: множитель за шаг и пределы
+ZOOM_STEP = 1.25
+MIN_ZOOM = 0.05
+MAX_ZOOM = 2.0
+# Диапазон длин начальных лучей стартовой точки (см. main)
+INITIAL_MIN_LENGTH = 50
+INITIAL_MAX_LENGTH = 80
+# Порог сварки вершин, с которым расширяет фоновый поток (значение по умолчанию expand_structure);
+# сварка удлиняет луч не больше чем на порог
+CONNECTION_THRESHOLD = 10
+
+
 def visualize_chunks(chunk_manager: ChunkManager):
     pygame.init()
     screen = pygame.display.set_mode((800, 600))
     pygame.display.set_caption("Cell Structure Demo (Chunk Manager)")
     clock = pygame.time.Clock()
+    # Поля поверхностей чанков следуют за параметрами лучей менеджера (см. configure_rays)
+    max_line_length = max(chunk_manager.child_max_length + CONNECTION_THRESHOLD, INITIAL_MAX_LENGTH)
+    renderer = ChunkRenderer(chunk_manager.origin, chunk_manager.chunk_width, chunk_manager.chunk_height,
+                             screen.get_size(), max_line_length=max_line_length)
+    # Генерация идет в фоновом потоке; цикл отрисовки только ставит задания и разбирает снимки чанков.
+    # Стрелки двигают камеру, колесо мыши меняет масштаб, и чанки вокруг поля зрения загружаются
+    # и выгружаются потоком; при отдалении чанки рисуются по своим LOD
+    chunk_manager.enable_lod()
+    # Чанки, до которых структура не дорастет (камера обогнала расширение), засеваются как в generate_world
+    streamer = ChunkStreamer(chunk_manager, seeder=lambda manager, key: seed_chunk(
+        manager, key, seeds_per_chunk=1, ray_count=3, min_length=INITIAL_MIN_LENGTH, max_length=INITIAL_MAX_LENGTH))
+    worker = GenerationWorker(chunk_manager, streamer=streamer)
+    worker.start()
+    # Мировые координаты левого верхнего угла экрана
+    offset = [0.0, 0.0]
     running = True
 
     while running:
+        dt = clock.tick(60) / 1000
+        view_changed = False
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             # По клику мышью загружаем чанк, в который попадает точка
-            if event.type == pygame.MOUSEBUTTONDOWN:
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button in (1, 2, 3):
                 mouse_pos = pygame.mouse.get_pos()
-                target = chunk_manager.get_chunk_for_point(CellPoint(mouse_pos[0], mouse_pos[1]))
+                key = renderer.key_at(*renderer.to_world(offset, *mouse_pos))
+                target = renderer.chunks.get(key)
                 if target and not target.need_expand:
-                    chunk_manager.load_chunk(chunk_manager.get_chunk_key_for_point(CellPoint(mouse_pos[0], mouse_pos[1])))
-                    print("Loaded chunk at", target.grid_pos)
-                # Выполняем несколько итераций расширения
-                for _ in range(20):
-                    chunk_manager.expand_structure(connection_threshold=300)
-
-        screen.fill((30, 30, 30))
-        # Рисуем границы всех чанков
-        for chunk in chunk_manager.chunks.values():
-            color = (0, 255, 0) if chunk.need_expand else (255, 0, 0)
-            rect = pygame.Rect(chunk.x, chunk.y, chunk.width, chunk.height)
-            pygame.draw.rect(screen, color, rect, 3)
-            if chunk.need_expand:
-                for line in chunk.lines:
-                    start = (int(line.start.position[0]), int(line.start.position[1]))
-                    end = (int(line.end.position[0]), int(line.end.position[1]))
-                    pygame.draw.line(screen, (0, 255, 255), start, end, 2)
-                for line in chunk.lines:
-                    pt = line.start
-                    pt2 = line.end
-                    col = (255, 255, 0) if chunk.contains(pt) else (255, 0, 0)
-                    pygame.draw.circle(screen, col, (int(pt.position[0]), int(pt.position[1])), 5)
-                    pygame.draw.circle(screen, col, (int(pt2.position[0]), int(pt2.position[1])), 5)
-        pygame.display.flip()
-        clock.tick(60)
+                    worker.submit_load(key)
+                    print("Loading chunk at", key)
+                # Запрашиваем несколько итераций расширения
+                worker.submit_expand(20)
+            if event.type == pygame.MOUSEWHEEL and event.y:
+                # Точка мира под курсором остается на месте
+                mouse_pos = pygame.mouse.get_pos()
+                anchor = renderer.to_world(offset, *mouse_pos)
+                renderer.zoom = min(MAX_ZOOM, max(MIN_ZOOM, renderer.zoom * ZOOM_STEP ** event.y))
+                offset[0] = anchor[0] - mouse_pos[0] / renderer.zoom
+                offset[1] = anchor[1] - mouse_pos[1] / renderer.zoom
+                view_changed = True
+
+        pressed = pygame.key.get_pressed()
+        velocity = ((pressed[pygame.K_RIGHT] - pressed[pygame.K_LEFT]) * PAN_SPEED / renderer.zoom,
+                    (pressed[pygame.K_DOWN] - pressed[pygame.K_UP]) * PAN_SPEED / renderer.zoom)
+        if velocity != (0, 0):
+            offset[0] += velocity[0] * dt
+            offset[1] += velocity[1] * dt
+            view_changed = True
+        if view_changed:
+            worker.set_view(renderer.view((offset[0], offset[1])), velocity)
+            renderer.prune((offset[0], offset[1]), streamer.unload_margin + 2)
+
+        renderer.update(worker.drain(DRAIN_BUDGET_MS))
+        if renderer.draw(screen, (offset[0], offset[1]), budget_ms=RENDER_BUDGET_MS):
+            pygame.display.flip()
 
+    worker.stop()
     pygame.quit()
     sys.exit()
 
@@ -79,7 +308,8 @@ def main():
     start_point = CellPoint(int(central_chunk.x + central_chunk.width / 2), int(central_chunk.y + central_chunk.height / 2))
 
     # Генерируем начальные лучи из стартовой точки
-    initial_rays = generate_initial_rays(start_point, ray_count=3, min_length=50, max_length=80)
+    initial_rays = generate_initial_rays(start_point, ray_count=3, min_length=INITIAL_MIN_LENGTH,
+                                         max_length=INITIAL_MAX_LENGTH)
     start_point.has_emitted = True
     for (vec, angle) in initial_rays:
         new_x = start_point.position[0] + vec[0]
@@ -90,7 +320,7 @@ def main():
 
     # Выполняем несколько итераций расширения
     for _ in range(20):
-        chunk_manager.expand_structure(connection_threshold=300)
+        chunk_manager.expand_structure()
 
     visualize_chunks(chunk_manager)
 
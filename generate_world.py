@@ -0,0 +1,271 @@
+# generate_world.py
+"""
+Генерация мира заданного размера без Pygame и дисплея с записью готовых чанков на диск.
+
+Запуск:
+    python generate_world.py OUTPUT --seed 1 --width 16 --height 16 [--format png|vector]
+
+Мир – прямоугольник width x height чанков. В каждом чанке в детерминированной (по зерну и ключу)
+позиции ставятся стартовые точки с начальными лучами, как в demo_visualization.main. Чанки
+расширяются построчно: строка j загружается, засевается и расширяется до насыщения вместе
+с предыдущей строкой, после чего предыдущая строка замораживается (need_expand = False).
+Линия хранится в чанке своей начальной точки и не длиннее половины чанка, поэтому испускание
+меняет только чанки своей и соседних строк. Когда строка j насыщена, строки до j - 1 заморожены,
+и в строку j - 3 уже ничего не попадет: ее тайлы записываются, а строка j - 4, нужная только
+как соседка для тайлов j - 3, удаляется из менеджера. В памяти одновременно не больше шести
+строк чанков, поэтому размер мира ограничен только диском.
+
+Форматы тайлов (по одному файлу на чанк, i_j.png или i_j.json):
+    png – 8-битное изображение в оттенках серого, линии чанка и соседей, попадающие в чанк;
+    vector – JSON с ключом, границами чанка, уровнем детализации и отрезками [x1, y1, x2, y2],
+        пересекающими чанк.
+При масштабе --scale меньше 1 тайлы строятся из упрощенных линий уровня LOD, выбранного
+по масштабу (ChunkLOD.select), – для обзорных карт мелкие линии не нужны.
+В конце пишется world.json с параметрами генерации и сводкой.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import struct
+import sys
+import time
+import zlib
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from cell_line import CellLine
+from cell_point import CellPoint
+from cell_structure_utils import generate_initial_rays
+from chunk_manager import ChunkManager
+
+# Доля стороны чанка у его края, куда не ставятся стартовые точки
+SEED_MARGIN = 0.1
+
+
+def seed_chunk(manager: ChunkManager, key: Tuple[int, int], seeds_per_chunk: int, ray_count: int,
+               min_length: float, max_length: float) -> None:
+    """
+    Ставит в чанк key seeds_per_chunk стартовых точек с ray_count начальными лучами.
+    Позиции точек однозначно определяются зерном мира и ключом чанка.
+    """
+    chunk = manager.chunks[key]
+    rng = random.Random(f"{manager.seed}:seed:{key[0]}:{key[1]}")
+    margin_x = int(chunk.width * SEED_MARGIN)
+    margin_y = int(chunk.height * SEED_MARGIN)
+    for _ in range(seeds_per_chunk):
+        start_point = CellPoint(rng.randint(chunk.x + margin_x, chunk.x + chunk.width - 1 - margin_x),
+                                rng.randint(chunk.y + margin_y, chunk.y + chunk.height - 1 - margin_y))
+        initial_rays = generate_initial_rays(start_point, ray_count=ray_count, min_length=min_length,
+                                             max_length=max_length, rng=manager.emission_rng(start_point))
+        start_point.has_emitted = True
+        for vec, _ in initial_rays:
+            chunk.add_line(CellLine(start_point, CellPoint(start_point.x + vec[0], start_point.y + vec[1])))
+
+
+def tile_segments(manager: ChunkManager, key: Tuple[int, int], scale: float = 1.0) -> Tuple[np.ndarray, int]:
+    """
+    Возвращает отрезки (N, 4) чанка key и его соседей, которые пересекают прямоугольник чанка,
+    и уровень детализации. При scale < 1 (пикселей на единицу мира) берутся упрощенные
+    линии уровня ChunkLOD, выбранного по масштабу, иначе – линии чанков как есть.
+    """
+    chunk = manager.chunks[key]
+    level = 0
+    parts = []
+    for k in [key] + manager.get_neighbor_keys(key):
+        if k not in manager.chunks:
+            continue
+        data = None
+        if scale < 1:
+            level, data = manager.chunk_lod(k).select(scale, density=False)
+        parts.append(manager.chunks[k].geometry.segments() if data is None else data)
+    segments = np.concatenate(parts).astype(np.int64) if parts else np.empty((0, 4), dtype=np.int64)
+    x0, y0 = chunk.x, chunk.y
+    x1, y1 = chunk.x + chunk.width, chunk.y + chunk.height
+    # Отбор по охватывающим прямоугольникам: отрезок короче чанка, лишние попадают только в углах
+    inside = ((np.minimum(segments[:, 0], segments[:, 2]) <= x1) & (np.maximum(segments[:, 0], segments[:, 2]) >= x0)
+              & (np.minimum(segments[:, 1], segments[:, 3]) <= y1) & (np.maximum(segments[:, 1], segments[:, 3]) >= y0))
+    return segments[inside], level
+
+
+def rasterize(segments: np.ndarray, x0: int, y0: int, width: int, height: int, scale: float = 1.0) -> np.ndarray:
+    """
+    Рисует отрезки в изображение (height * scale, width * scale) uint8: линии – 255, фон – 0.
+    Каждый отрезок заменяется точками с шагом не больше пикселя; точки вне изображения отбрасываются.
+    """
+    out_w = max(1, int(round(width * scale)))
+    out_h = max(1, int(round(height * scale)))
+    image = np.zeros((out_h, out_w), dtype=np.uint8)
+    if not len(segments):
+        return image
+    p = (segments.astype(np.float64) - (x0, y0, x0, y0)) * scale
+    counts = np.ceil(np.hypot(p[:, 2] - p[:, 0], p[:, 3] - p[:, 1])).astype(np.int64) + 1
+    owner = np.repeat(np.arange(len(p)), counts)
+    # Параметр t в [0, 1] вдоль каждого отрезка
+    t = (np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)) / np.repeat(np.maximum(counts - 1, 1), counts)
+    xs = np.floor(p[owner, 0] + (p[owner, 2] - p[owner, 0]) * t).astype(np.int64)
+    ys = np.floor(p[owner, 1] + (p[owner, 3] - p[owner, 1]) * t).astype(np.int64)
+    visible = (xs >= 0) & (xs < out_w) & (ys >= 0) & (ys < out_h)
+    image[ys[visible], xs[visible]] = 255
+    return image
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """
+    Кодирует изображение uint8 (высота, ширина) в PNG в оттенках серого (8 бит, без фильтров).
+    """
+    height, width = image.shape
+
+    def png_chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # Каждая строка начинается с байта фильтра 0 (None)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), image]).tobytes()
+    return (b"\x89PNG\r\n\x1a\n"
+            + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + png_chunk(b"IDAT", zlib.compress(raw, 6))
+            + png_chunk(b"IEND", b""))
+
+
+def write_tile(manager: ChunkManager, key: Tuple[int, int], output: str, fmt: str, scale: float) -> int:
+    """
+    Записывает тайл чанка key в каталог output и возвращает число отрезков в нем.
+    """
+    chunk = manager.chunks[key]
+    segments, level = tile_segments(manager, key, scale)
+    if fmt == "png":
+        data = encode_png(rasterize(segments, chunk.x, chunk.y, chunk.width, chunk.height, scale))
+        with open(os.path.join(output, f"{key[0]}_{key[1]}.png"), "wb") as file:
+            file.write(data)
+    else:
+        tile = {"key": list(key), "bounds": [chunk.x, chunk.y, chunk.width, chunk.height], "level": level,
+                "segments": segments.tolist()}
+        with open(os.path.join(output, f"{key[0]}_{key[1]}.json"), "w") as file:
+            json.dump(tile, file, separators=(",", ":"))
+    return len(segments)
+
+
+def generate_world(output: str, seed: int, width: int, height: int, chunk_size: int = 250,
+                   child_count: int = 3, child_min_length: float = 40, child_max_length: float = 60,
+                   child_max_deviation: float = math.radians(90), seeds_per_chunk: int = 1, ray_count: int = 3,
+                   min_length: float = 50, max_length: float = 80, max_iterations: int = 100,
+                   connection_threshold: Optional[float] = 10, fmt: str = "png", scale: float = 1.0,
+                   workers: Optional[int] = None, log=None) -> Dict[str, Any]:
+    """
+    Генерирует мир width x height чанков и пишет тайлы в каталог output (см. описание модуля).
+
+    Аргументы:
+        child_count, child_min_length, child_max_length, child_max_deviation: параметры дочерних
+            лучей (см. ChunkManager.configure_rays).
+        max_iterations: наибольшее число вызовов expand_structure на строку; если строка
+            не насытилась за это число шагов, ее фронтир замораживается недорасширенным.
+        workers: передается в expand_structure (параллельное расширение по цветовым классам).
+        log: файл для строк прогресса (None – без вывода).
+
+    Returns:
+        Dict[str, Any]: сводка генерации (она же записывается в world.json).
+    """
+    if fmt not in ("png", "vector"):
+        raise ValueError(f"Unknown tile format: {fmt!r}")
+    if 2 * max(max_length, child_max_length) + (connection_threshold or 0) >= chunk_size:
+        # Иначе испускание может дотянуться через строку, и построчная заморозка неверна;
+        # сварка удлиняет луч не больше чем на connection_threshold
+        raise ValueError("chunk_size must exceed twice the maximum line length plus connection_threshold")
+    os.makedirs(output, exist_ok=True)
+    manager = ChunkManager((0, 0), chunk_size, chunk_size, seed=seed)
+    manager.configure_rays(child_count, child_min_length, child_max_length, child_max_deviation)
+    started = time.perf_counter()
+    tiles = segments = iterations = peak_chunks = 0
+
+    def in_world(key: Tuple[int, int]) -> bool:
+        return 0 <= key[0] < width and 0 <= key[1] < height
+
+    def flush(row: int) -> None:
+        nonlocal tiles, segments
+        if 0 <= row < height:
+            for i in range(width):
+                segments += write_tile(manager, (i, row), output, fmt, scale)
+                tiles += 1
+        manager.discard_chunks([key for key in manager.chunks if key[1] <= row - 1])
+
+    for j in range(height):
+        row = [(i, j) for i in range(width)]
+        for key in row:
+            manager.load_chunk(key)
+        # Соседи за границей мира не нужны: линии, ушедшие за нее, отбрасываются
+        manager.discard_chunks([key for key in manager.chunks if not in_world(key)])
+        for key in row:
+            seed_chunk(manager, key, seeds_per_chunk, ray_count, min_length, max_length)
+        for _ in range(max_iterations):
+            iterations += 1
+            if not manager.expand_structure(connection_threshold, workers=workers):
+                break
+        for i in range(width):
+            if (i, j - 1) in manager.chunks:
+                manager.chunks[(i, j - 1)].need_expand = False
+        peak_chunks = max(peak_chunks, len(manager.chunks))
+        flush(j - 3)
+        if log is not None:
+            print(f"row {j + 1}/{height}: {len(manager.chunks)} chunks in memory, {tiles} tiles written",
+                  file=log)
+    # Последние строки: расширять больше нечего, остается записать их по порядку
+    for row in range(height - 3, height):
+        flush(row)
+    manager.close()
+
+    summary = {
+        "seed": seed, "width": width, "height": height, "chunk_size": chunk_size,
+        "child_count": child_count, "child_min_length": child_min_length, "child_max_length": child_max_length,
+        "child_max_deviation": child_max_deviation, "seeds_per_chunk": seeds_per_chunk, "ray_count": ray_count,
+        "min_length": min_length, "max_length": max_length, "connection_threshold": connection_threshold,
+        "format": fmt, "scale": scale, "tiles": tiles, "tile_segments": segments,
+        "expand_calls": iterations, "peak_chunks": peak_chunks,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    with open(os.path.join(output, "world.json"), "w") as file:
+        json.dump(summary, file, indent=2)
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Headless world generator writing chunk tiles to disk")
+    parser.add_argument("output", help="output directory")
+    parser.add_argument("--seed", type=int, default=1, help="world seed (default 1)")
+    parser.add_argument("--width", type=int, default=8, help="world width in chunks (default 8)")
+    parser.add_argument("--height", type=int, default=8, help="world height in chunks (default 8)")
+    parser.add_argument("--chunk-size", type=int, default=250, help="chunk side in pixels (default 250)")
+    parser.add_argument("--child-count", type=int, default=3, help="child rays per point (default 3)")
+    parser.add_argument("--child-min-length", type=float, default=40, help="child ray min length (default 40)")
+    parser.add_argument("--child-max-length", type=float, default=60, help="child ray max length (default 60)")
+    parser.add_argument("--child-max-deviation", type=float, default=90,
+                        help="child ray max deviation in degrees (default 90)")
+    parser.add_argument("--seeds-per-chunk", type=int, default=1, help="start points per chunk (default 1)")
+    parser.add_argument("--ray-count", type=int, default=3, help="initial rays per start point (default 3)")
+    parser.add_argument("--min-length", type=float, default=50, help="initial ray min length (default 50)")
+    parser.add_argument("--max-length", type=float, default=80, help="initial ray max length (default 80)")
+    parser.add_argument("--max-iterations", type=int, default=100,
+                        help="expand_structure calls per row at most (default 100)")
+    parser.add_argument("--connection-threshold", type=float, default=10,
+                        help="vertex welding distance, negative to disable (default 10)")
+    parser.add_argument("--format", choices=["png", "vector"], default="png", help="tile format (default png)")
+    parser.add_argument("--scale", type=float, default=1.0, help="tile pixels per world unit; below 1 tiles use LOD geometry (default 1)")
+    parser.add_argument("--workers", type=int, default=None, help="parallel expansion processes")
+    parser.add_argument("--quiet", action="store_true", help="no progress output")
+    args = parser.parse_args()
+
+    summary = generate_world(args.output, args.seed, args.width, args.height, chunk_size=args.chunk_size,
+                             child_count=args.child_count, child_min_length=args.child_min_length,
+                             child_max_length=args.child_max_length,
+                             child_max_deviation=math.radians(args.child_max_deviation), seeds_per_chunk=args.seeds_per_chunk,
+                             ray_count=args.ray_count, min_length=args.min_length, max_length=args.max_length,
+                             max_iterations=args.max_iterations,
+                             connection_threshold=None if args.connection_threshold < 0 else args.connection_threshold,
+                             fmt=args.format, scale=args.scale, workers=args.workers,
+                             log=None if args.quiet else sys.stderr)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# generation_worker.py
+import itertools
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chunk import Chunk
+from chunk_lod import ChunkLOD
+from chunk_manager import ChunkManager
+from chunk_streamer import ChunkStreamer, View
+
+# Приоритеты заданий: загрузка чанка по клику выполняется раньше фонового расширения
+PRIORITY_LOAD = 0
+PRIORITY_EXPAND = 1
+
+
+class ChunkSnapshot:
+    """
+    Неизменяемая копия чанка для отрисовки: границы, need_expand, отрезки линий и LOD.
+
+    Атрибуты:
+        key (Tuple[int, int]): ключ чанка.
+        x, y, width, height (int): границы чанка.
+        need_expand (bool): флаг need_expand чанка.
+        segments (np.ndarray): отрезки линий чанка (N, 4) int32 вида (x1, y1, x2, y2).
+        lod (Optional[ChunkLOD]): LOD чанка на момент снимка (объект не меняется после построения);
+            None – еще не построен.
+        version (tuple): версия чанка; меняется, когда у чанка появляются линии, меняется need_expand
+            или перестраивается LOD.
+    """
+
+    __slots__ = ("key", "x", "y", "width", "height", "need_expand", "segments", "lod", "version")
+
+    def __init__(self, key: Tuple[int, int], x: int, y: int, width: int, height: int,
+                 need_expand: bool, segments: np.ndarray, lod: Optional[ChunkLOD] = None) -> None:
+        self.key: Tuple[int, int] = key
+        self.x: int = x
+        self.y: int = y
+        self.width: int = width
+        self.height: int = height
+        self.need_expand: bool = need_expand
+        self.segments: np.ndarray = segments
+        self.lod: Optional[ChunkLOD] = lod
+        self.version: tuple = (len(segments), need_expand, -1 if lod is None else lod.edge_count)
+
+    @staticmethod
+    def version_of(chunk: Chunk) -> tuple:
+        return chunk.geometry.edge_count, chunk.need_expand, -1 if chunk.lod is None else chunk.lod.edge_count
+
+    @classmethod
+    def from_chunk(cls, chunk: Chunk) -> "ChunkSnapshot":
+        return cls(chunk.grid_pos, chunk.x, chunk.y, chunk.width, chunk.height, chunk.need_expand,
+                   chunk.geometry.segments().astype(np.int32), chunk.lod)
+
+    def contains(self, x: int, y: int) -> bool:
+        # Те же границы, что в Chunk.contains
+        return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
+
+    def __repr__(self) -> str:
+        return f"ChunkSnapshot(key={self.key}, need_expand={self.need_expand}, lines={len(self.segments)})"
+
+
+class GenerationWorker:
+    """
+    Фоновая генерация структуры в отдельном потоке.
+
+    Поток выполняет задания из очереди с приоритетами: загрузка чанка (submit_load) выполняется
+    раньше фонового расширения (submit_expand). Расширение идет квантами expand_structure
+    с time_budget_ms=slice_ms, и между квантами поток проверяет, не появилось ли задание
+    с более высоким приоритетом. После каждого задания или кванта снимки изменившихся чанков
+    (ChunkSnapshot) публикуются в очередь, которую цикл отрисовки разбирает методом drain
+    с ограничением по времени. Сам цикл отрисовки к менеджеру чанков не обращается и поэтому
+    никогда не ждет генерацию.
+
+    Если задан streamer, поле зрения передается методом set_view, и пока кольцо загрузки
+    не загружено или структура в нем растет, поток выполняет такты streamer.update вместо
+    квантов расширения.
+
+    После start() к chunk_manager обращается только поток генерации.
+
+    Атрибуты:
+        chunk_manager (ChunkManager): менеджер чанков, которым владеет поток.
+        slice_ms (float): бюджет одного кванта расширения в миллисекундах.
+        truncation (str): способ усечения лучей для expand_structure.
+        streamer (Optional[ChunkStreamer]): потоковая загрузка чанков вокруг поля зрения.
+    """
+
+    def __init__(self, chunk_manager: ChunkManager, slice_ms: float = 4.0, truncation: str = "index",
+                 streamer: Optional[ChunkStreamer] = None) -> None:
+        self.chunk_manager: ChunkManager = chunk_manager
+        self.slice_ms: float = slice_ms
+        self.truncation: str = truncation
+        self.streamer: Optional[ChunkStreamer] = streamer
+        # Последнее поле зрения и скорость камеры; _streaming – в кольце загрузки еще есть работа
+        self._view: Optional[Tuple[View, Tuple[float, float]]] = None
+        self._streaming: bool = False
+        self._jobs: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._updates: "queue.Queue[ChunkSnapshot]" = queue.Queue()
+        self._order = itertools.count()
+        self._versions: Dict[Tuple[int, int], tuple] = {}
+        # Число оставшихся проходов расширения и испусканий во всех квантах текущего прохода
+        self._passes: int = 0
+        self._pass_steps: int = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Интерфейс цикла отрисовки ---
+
+    def start(self) -> None:
+        """
+        Публикует снимки всех чанков и запускает поток генерации.
+        """
+        self._publish_changes()
+        self._thread = threading.Thread(target=self._run, name="generation-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Останавливает поток генерации; текущий квант расширения дорабатывает до конца.
+        """
+        self._stop.set()
+        self._jobs.put((-1, next(self._order), None))
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit_load(self, key: Tuple[int, int]) -> None:
+        """
+        Ставит загрузку чанка key в очередь с наивысшим приоритетом.
+        """
+        self._jobs.put((PRIORITY_LOAD, next(self._order), ("load", key)))
+
+    def submit_expand(self, passes: int = 1) -> None:
+        """
+        Добавляет passes проходов расширения в фоновую работу.
+        """
+        self._jobs.put((PRIORITY_EXPAND, next(self._order), ("expand", passes)))
+
+    def set_view(self, view: View, velocity: Tuple[float, float] = (0.0, 0.0)) -> None:
+        """
+        Передает потоку поле зрения и скорость камеры (пикселей в секунду) для streamer.
+        """
+        self._jobs.put((PRIORITY_LOAD, next(self._order), ("view", (view, velocity))))
+
+    def drain(self, budget_ms: float) -> List[ChunkSnapshot]:
+        """
+        Забирает из очереди опубликованные снимки, пока очередь не опустеет или не истечет budget_ms.
+        Не блокируется.
+        """
+        deadline = time.perf_counter() + budget_ms / 1000
+        snapshots = []
+        while time.perf_counter() < deadline:
+            try:
+                snapshots.append(self._updates.get_nowait())
+            except queue.Empty:
+                break
+        return snapshots
+
+    def busy(self) -> bool:
+        """
+        Возвращает True, если есть невыполненные задания или проходы расширения.
+        """
+        return self._passes > 0 or self._streaming or not self._jobs.empty()
+
+    # --- Поток генерации ---
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Без фоновой работы поток ждет задание; иначе только проверяет очередь между квантами
+            try:
+                if self._passes > 0 or self._streaming:
+                    _, _, job = self._jobs.get_nowait()
+                else:
+                    _, _, job = self._jobs.get()
+            except queue.Empty:
+                job = None
+
+            if job is None:
+                if self._stop.is_set():
+                    continue
+                if self._streaming:
+                    self._stream_tick()
+                elif self._passes > 0:
+                    self._expand_slice()
+                continue
+            kind, value = job
+            if kind == "load":
+                self.chunk_manager.load_chunk(value)
+                self._publish_changes()
+            elif kind == "expand":
+                self._passes += value
+            elif kind == "view" and self.streamer is not None:
+                self._view = value
+                self._streaming = True
+
+    def _expand_slice(self) -> None:
+        manager = self.chunk_manager
+        self._pass_steps += manager.expand_structure(truncation=self.truncation, time_budget_ms=self.slice_ms)
+        if manager.expand_cursor is None:
+            # Проход завершен; если за весь проход расширять было нечего, оставшиеся проходы не нужны
+            self._passes = self._passes - 1 if self._pass_steps else 0
+            self._pass_steps = 0
+        self._publish_changes()
+
+    def _stream_tick(self) -> None:
+        view, velocity = self._view
+        tick = self.streamer.update(view, velocity)
+        # Кольцо загружено и расти нечему – поток ждет нового поля зрения или задания
+        self._streaming = bool(tick.loaded or tick.unloaded or tick.pending or tick.steps)
+        self._publish_changes()
+
+    def _publish_changes(self) -> None:
+        versions = self._versions
+        chunks = self.chunk_manager.chunks
+        # Вытесненный чанк после восстановления публикуется заново
+        for key in [key for key in versions if key not in chunks]:
+            del versions[key]
+        for key, chunk in chunks.items():
+            version = ChunkSnapshot.version_of(chunk)
+            if versions.get(key) != version:
+                versions[key] = version
+                self._updates.put(ChunkSnapshot.from_chunk(chunk))
+
+    def __repr__(self) -> str:
+        return f"GenerationWorker(passes={self._passes}, jobs={self._jobs.qsize()}, updates={self._updates.qsize()})"
@@ -0,0 +1,257 @@
+# half_edge.py
+import math
+from array import array
+from bisect import bisect_right
+from typing import Dict, Hashable, List, Tuple
+
+
+class HalfEdgeMesh:
+    """
+    Полурёберная структура графа линий для инкрементального выделения граней (ячеек).
+
+    Каждое ребро e хранится двумя полурёбрами: 2 * e (от начала к концу) и 2 * e + 1 (обратно),
+    так что парное полуребро h – это h ^ 1. Исходящие полурёбра каждой вершины упорядочены
+    по углу (вращение вершины). Следующее полуребро грани для h = u -> v – исходящее из v
+    полуребро, предшествующее h ^ 1 во вращении v; при таком обходе грань лежит слева,
+    и ограниченные грани имеют положительную ориентированную площадь.
+
+    Новое ребро меняет только грани, которые проходят через углы его концов: они удаляются,
+    а новые грани обходятся от двух новых полурёбер в rebuild. Грань длиннее max_cell_edges
+    не обходится до конца и ячейкой не считается – так внешняя граница структуры, которая
+    растет вместе с ней, не обходится при каждом добавлении, и стоимость обновления
+    пропорциональна размеру изменения. Удаление ребра (remove_edge) так же удаляет две грани
+    по его сторонам, и rebuild обходит слитую грань. Индексы удаленных ребер и вершин
+    без ребер используются повторно, поэтому память структуры ограничена числом ребер в ней.
+
+    Обход граней предполагает планарный граф. Если ребра пересекаются вне вершин, грани
+    вокруг пересечения обходятся так, будто пересечения нет: ячейки там приблизительны.
+
+    Атрибуты:
+        max_cell_edges (int): наибольшее число полурёбер в ячейке.
+        vertex_ids (Dict[Tuple[int, int], int]): координаты -> индекс вершины.
+        vertex_refs (List[Hashable]): внешняя ссылка на каждую вершину.
+        xy (array): координаты вершин (int32), по две на вершину.
+        dest (array): вершина, в которую ведет каждое полуребро.
+        face_of (array): ячейка каждого полуребра (-1 – полуребро не на границе ячейки).
+        edge_refs (List[Hashable]): внешняя ссылка на каждое ребро (линию); None – ребро удалено.
+        cells (Dict[int, List[int]]): ячейка -> полурёбра ее границы в порядке обхода.
+    """
+
+    def __init__(self, max_cell_edges: int = 256) -> None:
+        self.max_cell_edges: int = max_cell_edges
+        self.vertex_ids: Dict[Tuple[int, int], int] = {}
+        self.vertex_refs: List[Hashable] = []
+        self.xy: array = array("i")
+        self._out: List[List[int]] = []
+        self._out_angles: List[List[float]] = []
+        self.dest: array = array("i")
+        self.face_of: array = array("i")
+        self.edge_refs: List[Hashable] = []
+        self.cells: Dict[int, List[int]] = {}
+        self._next_cell: int = 0
+        self._dirty: List[int] = []
+        self._removed: Dict[int, List[Hashable]] = {}
+        self._free_edges: List[int] = []
+        self._free_vertices: List[int] = []
+
+    @property
+    def edge_count(self) -> int:
+        """
+        Число ребер в структуре (без удаленных).
+        """
+        return (len(self.dest) >> 1) - len(self._free_edges)
+
+    def vertex(self, x: int, y: int, ref: Hashable = None) -> int:
+        """
+        Возвращает индекс вершины с координатами (x, y), при необходимости добавляя ее.
+        Вершины с одинаковыми координатами совпадают; ref запоминается при добавлении.
+        """
+        index = self.vertex_ids.get((x, y))
+        if index is not None:
+            return index
+        if self._free_vertices:
+            index = self._free_vertices.pop()
+            self.vertex_refs[index] = ref
+            self.xy[2 * index] = x
+            self.xy[2 * index + 1] = y
+        else:
+            index = len(self.vertex_refs)
+            self.vertex_refs.append(ref)
+            self.xy.append(x)
+            self.xy.append(y)
+            self._out.append([])
+            self._out_angles.append([])
+        self.vertex_ids[(x, y)] = index
+        return index
+
+    def origin(self, half_edge: int) -> int:
+        return self.dest[half_edge ^ 1]
+
+    def next_half_edge(self, half_edge: int) -> int:
+        """
+        Возвращает следующее полуребро грани, лежащей слева от half_edge.
+        """
+        out = self._out[self.dest[half_edge]]
+        return out[out.index(half_edge ^ 1) - 1]
+
+    def find_half_edge(self, start: int, end: int) -> int:
+        """
+        Возвращает полуребро из start в end или -1, если таких вершин не соединяет ни одно ребро.
+        """
+        dest = self.dest
+        for half_edge in self._out[start]:
+            if dest[half_edge] == end:
+                return half_edge
+        return -1
+
+    def corner_half_edge(self, vertex: int, x: float, y: float) -> int:
+        """
+        Возвращает исходящее из vertex полуребро, слева от которого лежит угол вершины в направлении
+        точки (x, y): грань этого полуребра примыкает к вершине с этой стороны. -1 – у вершины нет ребер.
+        """
+        out = self._out[vertex]
+        if not out:
+            return -1
+        angle = math.atan2(y - self.xy[2 * vertex + 1], x - self.xy[2 * vertex])
+        # Последнее полуребро с углом не больше направления на точку (по кругу)
+        return out[bisect_right(self._out_angles[vertex], angle) - 1]
+
+    def add_edge(self, start: int, end: int, ref: Hashable) -> int:
+        """
+        Добавляет ребро между вершинами start и end и возвращает индекс его первого полуребра.
+        Ячейки, которые разрезает или сливает новое ребро, удаляются; новые появятся после rebuild.
+        """
+        if self._free_edges:
+            edge = self._free_edges.pop()
+            half_edge = 2 * edge
+            self.dest[half_edge] = end
+            self.dest[half_edge + 1] = start
+            self.edge_refs[edge] = ref
+        else:
+            half_edge = len(self.dest)
+            self.dest.append(end)
+            self.dest.append(start)
+            self.face_of.append(-1)
+            self.face_of.append(-1)
+            self.edge_refs.append(ref)
+        xy = self.xy
+        for vertex, h, other in ((start, half_edge, end), (end, half_edge + 1, start)):
+            angle = math.atan2(xy[2 * other + 1] - xy[2 * vertex + 1], xy[2 * other] - xy[2 * vertex])
+            out = self._out[vertex]
+            angles = self._out_angles[vertex]
+            position = bisect_right(angles, angle)
+            out.insert(position, h)
+            angles.insert(position, angle)
+            if len(out) > 1:
+                # Полуребро, входящее в угол, куда встало новое ребро, теперь продолжается по h
+                self._remove_cell(self.face_of[out[(position + 1) % len(out)] ^ 1])
+        self._dirty.append(half_edge)
+        self._dirty.append(half_edge + 1)
+        return half_edge
+
+    def remove_edge(self, half_edge: int) -> None:
+        """
+        Удаляет ребро полуребра half_edge (индекс, возвращенный add_edge). Ячейки по обе стороны
+        ребра удаляются; слитая грань появится после rebuild. Вершина, у которой не осталось ребер,
+        тоже удаляется.
+        """
+        half_edge &= ~1
+        self._remove_cell(self.face_of[half_edge])
+        self._remove_cell(self.face_of[half_edge + 1])
+        for h in (half_edge, half_edge + 1):
+            vertex = self.dest[h ^ 1]
+            out = self._out[vertex]
+            position = out.index(h)
+            del out[position]
+            del self._out_angles[vertex][position]
+            if out:
+                # Полуребро, которое продолжалось по h, теперь продолжается по предыдущему во вращении
+                self._dirty.append(out[position % len(out)] ^ 1)
+            else:
+                del self.vertex_ids[(self.xy[2 * vertex], self.xy[2 * vertex + 1])]
+                self.vertex_refs[vertex] = None
+                self._free_vertices.append(vertex)
+        self.edge_refs[half_edge >> 1] = None
+        self._free_edges.append(half_edge >> 1)
+
+    def _remove_cell(self, cell: int) -> None:
+        half_edges = self.cells.pop(cell, None)
+        if half_edges is None:
+            return
+        face_of = self.face_of
+        for h in half_edges:
+            face_of[h] = -1
+        # Ссылки запоминаются сразу: индексы ребер ячейки могут быть заняты новыми ребрами до rebuild
+        self._removed[cell] = [self.edge_refs[edge] for edge in self.cell_edges(half_edges)]
+
+    def signed_area(self, half_edges: List[int]) -> float:
+        """
+        Возвращает ориентированную площадь цикла полурёбер.
+        """
+        xy = self.xy
+        dest = self.dest
+        total = 0
+        for h in half_edges:
+            a = 2 * dest[h ^ 1]
+            b = 2 * dest[h]
+            total += xy[a] * xy[b + 1] - xy[b] * xy[a + 1]
+        return total / 2
+
+    def rebuild(self) -> Tuple[Dict[int, List[int]], List[int]]:
+        """
+        Обходит грани, затронутые ребрами, добавленными или удаленными после прошлого вызова.
+
+        Returns:
+            (удаленные, новые): удаленные ячейки (ячейка -> внешние ссылки ребер ее границы
+            без повторов) и индексы новых ячеек.
+        """
+        removed = self._removed
+        dirty = self._dirty
+        self._removed = {}
+        self._dirty = []
+        face_of = self.face_of
+        limit = self.max_cell_edges
+        visited = set()
+        added = []
+        edge_refs = self.edge_refs
+        for h in dirty:
+            if h in visited or face_of[h] >= 0 or edge_refs[h >> 1] is None:
+                continue
+            cycle = [h]
+            visited.add(h)
+            current = self.next_half_edge(h)
+            closed = True
+            while current != h:
+                # Уже пройденное полуребро – часть незамкнутого в пределах limit обхода
+                if len(cycle) >= limit or current in visited:
+                    closed = False
+                    break
+                cycle.append(current)
+                visited.add(current)
+                current = self.next_half_edge(current)
+            if not closed or self.signed_area(cycle) <= 0:
+                continue
+            cell = self._next_cell
+            self._next_cell += 1
+            self.cells[cell] = cycle
+            for half_edge in cycle:
+                face_of[half_edge] = cell
+            added.append(cell)
+        return removed, added
+
+    def cell_edges(self, half_edges: List[int]) -> List[int]:
+        """
+        Возвращает ребра границы ячейки без повторов (висячее ребро внутри ячейки входит
+        в ее границу обоими полурёбрами).
+        """
+        return list(dict.fromkeys(h >> 1 for h in half_edges))
+
+    def cell_xy(self, cell: int) -> List[Tuple[int, int]]:
+        """
+        Возвращает координаты вершин ячейки в порядке обхода.
+        """
+        xy = self.xy
+        return [(xy[2 * self.dest[h ^ 1]], xy[2 * self.dest[h ^ 1] + 1]) for h in self.cells[cell]]
+
+    def __repr__(self) -> str:
+        return f"HalfEdgeMesh(vertices={len(self.vertex_refs)}, edges={self.edge_count}, cells={len(self.cells)})"
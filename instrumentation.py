@@ -0,0 +1,123 @@
+# instrumentation.py
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Фазы расширения, по которым собирается время:
+#   generate – снятие точек с фронтира и генерация дочерних лучей;
+#   weld – сварка концов лучей с ближайшими вершинами;
+#   own_lines – усечение лучей линиями расширяемого чанка (режим truncation="brute", а также лучи,
+#     измененные сваркой);
+#   neighbor_lines – то же для линий соседних чанков;
+#   chunk_lines – усечение линиями чанка и соседей вместе: пакетный поиск первого пересечения
+#     и проверки после него (режимы truncation="index" и "batch");
+#   new_lines – усечение линиями, созданными в этом же проходе;
+#   routing – поиск чанка для новых линий (get_chunk_for_point) и их добавление.
+PHASES = ("generate", "weld", "own_lines", "neighbor_lines", "chunk_lines", "new_lines", "routing")
+# Фазы, в которых выполняются проверки пересечений
+TRUNCATION_PHASES = ("own_lines", "neighbor_lines", "chunk_lines", "new_lines")
+
+
+class ExpansionCounters:
+    """
+    Счетчики расширения: время по фазам, проверки пересечений и попадания по фазам усечения,
+    время и число испусканий по чанкам.
+
+    Атрибуты:
+        calls (int): число вызовов expand_structure.
+        steps (int): число точек, испустивших лучи.
+        seconds (float): общее время вызовов expand_structure.
+        phase_seconds (Dict[str, float]): время по фазам (см. PHASES).
+        tallies (Dict[str, List[int]]): фаза усечения -> [проверки, попадания].
+        rays (int): число дочерних лучей, прошедших усечение.
+        truncated (int): сколько из них усечено пересечением.
+        chunk_seconds (Dict[Tuple[int, int], float]): время расширения по чанкам.
+        chunk_steps (Dict[Tuple[int, int], int]): число испусканий по чанкам.
+    """
+
+    def __init__(self) -> None:
+        self.calls: int = 0
+        self.steps: int = 0
+        self.seconds: float = 0.0
+        self.phase_seconds: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.tallies: Dict[str, List[int]] = {phase: [0, 0] for phase in TRUNCATION_PHASES}
+        self.rays: int = 0
+        self.truncated: int = 0
+        self.chunk_seconds: Dict[Tuple[int, int], float] = {}
+        self.chunk_steps: Dict[Tuple[int, int], int] = {}
+
+    def add_chunk(self, key: Tuple[int, int], steps: int, seconds: float) -> None:
+        self.chunk_steps[key] = self.chunk_steps.get(key, 0) + steps
+        self.chunk_seconds[key] = self.chunk_seconds.get(key, 0.0) + seconds
+
+    def merge(self, other: "ExpansionCounters") -> None:
+        """
+        Прибавляет к счетчикам значения other.
+        """
+        self.calls += other.calls
+        self.steps += other.steps
+        self.seconds += other.seconds
+        for phase, seconds in other.phase_seconds.items():
+            self.phase_seconds[phase] += seconds
+        for phase, (tests, hits) in other.tallies.items():
+            self.tallies[phase][0] += tests
+            self.tallies[phase][1] += hits
+        self.rays += other.rays
+        self.truncated += other.truncated
+        for key, seconds in other.chunk_seconds.items():
+            self.add_chunk(key, other.chunk_steps[key], seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        tests = sum(tally[0] for tally in self.tallies.values())
+        hits = sum(tally[1] for tally in self.tallies.values())
+        intersections = {phase: {"tests": tally[0], "hits": tally[1]} for phase, tally in self.tallies.items()}
+        intersections["total"] = {"tests": tests, "hits": hits}
+        return {
+            "calls": self.calls,
+            "steps": self.steps,
+            "seconds": self.seconds,
+            "phases": dict(self.phase_seconds),
+            "intersections": intersections,
+            "rays": {"total": self.rays, "truncated": self.truncated},
+            "chunks": {key: {"steps": self.chunk_steps[key], "seconds": seconds}
+                       for key, seconds in self.chunk_seconds.items()},
+        }
+
+    def __repr__(self) -> str:
+        return f"ExpansionCounters(calls={self.calls}, steps={self.steps}, seconds={self.seconds:.6f})"
+
+
+class Instrumentation:
+    """
+    Сбор статистики расширения ChunkManager (см. ChunkManager.enable_instrumentation).
+
+    Счетчики текущего вызова expand_structure копятся в current и по завершении вызова
+    прибавляются к totals; если задан callback, он получает счетчики вызова в виде словаря.
+
+    Атрибуты:
+        totals (ExpansionCounters): счетчики с момента включения (или reset).
+        current (ExpansionCounters): счетчики текущего вызова expand_structure.
+        callback (Optional[Callable[[Dict[str, Any]], None]]): функция, вызываемая после
+            каждого вызова expand_structure.
+    """
+
+    def __init__(self, callback: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
+        self.totals: ExpansionCounters = ExpansionCounters()
+        self.current: ExpansionCounters = ExpansionCounters()
+        self.callback: Optional[Callable[[Dict[str, Any]], None]] = callback
+
+    def begin_call(self) -> None:
+        self.current = ExpansionCounters()
+
+    def end_call(self, steps: int, seconds: float) -> None:
+        current = self.current
+        current.calls = 1
+        current.steps = steps
+        current.seconds = seconds
+        self.totals.merge(current)
+        if self.callback is not None:
+            self.callback(current.as_dict())
+
+    def reset(self) -> None:
+        self.totals = ExpansionCounters()
+
+    def __repr__(self) -> str:
+        return f"Instrumentation(totals={self.totals})"
@@ -0,0 +1,180 @@
+# parameter_sweep.py
+"""
+Перебор параметров генерации по сетке без Pygame и дисплея.
+
+Запуск:
+    python parameter_sweep.py --seeds 1 2 3 --child-count 2 3 4 --child-max-length 50 60 80 [-o table.csv]
+
+Каждое сочетание параметров сетки (декартово произведение значений) генерируется для каждого
+зерна: мир из grid_side x grid_side загруженных чанков со стартовыми точками, как
+в generate_world.py, расширяется до насыщения или iterations вызовов expand_structure.
+Прогоны распределяются по пулу процессов. По каждому прогону собираются метрики
+структуры, затем они усредняются по зернам в одну таблицу (строка на сочетание параметров):
+    edges_per_chunk – линий на загруженный чанк;
+    avg_degree – средняя степень вершины (2 * линии / различные вершины);
+    truncation_rate – доля дочерних лучей, усеченных пересечением (по Instrumentation);
+    seconds – время расширения без инструментации.
+Счетчики инструментации замедляют расширение, поэтому мир каждого прогона строится дважды:
+время измеряется с выключенной инструментацией, а доля усечений берется из второго построения
+с включенной. Мир задан зерном, поэтому оба построения дают одну и ту же структуру.
+Таблица печатается в stdout и при -o записывается в CSV.
+"""
+import argparse
+import csv
+import itertools
+import math
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from chunk_manager import ChunkManager
+from generate_world import seed_chunk
+
+# Параметры сетки и их значения по умолчанию (значения ChunkManager)
+GRID_DEFAULTS = {
+    "child_count": [ChunkManager.CHILD_COUNT],
+    "child_min_length": [ChunkManager.CHILD_MIN_LENGTH],
+    "child_max_length": [ChunkManager.CHILD_MAX_LENGTH],
+    "child_max_deviation": [round(math.degrees(ChunkManager.CHILD_MAX_DEVIATION))],
+    "connection_threshold": [10.0],
+}
+METRICS = ("edges_per_chunk", "avg_degree", "truncation_rate", "seconds", "iterations")
+
+
+def build_world(params: Dict[str, Any], instrumented: bool = False) -> Tuple[ChunkManager, int, float]:
+    """
+    Строит мир с параметрами params и возвращает (менеджер, число вызовов expand_structure,
+    время расширения в секундах). При instrumented у менеджера включена инструментация.
+    """
+    side = params["grid_side"]
+    manager = ChunkManager((0, 0), params["chunk_size"], params["chunk_size"], seed=params["seed"])
+    manager.configure_rays(params["child_count"], params["child_min_length"], params["child_max_length"],
+                           math.radians(params["child_max_deviation"]))
+    keys = [(i, j) for j in range(side) for i in range(side)]
+    for key in keys:
+        manager.load_chunk(key)
+    for key in keys:
+        seed_chunk(manager, key, seeds_per_chunk=1, ray_count=3, min_length=50, max_length=80)
+    threshold = params["connection_threshold"]
+    threshold = None if threshold < 0 else threshold
+    if instrumented:
+        manager.enable_instrumentation()
+
+    started = time.perf_counter()
+    iterations = 0
+    while iterations < params["iterations"]:
+        iterations += 1
+        if not manager.expand_structure(threshold):
+            break
+    return manager, iterations, time.perf_counter() - started
+
+
+def run_world(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Генерирует один мир с параметрами params (значения сетки, seed, grid_side, iterations,
+    chunk_size) и возвращает params, дополненные метриками прогона.
+    """
+    manager, iterations, seconds = build_world(params)
+    segments = [chunk.geometry.segments() for chunk in manager.chunks.values()]
+    segments = np.concatenate(segments) if segments else np.empty((0, 4), dtype=np.int32)
+    edges = len(segments)
+    # Общие вершины хранятся копиями в нескольких чанках – считаем различные координаты
+    vertices = len(np.unique(segments.reshape(-1, 2), axis=0)) if edges else 0
+    totals = build_world(params, instrumented=True)[0].instrumentation.totals
+    return dict(params,
+                edges=edges,
+                edges_per_chunk=edges / params["grid_side"] ** 2,
+                avg_degree=2 * edges / vertices if vertices else 0.0,
+                truncation_rate=totals.truncated / totals.rays if totals.rays else 0.0,
+                seconds=seconds,
+                iterations=iterations)
+
+
+def parameter_grid(values: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """
+    Возвращает все сочетания значений параметров values (декартово произведение) в виде словарей.
+    """
+    names = list(values)
+    return [dict(zip(names, combination)) for combination in itertools.product(*(values[name] for name in names))]
+
+
+def run_sweep(grid: Dict[str, List[Any]], seeds: List[int], grid_side: int = 3, iterations: int = 30,
+              chunk_size: int = 250, processes: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Выполняет прогоны всех сочетаний grid для всех seeds в пуле из processes процессов
+    (None – по числу процессоров, 1 – в текущем процессе) и возвращает результаты прогонов
+    в порядке сочетаний и зерен.
+    """
+    jobs = [dict(combination, seed=seed, grid_side=grid_side, iterations=iterations, chunk_size=chunk_size)
+            for combination in parameter_grid(grid) for seed in seeds]
+    if processes == 1:
+        return [run_world(job) for job in jobs]
+    with ProcessPoolExecutor(processes) as executor:
+        return list(executor.map(run_world, jobs))
+
+
+def aggregate(runs: List[Dict[str, Any]], names: List[str]) -> List[Dict[str, Any]]:
+    """
+    Сводит прогоны в таблицу: строка на сочетание параметров names со средними метрик по зернам
+    и стандартным отклонением времени.
+    """
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for run in runs:
+        groups.setdefault(tuple(run[name] for name in names), []).append(run)
+    table = []
+    for combination, group in groups.items():
+        row = dict(zip(names, combination))
+        row["seeds"] = len(group)
+        for metric in METRICS:
+            row[metric] = statistics.fmean(run[metric] for run in group)
+        row["seconds_stdev"] = statistics.pstdev(run["seconds"] for run in group)
+        table.append(row)
+    return table
+
+
+def format_table(table: List[Dict[str, Any]]) -> str:
+    """
+    Форматирует таблицу в выровненный текст.
+    """
+    if not table:
+        return ""
+    columns = list(table[0])
+    cells = [[f"{row[column]:.4g}" if isinstance(row[column], float) else str(row[column]) for column in columns]
+             for row in table]
+    widths = [max(len(column), *(len(line[n]) for line in cells)) for n, column in enumerate(columns)]
+    lines = ["  ".join(column.rjust(width) for column, width in zip(columns, widths))]
+    lines += ["  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in cells]
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Parallel sweep of generation parameters with structure metrics")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[1, 2, 3], help="world seeds (default 1 2 3)")
+    for name, default in GRID_DEFAULTS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=float if name != "child_count" else int,
+                            nargs="+", default=default, help=f"values to sweep (default {default[0]})")
+    parser.add_argument("--grid-side", type=int, default=3, help="world side in chunks (default 3)")
+    parser.add_argument("--iterations", type=int, default=30, help="expand_structure calls at most (default 30)")
+    parser.add_argument("--chunk-size", type=int, default=250, help="chunk side in pixels (default 250)")
+    parser.add_argument("--processes", type=int, default=None, help="pool size (default: CPU count)")
+    parser.add_argument("-o", "--output", help="write the table to this CSV file")
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) for name in GRID_DEFAULTS}
+    runs = run_sweep(grid, args.seeds, args.grid_side, args.iterations, args.chunk_size, args.processes)
+    table = aggregate(runs, list(grid))
+    print(format_table(table))
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=list(table[0]))
+            writer.writeheader()
+            writer.writerows(table)
+        print(f"{len(table)} rows written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# spatial_index.py
+import math
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# Размер ячейки сетки по умолчанию: чуть больше типичной длины луча (40–80),
+# чтобы отрезок обычно попадал в 1–4 ячейки.
+DEFAULT_CELL_SIZE = 64
+
+# Запас, на который расширяются прямоугольники отрезков и запроса. Координаты точек целые,
+# а допуск tol в line_intersection (1e-6) сдвигает точку пересечения на доли единицы,
+# поэтому запаса в 1 достаточно, чтобы не потерять ни одного пересечения.
+BOX_PAD = 1
+
+
+class SegmentGrid:
+    """
+    Динамический пространственный индекс отрезков на равномерной сетке.
+
+    Каждый отрезок регистрируется во всех ячейках, которые пересекает его ограничивающий
+    прямоугольник. Идентификатор отрезка – порядковый номер вставки, поэтому он совпадает
+    с индексом линии в списке чанка, и кандидаты можно перебирать в исходном порядке.
+
+    Атрибуты:
+        cell_size (float): размер ячейки сетки.
+        cells (Dict[Tuple[int, int], array]): ячейка -> идентификаторы отрезков (int32).
+        boxes (array): целочисленные прямоугольники отрезков (min_x, min_y, max_x, max_y)
+            с учётом запаса BOX_PAD, по четыре числа на отрезок.
+        bounds (Optional[Tuple[int, int, int, int]]): прямоугольник, охватывающий все boxes;
+            None – индекс пуст. Запросы обрезаются по нему.
+    """
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE) -> None:
+        self.cell_size: float = cell_size
+        self.cells: Dict[Tuple[int, int], array] = {}
+        self.boxes: array = array("i")
+        self.bounds: Optional[Tuple[int, int, int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.boxes) >> 2
+
+    def _cell_range(self, min_x: float, min_y: float, max_x: float, max_y: float):
+        size = self.cell_size
+        return (int(min_x // size), int(min_y // size),
+                int(max_x // size), int(max_y // size))
+
+    def insert(self, x1: float, y1: float, x2: float, y2: float) -> int:
+        """
+        Добавляет отрезок (x1, y1) – (x2, y2) и возвращает его идентификатор.
+        """
+        # Прямоугольник округляется наружу, поэтому хранение в целых числах его только расширяет
+        box = (math.floor(min(x1, x2)) - BOX_PAD, math.floor(min(y1, y2)) - BOX_PAD,
+               math.ceil(max(x1, x2)) + BOX_PAD, math.ceil(max(y1, y2)) + BOX_PAD)
+        segment_id = len(self.boxes) >> 2
+        self.boxes.extend(box)
+        bounds = self.bounds
+        if bounds is None:
+            self.bounds = box
+        else:
+            self.bounds = (min(bounds[0], box[0]), min(bounds[1], box[1]),
+                           max(bounds[2], box[2]), max(bounds[3], box[3]))
+        ci0, cj0, ci1, cj1 = self._cell_range(*box)
+        for ci in range(ci0, ci1 + 1):
+            for cj in range(cj0, cj1 + 1):
+                bucket = self.cells.get((ci, cj))
+                if bucket is None:
+                    self.cells[(ci, cj)] = array("i", (segment_id,))
+                else:
+                    bucket.append(segment_id)
+        return segment_id
+
+    def query_segment(self, x1: float, y1: float, x2: float, y2: float, after: int = -1) -> List[int]:
+        """
+        Возвращает отсортированные по возрастанию идентификаторы отрезков (больше after),
+        чьи прямоугольники пересекаются с прямоугольником отрезка (x1, y1) – (x2, y2).
+
+        Отрезки, не попавшие в результат, гарантированно не пересекают данный отрезок.
+
+        Прямоугольник запроса обрезается по bounds, а если он покрывает больше ячеек сетки,
+        чем занято, перебираются занятые ячейки. Поэтому стоимость запроса ограничена размером
+        индекса, а не площадью прямоугольника.
+        """
+        bounds = self.bounds
+        if bounds is None:
+            return []
+        min_x = max(min(x1, x2) - BOX_PAD, bounds[0])
+        min_y = max(min(y1, y2) - BOX_PAD, bounds[1])
+        max_x = min(max(x1, x2) + BOX_PAD, bounds[2])
+        max_y = min(max(y1, y2) + BOX_PAD, bounds[3])
+        if min_x > max_x or min_y > max_y:
+            return []
+        ci0, cj0, ci1, cj1 = self._cell_range(min_x, min_y, max_x, max_y)
+        if (ci1 - ci0 + 1) * (cj1 - cj0 + 1) > len(self.cells):
+            buckets = [bucket for (ci, cj), bucket in self.cells.items() if ci0 <= ci <= ci1 and cj0 <= cj <= cj1]
+        else:
+            buckets = [self.cells.get((ci, cj)) for ci in range(ci0, ci1 + 1) for cj in range(cj0, cj1 + 1)]
+        boxes = self.boxes
+        found = set()
+        for bucket in buckets:
+            if bucket is None:
+                continue
+            for segment_id in bucket:
+                if segment_id <= after or segment_id in found:
+                    continue
+                offset = segment_id << 2
+                if boxes[offset] <= max_x and min_x <= boxes[offset + 2] and \
+                        boxes[offset + 1] <= max_y and min_y <= boxes[offset + 3]:
+                    found.add(segment_id)
+        return sorted(found)
+
+    def nbytes(self) -> int:
+        """
+        Возвращает приблизительный объём памяти индекса: прямоугольники, ячейки и накладные
+        расходы на массив и запись словаря для каждой ячейки.
+        """
+        itemsize = self.boxes.itemsize
+        return len(self.boxes) * itemsize + sum(len(bucket) * itemsize + 150 for bucket in self.cells.values())
+
+    def __repr__(self) -> str:
+        return f"SegmentGrid(cell_size={self.cell_size}, segments={len(self)}, cells={len(self.cells)})"
@@ -0,0 +1,45 @@
+# test_benchmarks.py
+import json
+
+import pytest
+
+from benchmarks import compare_results, main
+
+
+def report(*records) -> dict:
+    return {"meta": {}, "results": [{"name": name, "metric": metric, "value": value}
+                                    for name, metric, value in records]}
+
+
+def test_compare_reports_added_removed_and_zero_baselines():
+    old = report(("a", "seconds", 1.0), ("b", "seconds", 0.0), ("c", "seconds", 0.0),
+                 ("d", "seconds", 1.0), ("e", "peak_bytes", 100))
+    new = report(("a", "seconds", 1.05), ("b", "seconds", 0.0), ("c", "seconds", 0.5),
+                 ("e", "seconds", 1.0), ("f", "seconds", 1.0))
+    rows, regressions, added, removed = compare_results(old, new, threshold=0.1)
+    assert rows == [("a", "seconds", 1.0, 1.05, pytest.approx(1.05)), ("b", "seconds", 0.0, 0.0, None),
+                    ("c", "seconds", 0.0, 0.5, None)]
+    assert regressions == ["c"]
+    assert added == [("e", "seconds", 1.0), ("f", "seconds", 1.0)]
+    assert removed == [("d", "seconds", 1.0), ("e", "peak_bytes", 100)]
+
+
+def test_compare_exits_with_code_1_only_on_regressions(tmp_path, capsys):
+    paths = []
+    for n, records in enumerate([[("a", "seconds", 1.0), ("b", "seconds", 1.0)],
+                                 [("a", "seconds", 1.05), ("c", "seconds", 9.0)],
+                                 [("a", "seconds", 1.5)]]):
+        paths.append(str(tmp_path / f"{n}.json"))
+        with open(paths[-1], "w") as file:
+            json.dump(report(*records), file)
+
+    # Удаленные и добавленные замеры печатаются, но не считаются регрессиями
+    main(["compare", paths[0], paths[1]])
+    out = capsys.readouterr().out
+    assert "added" in out and "removed" in out and "REGRESSION" not in out
+
+    with pytest.raises(SystemExit) as exit_info:
+        main(["compare", paths[0], paths[2]])
+    assert exit_info.value.code == 1
+    assert "REGRESSION" in capsys.readouterr().out
+    main(["compare", paths[0], paths[2], "--threshold", "0.6"])
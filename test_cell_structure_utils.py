@@ -0,0 +1,97 @@
+# test_cell_structure_utils.py
+import math
+import random
+
+import numpy as np
+
+from cell_point import CellPoint
+from cell_structure_utils import _splitmix64, _splitmix64_int, child_ray_ends, generate_child_rays_batch, \
+    hashed_uniforms, line_intersection, segment_intersections_batch
+
+
+def random_segments(rng: random.Random, count: int) -> np.ndarray:
+    return np.array([(rng.randint(0, 100), rng.randint(0, 100), rng.randint(0, 100), rng.randint(0, 100))
+                     for _ in range(count)], dtype=np.float64)
+
+
+def first_scalar_hit(ray, segments) -> int:
+    p1, p2 = CellPoint(*ray[:2]), CellPoint(*ray[2:])
+    for n, (x3, y3, x4, y4) in enumerate(segments):
+        if line_intersection(p1, p2, CellPoint(x3, y3), CellPoint(x4, y4)) is not None:
+            return n
+    return -1
+
+
+def test_per_ray_candidates_match_scalar_checks():
+    rng = random.Random(5)
+    rays = random_segments(rng, 40)
+    candidates = np.stack([random_segments(rng, 6) for _ in rays])
+    # Строки NaN дополняют списки кандидатов и ничего не пересекают
+    candidates[::3, 4:] = np.nan
+    _, index = segment_intersections_batch(rays, candidates)
+    assert index.tolist() == [first_scalar_hit(ray, segments[~np.isnan(segments[:, 0])])
+                              for ray, segments in zip(rays, candidates)]
+    assert (index >= 0).any() and (index < 0).any()
+    assert segment_intersections_batch(rays[0], np.full((1, 4), np.nan))[1] == -1
+
+
+def test_splitmix64_matches_the_reference_and_its_array_form():
+    # Первое число splitmix64 с нулевым состоянием
+    assert _splitmix64_int(0) == 0xE220A8397B1DCDAF
+    values = [0, 1, 2 ** 63, 2 ** 64 - 1] + [random.Random(3).getrandbits(64) for _ in range(20)]
+    with np.errstate(over="ignore"):
+        mixed = _splitmix64(np.array(values, dtype=np.uint64))
+    assert mixed.tolist() == [_splitmix64_int(value) for value in values]
+
+
+def test_hashed_uniforms_depend_only_on_seed_key_and_point():
+    rng = np.random.default_rng(4)
+    points = rng.integers(-10 ** 6, 10 ** 6, size=(300, 2))
+    values = hashed_uniforms(7, (2, -3), points, (3, 2))
+    assert values.shape == (300, 3, 2)
+    assert ((values >= 0) & (values < 1)).all()
+    assert np.array_equal(values, hashed_uniforms(7, (2, -3), points, (3, 2)))
+    assert not np.array_equal(values, hashed_uniforms(8, (2, -3), points, (3, 2)))
+    assert not np.array_equal(values, hashed_uniforms(7, (3, -3), points, (3, 2)))
+
+    # Числа точки не зависят от того, в каком пакете и на каком месте она оказалась
+    order = rng.permutation(len(points))
+    assert np.array_equal(hashed_uniforms(7, (2, -3), points[order], (3, 2)), values[order])
+    blocks = [hashed_uniforms(7, (2, -3), points[start:start + 17], (3, 2)) for start in range(0, len(points), 17)]
+    assert np.array_equal(np.concatenate(blocks), values)
+    assert abs(values.mean() - 0.5) < 0.02
+
+
+def test_child_rays_stay_within_deviation_and_length():
+    rng = np.random.default_rng(5)
+    starts = rng.integers(-1000, 1000, size=(200, 2))
+    directions = rng.uniform(-math.pi, math.pi, size=200)
+    deviation = math.radians(40)
+    ends = generate_child_rays_batch(starts, directions, child_count=3, min_length=100, max_length=200,
+                                     max_deviation=deviation, rng=np.random.default_rng(9))
+    assert ends.shape == (600, 2) and ends.dtype == np.int64
+    assert np.array_equal(ends, generate_child_rays_batch(starts, directions, child_count=3, min_length=100,
+                                                          max_length=200, max_deviation=deviation,
+                                                          rng=np.random.default_rng(9)))
+
+    # Концы округлены до целых: длина сдвигается не больше чем на половину диагонали клетки
+    vectors = ends - np.repeat(starts, 3, axis=0)
+    lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+    assert ((lengths >= 100 - 0.71) & (lengths <= 200 + 0.71)).all()
+    turns = np.angle(np.exp(1j * (np.arctan2(vectors[:, 1], vectors[:, 0]) - np.repeat(directions, 3))))
+    assert (np.abs(turns) <= deviation + math.asin(0.71 / 100)).all()
+
+
+def test_hashed_child_rays_do_not_depend_on_blocks():
+    rng = np.random.default_rng(6)
+    starts = rng.integers(0, 250, size=(100, 2))
+    directions = rng.uniform(-math.pi, math.pi, size=100)
+
+    def rays(index):
+        return child_ray_ends(starts[index], directions[index], hashed_uniforms(1, (0, 0), starts[index], (2, 2)))
+
+    whole = rays(np.arange(100)).reshape(100, 2, 2)
+    order = rng.permutation(100)
+    assert np.array_equal(rays(order).reshape(100, 2, 2), whole[order])
+    blocks = [rays(np.arange(start, min(start + 32, 100))) for start in range(0, 100, 32)]
+    assert np.array_equal(np.concatenate(blocks).reshape(100, 2, 2), whole)
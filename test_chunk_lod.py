@@ -0,0 +1,54 @@
+# test_chunk_lod.py
+import numpy as np
+import pytest
+
+from chunk_lod import ChunkLOD
+
+
+def endpoints(segments: np.ndarray) -> set:
+    return set(map(tuple, np.asarray(segments).reshape(-1, 2).tolist()))
+
+
+def test_levels_reduce_vertices_and_edges(make_world):
+    manager = make_world(iterations=12)
+    for key in manager.chunks:
+        lod = manager.chunk_lod(key)
+        segments = manager.chunks[key].geometry.segments()
+        counts = [(len(endpoints(segments)), len(segments))] + \
+                 [(len(endpoints(level)), len(level)) for level in lod.levels]
+        assert all(a >= b for a, b in zip(counts, counts[1:]))
+    lod = manager.chunk_lod((1, 1))
+    assert lod.edge_count > len(lod.levels[0]) > len(lod.levels[-1]) > 0
+
+
+def test_simplified_lines_stay_within_a_cell_of_the_originals(make_world):
+    manager = make_world(iterations=12)
+    segments = manager.chunks[(1, 1)].geometry.segments().astype(np.int64)
+    lod = manager.chunk_lod((1, 1))
+    for cell, level in zip(ChunkLOD.CELL_SIZES, lod.levels):
+        level = level.astype(np.int64)
+        # Каждый упрощенный отрезок – образ исходного, оба конца которого не дальше ячейки
+        for x1, y1, x2, y2 in level.tolist():
+            near = [(np.abs(segments[:, :2] - a).max(axis=1) <= cell)
+                    & (np.abs(segments[:, 2:] - b).max(axis=1) <= cell)
+                    for a, b in (((x1, y1), (x2, y2)), ((x2, y2), (x1, y1)))]
+            assert (near[0] | near[1]).any()
+        for x, y in endpoints(level):
+            assert np.hypot(*(segments.reshape(-1, 2) - (x, y)).T).min() <= cell
+
+
+@pytest.mark.parametrize("scale, density, level", [
+    (1.0, True, 0), (0.3, True, 0), (0.25, True, 1), (0.2, True, 1), (0.125, True, 2),
+    (0.0625, False, 3), (0.0625, True, 4), (0.01, False, 3),
+])
+def test_select_picks_the_coarsest_level_within_tolerance(scale, density, level):
+    segments = np.array([(0, 0, 100, 100), (100, 100, 240, 30), (10, 200, 60, 180)])
+    lod = ChunkLOD(0, 0, 250, 250, segments)
+    selected, data = lod.select(scale, density)
+    assert selected == level == lod.level_for_scale(scale, density)
+    if level == 0:
+        assert data is None
+    elif level == lod.density_level:
+        assert data is lod.density
+    else:
+        assert data is lod.levels[level - 1]
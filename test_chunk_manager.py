@@ -0,0 +1,270 @@
+# test_chunk_manager.py
+import random
+
+import pytest
+
+from cell_line import CellLine
+from cell_point import CellPoint
+from cell_structure_utils import closest_point_on_segment, segment_intersects_rect
+from chunk_manager import ChunkManager
+from generate_world import seed_chunk
+
+
+@pytest.mark.parametrize("seed", [None, 1])
+@pytest.mark.parametrize("threshold", [None, 10])
+def test_truncation_modes_build_the_same_world(make_world, state_of, seed, threshold):
+    worlds = []
+    for truncation in ("brute", "index", "batch"):
+        # Мир без seed берет лучи из глобального random
+        random.seed(7)
+        worlds.append(state_of(make_world(seed=seed, connection_threshold=threshold, truncation=truncation)))
+    assert worlds[0] == worlds[1] == worlds[2]
+
+
+@pytest.mark.parametrize("truncation", ["index", "batch"])
+def test_seeded_world_does_not_depend_on_workers(make_world, state_of, truncation):
+    worlds = [state_of(make_world(side=4, seed=2, truncation=truncation, workers=workers))
+              for workers in (None, 1, 2)]
+    assert worlds[0] == worlds[1] == worlds[2]
+
+
+@pytest.mark.parametrize("truncation", ["brute", "index"])
+def test_seeded_batch_rays_do_not_depend_on_the_block_size(make_world, state_of, truncation):
+    worlds = []
+    for block in (1, 5, 32):
+        manager = make_world(iterations=0)
+        manager.RAY_GENERATION = "batch"
+        manager.RAY_BLOCK = block
+        for _ in range(6):
+            manager.expand_structure(truncation=truncation)
+        worlds.append(state_of(manager))
+    assert worlds[0] == worlds[1] == worlds[2]
+
+
+def budgeted_pass(manager: ChunkManager, **budget) -> list:
+    """
+    Выполняет один проход расширения вызовами с бюджетом, пока проход не завершится,
+    и возвращает число испусканий каждого вызова.
+    """
+    steps = [manager.expand_structure(**budget)]
+    while manager.expand_cursor is not None:
+        steps.append(manager.expand_structure(**budget))
+    return steps
+
+
+@pytest.mark.parametrize("seed", [None, 1])
+@pytest.mark.parametrize("budget", [{"max_steps": 1}, {"max_steps": 7}, {"max_steps": 7, "truncation": "batch"},
+                                    {"time_budget_ms": 0.2}])
+def test_budgeted_calls_resume_to_the_unbudgeted_pass(make_world, state_of, seed, budget):
+    worlds = []
+    for kwargs in ({}, budget):
+        random.seed(7)
+        manager = make_world(seed=seed, iterations=3)
+        passes = [budgeted_pass(manager, **kwargs) for _ in range(2)]
+        worlds.append((state_of(manager), [sum(steps) for steps in passes]))
+    assert worlds[0] == worlds[1]
+
+
+def test_max_steps_is_respected_per_call(make_world):
+    manager = make_world(iterations=3)
+    steps = budgeted_pass(manager, max_steps=5)
+    assert len(steps) > 2
+    assert all(0 < count <= 5 for count in steps)
+    assert all(count == 5 for count in steps[:-1])
+
+
+def test_evicted_chunk_is_restored_unchanged(make_world, state_of):
+    manager = make_world(iterations=30)
+    expected = state_of(manager)
+    keys = [key for key in manager.chunks if key not in manager._protected_keys()]
+    assert keys
+    for key in keys:
+        manager.evict_chunk(key)
+    assert set(manager.evicted) == set(keys)
+    assert state_of(manager) == expected
+
+
+def test_memory_cap_keeps_seeded_world_unchanged(make_world, state_of):
+    expected = state_of(make_world(side=4, seed=3, iterations=12))
+    capped = make_world(side=4, seed=3, iterations=12, max_resident_bytes=100_000)
+    assert capped.evicted
+    assert capped.resident_bytes() <= capped.max_resident_bytes
+    assert state_of(capped) == expected
+
+
+def pan(manager: ChunkManager, rows: int, sizes: list) -> None:
+    """
+    Ведет полосу из 4 чанков вниз на rows строк, выгружая строки на две позади, и записывает
+    в sizes объём чанков в памяти вместе с записями вне памяти после каждого шага.
+    """
+    for j in range(rows):
+        for i in range(4):
+            manager.load_chunk((i, j))
+            seed_chunk(manager, (i, j), 1, 3, 50, 80)
+            for _ in range(3):
+                manager.expand_structure()
+            sizes.append(manager.resident_bytes() + manager.evicted_bytes())
+        manager.unload_chunks([(i, j - 2) for i in range(-1, 5)])
+
+
+def test_far_pan_keeps_evicted_records_under_the_cap(make_world, state_of):
+    cap = 150_000
+    expected, sizes = make_world(side=0, seed=2), []
+    pan(expected, 12, sizes)
+    assert max(sizes) > cap
+    manager, sizes = make_world(side=0, seed=2, max_resident_bytes=cap), []
+    pan(manager, 12, sizes)
+    assert max(sizes) <= cap
+    assert len(manager._spill) > 20
+    assert state_of(manager) == state_of(expected)
+
+
+def straight_rays(*lines) -> ChunkManager:
+    """
+    Возвращает мир с чанками (0, 0) и (1, 0), лучами без отклонений длиной 38 и линиями lines
+    ((x1, y1, x2, y2, конец испускал ли лучи)), каждая добавлена в чанк своей начальной точки;
+    линии с общими концами сходятся в одной вершине.
+    """
+    manager = ChunkManager((0, 0), 250, 250, seed=1)
+    manager.configure_rays(child_count=1, min_length=38, max_length=38, max_deviation=0)
+    for key in ((0, 0), (1, 0)):
+        manager.load_chunk(key)
+    points = {}
+    for x1, y1, x2, y2, emitted in lines:
+        start = points.setdefault((x1, y1), CellPoint(x1, y1))
+        end = points.setdefault((x2, y2), CellPoint(x2, y2))
+        start.has_emitted = True
+        end.has_emitted = end.has_emitted or emitted
+        manager.get_chunk_for_point(start).add_line(CellLine(start, end))
+    return manager
+
+
+@pytest.mark.parametrize("truncation", ["brute", "index", "batch"])
+@pytest.mark.parametrize("threshold, welded", [(10, True), (3, False), (None, False)])
+def test_ray_end_welds_to_a_vertex_within_the_threshold(truncation, threshold, welded):
+    # Луч из (100, 50) заканчивается в (138, 50), в 3.6 от вершины (140, 53)
+    manager = straight_rays((50, 50, 100, 50, False), (140, 53, 140, 120, True))
+    manager.expand_structure(connection_threshold=threshold, truncation=truncation)
+    geometry = manager.chunks[(0, 0)].geometry
+    assert geometry.edge_count == 3
+    line = geometry.line(2)
+    assert (line.start.x, line.start.y) == (100, 50)
+    if welded:
+        assert geometry.vertex_count == 4
+        assert (line.end.x, line.end.y) == (140, 53)
+        assert geometry.home_of(line.end._index) == geometry.home_of(geometry.line(1).start._index) == ((0, 0), 2)
+    else:
+        assert geometry.vertex_count == 5
+        assert (line.end.x, line.end.y) == (138, 50)
+
+
+def test_incident_lines_follow_a_welded_vertex_across_chunks():
+    # Луч из (212, 50) заканчивается на границе (250, 50) и сваривается с вершиной (253, 46) соседа
+    manager = straight_rays((180, 50, 212, 50, False), (253, 46, 300, 46, True), (253, 46, 253, 10, True))
+    manager.expand_structure(connection_threshold=10)
+    own, neighbor = manager.chunks[(0, 0)].geometry, manager.chunks[(1, 0)].geometry
+    line = own.line(own.edge_count - 1)
+    assert (line.end.x, line.end.y) == (253, 46)
+    assert own.home_of(line.end._index) == neighbor.home_of(neighbor.line(0).start._index) == ((1, 0), 0)
+
+    expected = sorted([(212, 50, 253, 46), (253, 46, 300, 46), (253, 46, 253, 10)])
+    for point in (line.end, neighbor.point(0)):
+        lines = manager.incident_lines(point)
+        assert sorted((line.start.x, line.start.y, line.end.x, line.end.y) for line in lines) == expected
+    assert len(manager.incident_lines(own.point(0))) == 1
+
+
+def test_queries_match_brute_force(make_world):
+    manager = make_world(side=4, iterations=10)
+    segments = [(key, edge, chunk.geometry.segment(edge))
+                for key, chunk in manager.chunks.items() for edge in range(chunk.geometry.edge_count)]
+    rng = random.Random(3)
+    for _ in range(150):
+        x, y = rng.uniform(-200, 1200) + 0.5, rng.uniform(-200, 1200) + 0.5
+        point = manager.nearest_point(x, y)
+        best = min(min((s[0] - x) ** 2 + (s[1] - y) ** 2, (s[2] - x) ** 2 + (s[3] - y) ** 2) for _, _, s in segments)
+        assert (point.x - x) ** 2 + (point.y - y) ** 2 == pytest.approx(best)
+
+        line = manager.nearest_line(x, y)
+        best = min(closest_point_on_segment(x, y, *s)[1] for _, _, s in segments)
+        distance = closest_point_on_segment(x, y, line.start.x, line.start.y, line.end.x, line.end.y)[1]
+        assert distance == pytest.approx(best)
+
+        rect = (x - 40, y - 30, x + 40, y + 30)
+        expected = sorted((key, edge) for key, edge, s in segments if segment_intersects_rect(*s, *rect))
+        assert sorted((line.start.x, line.start.y, line.end.x, line.end.y)
+                      for line in manager.lines_in_rect(*rect)) == \
+               sorted(manager.chunks[key].geometry.segment(edge) for key, edge in expected)
+    point = manager.nearest_point(-300, -300)
+    distance = ((point.x + 300) ** 2 + (point.y + 300) ** 2) ** 0.5
+    assert manager.nearest_point(-300, -300, max_distance=distance - 1) is None
+
+
+def test_far_query_on_evicted_world_restores_few_chunks(make_world, state_of):
+    cap = 150_000
+    manager = make_world(side=0, seed=2, max_resident_bytes=cap)
+    for j in range(8):
+        for i in range(8):
+            manager.load_chunk((i, j))
+            seed_chunk(manager, (i, j), 1, 3, 50, 80)
+            for _ in range(3):
+                manager.expand_structure()
+        manager.unload_chunks([(i, j - 2) for i in range(-1, 9)])
+    for _ in range(10):
+        manager.expand_structure()
+    assert len(manager.evicted) > 40
+
+    restored = []
+    restore_chunk = manager._restore_chunk
+
+    def counting_restore(key):
+        restored.append(key)
+        return restore_chunk(key)
+
+    manager._restore_chunk = counting_restore
+    point = manager.nearest_point(-4000, -4000)
+    assert len(restored) <= 12
+    assert manager.resident_bytes() <= cap
+
+    del manager._restore_chunk
+    state_of(manager)
+    best = min(min((s[0] + 4000) ** 2 + (s[1] + 4000) ** 2, (s[2] + 4000) ** 2 + (s[3] + 4000) ** 2)
+               for chunk in manager.chunks.values() for s in chunk.geometry.segments().tolist())
+    assert (point.x + 4000) ** 2 + (point.y + 4000) ** 2 == best
+
+
+def test_configure_rays_leaves_class_defaults_alone(make_world):
+    defaults = (ChunkManager.CHILD_COUNT, ChunkManager.CHILD_MIN_LENGTH, ChunkManager.CHILD_MAX_LENGTH,
+                ChunkManager.CHILD_MAX_DEVIATION)
+    manager = make_world(iterations=0)
+    manager.configure_rays(child_count=2, min_length=30, max_length=40, max_deviation=0.5)
+    assert manager.ray_parameters() == {"child_count": 2, "min_length": 30, "max_length": 40, "max_deviation": 0.5}
+    assert (ChunkManager.CHILD_COUNT, ChunkManager.CHILD_MIN_LENGTH, ChunkManager.CHILD_MAX_LENGTH,
+            ChunkManager.CHILD_MAX_DEVIATION) == defaults
+    assert not {"CHILD_COUNT", "CHILD_MIN_LENGTH", "CHILD_MAX_LENGTH", "CHILD_MAX_DEVIATION"} & set(vars(manager))
+    assert make_world(iterations=0).child_count == ChunkManager.CHILD_COUNT
+
+    with pytest.raises(ValueError):
+        manager.configure_rays(min_length=50)
+
+
+def test_configured_rays_reach_pool_workers(make_world, state_of):
+    worlds = []
+    for workers in (None, 2):
+        manager = make_world(iterations=0)
+        manager.configure_rays(child_count=2, max_length=40)
+        for _ in range(6):
+            manager.expand_structure(workers=workers)
+        worlds.append(state_of(manager))
+    assert worlds[0] == worlds[1]
+
+
+def test_workers_reject_chunks_smaller_than_the_line_reach():
+    manager = ChunkManager((0, 0), 100, 100, seed=1)
+    manager.load_chunk((0, 0))
+    with pytest.raises(ValueError):
+        manager.expand_structure(workers=1)
+    manager.configure_rays(max_length=40)
+    with pytest.raises(ValueError):
+        manager.expand_structure(connection_threshold=20, workers=1)
+    manager.expand_structure(connection_threshold=10, workers=1)
@@ -0,0 +1,78 @@
+# test_chunk_store.py
+from chunk_manager import ChunkManager
+from chunk_store import StoredChunk
+
+
+def test_save_open_round_trip(make_world, state_of, tmp_path):
+    manager = make_world(iterations=4)
+    path = str(tmp_path / "world.cw")
+    manager.save(path)
+    opened = ChunkManager.open(path)
+    assert not opened.chunks
+    assert all(isinstance(record, StoredChunk) for record in opened.evicted.values())
+    assert (opened.seed, opened.chunk_width, opened.chunk_height) == (manager.seed, 250, 250)
+    assert state_of(opened) == state_of(manager)
+
+
+def test_opened_world_keeps_growing_like_the_original(make_world, state_of, tmp_path):
+    manager = make_world(iterations=3)
+    path = str(tmp_path / "world.cw")
+    manager.save(path)
+    opened = ChunkManager.open(path)
+    for _ in range(3):
+        manager.expand_structure()
+        opened.expand_structure()
+    assert state_of(opened) == state_of(manager)
+
+
+def test_world_can_be_saved_over_its_own_file(make_world, state_of, tmp_path):
+    manager = make_world(side=4, iterations=10)
+    path = str(tmp_path / "world.cw")
+    manager.save(path)
+    opened = ChunkManager.open(path)
+    for world in (manager, opened):
+        world.load_chunk((4, 4))
+        world.expand_structure()
+    # Часть чанков еще не прочитана из файла, который сейчас будет заменен
+    assert any(isinstance(record, StoredChunk) for record in opened.evicted.values())
+    opened.save(path)
+    assert state_of(ChunkManager.open(path)) == state_of(manager)
+
+
+def test_saving_an_opened_world_copies_its_chunks_unchanged(make_world, tmp_path, monkeypatch):
+    path = str(tmp_path / "world.cw")
+    make_world(side=4, iterations=10).save(path)
+    opened = ChunkManager.open(path)
+
+    def decode(*args):
+        raise AssertionError("stored chunk decoded during save")
+
+    monkeypatch.setattr(StoredChunk, "parts", decode)
+    monkeypatch.setattr(StoredChunk, "emitted", property(decode))
+    copy = str(tmp_path / "copy.cw")
+    opened.save(copy)
+    with open(path, "rb") as original, open(copy, "rb") as saved:
+        assert original.read() == saved.read()
+    assert opened.evicted_bytes() == 0
+
+
+def test_saving_over_the_opened_file_releases_its_mapping(make_world, state_of, tmp_path):
+    path = str(tmp_path / "world.cw")
+    make_world(side=4, iterations=10).save(path)
+    opened = ChunkManager.open(path)
+    first = opened.snapshot()
+    expected_first = state_of(ChunkManager.open(path))
+    opened.load_chunk((4, 4))
+    opened.expand_structure()
+    old_file = opened._world_file
+    opened.save(path)
+    assert old_file._map.closed and opened._world_file is not old_file
+    expected_second = state_of(ChunkManager.open(path))
+
+    # Записи, еще не прочитанные из файла, и версия до изменений читаются из новых мест
+    assert any(isinstance(record, StoredChunk) for record in opened.evicted.values())
+    second = opened.snapshot()
+    opened.restore(first)
+    assert state_of(opened) == expected_first
+    opened.restore(second)
+    assert state_of(opened) == expected_second
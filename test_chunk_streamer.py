@@ -0,0 +1,96 @@
+# test_chunk_streamer.py
+from chunk_manager import ChunkManager
+from chunk_streamer import ChunkStreamer
+from generate_world import seed_chunk
+
+
+def seed(manager: ChunkManager, key) -> None:
+    seed_chunk(manager, key, seeds_per_chunk=1, ray_count=3, min_length=50, max_length=80)
+
+
+def test_load_and_unload_rings():
+    manager = ChunkManager((0, 0), 250, 250, seed=1)
+    streamer = ChunkStreamer(manager, max_loads_per_tick=100, max_unloads_per_tick=100, expand_budget_ms=None)
+    view = (0, 0, 500, 500)
+    # Поле зрения закрывает чанки (0..1, 0..1), кольцо на чанк шире и на 500 пикселей вперед по скорости
+    ring = {(i, j) for i in range(-1, 5) for j in range(-1, 3)}
+    assert set(streamer.load_ring(view, (1000, 0))) == ring
+    tick = streamer.update(view, (1000, 0))
+    assert set(tick.loaded) == ring and tick.pending == 0
+    assert {key for key, chunk in manager.chunks.items() if chunk.need_expand} == ring
+
+    view = (2000, 0, 500, 500)
+    tick = streamer.update(view)
+    assert tick.unloaded
+    for key in ring:
+        chunk = manager.chunks.get(key)
+        assert chunk is None or not chunk.need_expand
+        assert (key in manager.evicted) == (key in tick.unloaded)
+    assert all(streamer.ring_distance(key, view) <= streamer.unload_margin
+               for key, chunk in manager.chunks.items() if chunk.need_expand)
+
+
+def test_loads_and_unloads_are_capped_per_tick():
+    manager = ChunkManager((0, 0), 250, 250, seed=1)
+    streamer = ChunkStreamer(manager, max_loads_per_tick=2, max_unloads_per_tick=3, expand_budget_ms=None)
+    ticks = [streamer.update((0, 0, 500, 500))]
+    while ticks[-1].pending:
+        ticks.append(streamer.update((0, 0, 500, 500)))
+    assert [len(tick.loaded) for tick in ticks] == [2] * 8
+    assert [tick.pending for tick in ticks] == list(range(14, -1, -2))
+
+    ticks = [streamer.update((5000, 0, 500, 500))]
+    while ticks[-1].unloaded:
+        ticks.append(streamer.update((5000, 0, 500, 500)))
+    assert all(len(tick.unloaded) <= 3 for tick in ticks)
+    assert sum(len(tick.unloaded) for tick in ticks) >= 16
+
+
+def test_chunks_ahead_of_the_camera_load_first():
+    for velocity, ahead in (((300, 0), {(1, 0), (1, 1)}), ((-300, 0), {(0, 0), (0, 1)}),
+                            ((0, 300), {(0, 1), (1, 1)})):
+        manager = ChunkManager((0, 0), 250, 250, seed=1)
+        streamer = ChunkStreamer(manager, max_loads_per_tick=2, lookahead_s=0, expand_budget_ms=None)
+        # Четыре чанка под полем зрения равноудалены от его центра
+        assert set(streamer.update((0, 0, 500, 500), velocity).loaded) == ahead
+
+
+def pan_streamed(streamer: ChunkStreamer, ticks: int, sizes: list) -> int:
+    """
+    Ведет камеру вправо быстрее, чем успевает расширение (20 испусканий за такт вместо бюджета
+    времени, чтобы мир не зависел от скорости машины), и записывает в sizes объём чанков в памяти
+    вместе с записями вне памяти после каждого такта; возвращает число тактов, после которых
+    в кольце загрузки остались пустые чанки, до которых структура не дорастет.
+    """
+    manager = streamer.chunk_manager
+    stranded = 0
+    for t in range(ticks):
+        view = (t * 100, 0, 800, 600)
+        streamer.update(view, (2000, 0))
+        manager.expand_structure(max_steps=20)
+        sizes.append(manager.resident_bytes() + manager.evicted_bytes())
+        stranded += any(key in manager.chunks and manager.chunks[key].need_expand and streamer.stranded(key)
+                        for key in streamer.load_ring(view))
+    return stranded
+
+
+def test_camera_outrunning_expansion_seeds_new_chunks_and_keeps_memory_bounded():
+    cap = 100_000
+    managers = [ChunkManager((0, 0), 250, 250, seed=1, max_resident_bytes=limit) for limit in (None, None, cap)]
+    for manager in managers:
+        manager.load_chunk((1, 1))
+        seed(manager, (1, 1))
+    assert pan_streamed(ChunkStreamer(managers[0], expand_budget_ms=None), 60, []) > 0
+
+    uncapped = []
+    pan_streamed(ChunkStreamer(managers[1], expand_budget_ms=None, seeder=seed), 150, uncapped)
+    assert max(uncapped) > cap
+    manager = managers[2]
+    streamer = ChunkStreamer(manager, expand_budget_ms=None, seeder=seed)
+    sizes = []
+    assert pan_streamed(streamer, 150, sizes) == 0
+    assert max(sizes) <= cap
+    # Растут только чанки около поля зрения, а не вдоль всего пути камеры
+    assert all(streamer.ring_distance(key, (14900, 0, 800, 600)) <= streamer.unload_margin
+               for key, chunk in manager.chunks.items() if chunk.need_expand)
+    assert len(manager.evicted) > 100
@@ -0,0 +1,109 @@
+# test_chunk_versions.py
+import pytest
+
+from chunk_manager import ChunkManager
+from chunk_store import StoredChunk
+from chunk_versions import apply_chunk_delta
+
+
+def replay(manager: ChunkManager, a: int, b: int) -> bool:
+    """
+    Применяет diff(a, b) к состояниям версии a и сравнивает результат с версией b.
+    """
+    old = manager._versions[a].states
+    new = manager._versions[b].states
+    chunks = {key: (state.parts(), state.emitted) for key, state in old.items()}
+    for delta in manager.diff(a, b):
+        applied = apply_chunk_delta(chunks[delta.key][0] if delta.key in chunks else None, delta)
+        if applied is None:
+            del chunks[delta.key]
+        else:
+            chunks[delta.key] = applied
+    return chunks == {key: (state.parts(), state.emitted) for key, state in new.items()}
+
+
+def test_restore_returns_to_each_version(make_world, state_of):
+    manager = make_world(iterations=2)
+    first = manager.snapshot()
+    expected_first = state_of(manager)
+    for _ in range(3):
+        manager.expand_structure()
+    manager.load_chunk((3, 3))
+    second = manager.snapshot()
+    expected_second = state_of(manager)
+
+    manager.restore(first)
+    assert state_of(manager) == expected_first
+    manager.restore(second)
+    assert state_of(manager) == expected_second
+
+
+def test_restored_world_grows_like_the_original(make_world, state_of):
+    manager = make_world(iterations=2)
+    version = manager.snapshot()
+    manager.expand_structure()
+    expected = state_of(manager)
+    manager.expand_structure()
+    manager.restore(version)
+    manager.expand_structure()
+    assert state_of(manager) == expected
+
+
+def test_versions_share_unchanged_chunks(make_world):
+    manager = make_world(side=4, iterations=12)
+    first = manager.snapshot()
+    manager.load_chunk((4, 4))
+    manager.expand_structure()
+    second = manager.snapshot()
+    old = manager._versions[first].states
+    new = manager._versions[second].states
+    changed = {delta.key for delta in manager.diff(first, second)}
+    assert changed and len(changed) < len(new)
+    assert all(new[key] is old[key] for key in new if key not in changed)
+    assert manager.diff(second, second) == []
+
+
+def test_diff_replays_between_versions(make_world):
+    manager = make_world(iterations=2)
+    versions = [manager.snapshot()]
+    for _ in range(3):
+        manager.expand_structure()
+        versions.append(manager.snapshot())
+    manager.discard_chunks([(0, 0)])
+    versions.append(manager.snapshot())
+    assert {delta.kind for delta in manager.diff(versions[-2], versions[-1])} == {"remove"}
+    for a, b in zip(versions, versions[1:]):
+        assert replay(manager, a, b)
+    assert replay(manager, versions[-1], versions[0])
+
+
+def test_unknown_version_is_rejected(make_world):
+    manager = make_world(iterations=0)
+    version = manager.snapshot()
+    manager.drop_snapshot(version)
+    with pytest.raises(KeyError):
+        manager.restore(version)
+
+
+def test_snapshot_after_open_keeps_chunks_in_the_file(make_world, state_of, tmp_path):
+    path = str(tmp_path / "world.cw")
+    make_world(side=4, iterations=10).save(path)
+    manager = ChunkManager.open(path)
+    first = manager.snapshot()
+    states = manager._versions[first].states
+    assert all(isinstance(state.source, StoredChunk) and state.data is None for state in states.values())
+    expected_first = state_of(ChunkManager.open(path))
+
+    manager.load_chunk((4, 4))
+    manager.expand_structure()
+    second = manager.snapshot()
+    expected_second = state_of(manager)
+    assert replay(manager, first, second)
+
+    manager.restore(first)
+    # Чанки версии снова ссылаются на файл, а не на сжатые копии
+    assert all(isinstance(record, StoredChunk) for record in manager.evicted.values())
+    assert manager.diff(first, manager.snapshot()) == []
+    assert state_of(manager) == expected_first
+    manager.restore(second)
+    assert state_of(manager) == expected_second
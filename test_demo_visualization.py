@@ -0,0 +1,41 @@
+# test_demo_visualization.py
+import os
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+pytest.importorskip("pygame")
+
+import demo_visualization
+from demo_visualization import ChunkRenderer
+from generation_worker import ChunkSnapshot
+
+
+def test_margin_follows_max_line_length():
+    renderer = ChunkRenderer((0, 0), 250, 250, (800, 600), max_line_length=150)
+    assert renderer.margin == 150 + ChunkRenderer.POINT_RADIUS
+
+
+@pytest.mark.parametrize("zoom", [0.5, 1.0, 2.0])
+def test_line_of_max_length_fits_on_chunk_surface(zoom):
+    renderer = ChunkRenderer((0, 0), 250, 250, (800, 600), zoom=zoom, max_line_length=150)
+    # Линия из угла чанка наружу длиной max_line_length
+    segments = np.array([[0, 0, -150, 0]], dtype=np.int32)
+    surface, (left, top) = renderer.render_chunk(ChunkSnapshot((0, 0), 0, 0, 250, 250, True, segments))
+    end = (round((-150 - left) * zoom), round((0 - top) * zoom))
+    assert 0 <= end[0] - round(ChunkRenderer.POINT_RADIUS * zoom)
+    assert surface.get_at(end).a > 0
+
+
+def test_demo_margin_covers_generated_lines(make_world):
+    manager = make_world(iterations=6, connection_threshold=demo_visualization.CONNECTION_THRESHOLD)
+    reach = max(manager.child_max_length + demo_visualization.CONNECTION_THRESHOLD,
+                demo_visualization.INITIAL_MAX_LENGTH)
+    for chunk in manager.chunks.values():
+        segments = chunk.geometry.segments()
+        if not len(segments):
+            continue
+        xs, ys = segments[:, [0, 2]], segments[:, [1, 3]]
+        assert xs.min() >= chunk.x - reach and xs.max() <= chunk.x + chunk.width + reach
+        assert ys.min() >= chunk.y - reach and ys.max() <= chunk.y + chunk.height + reach
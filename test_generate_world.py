@@ -0,0 +1,83 @@
+# test_generate_world.py
+import json
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from cell_structure_utils import segment_intersects_rect
+from generate_world import encode_png, generate_world, rasterize, write_tile
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    """
+    Читает PNG, записанный encode_png: 8-битный в оттенках серого, один IDAT, строки без фильтров.
+    """
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = {}
+    offset = 8
+    while offset < len(data):
+        length, = struct.unpack(">I", data[offset:offset + 4])
+        kind = data[offset + 4:offset + 8]
+        body = data[offset + 8:offset + 8 + length]
+        assert struct.unpack(">I", data[offset + 8 + length:offset + 12 + length])[0] == zlib.crc32(kind + body)
+        chunks[kind] = body
+        offset += 12 + length
+    assert list(chunks) == [b"IHDR", b"IDAT", b"IEND"]
+    width, height, depth, color, _, _, _ = struct.unpack(">IIBBBBB", chunks[b"IHDR"])
+    assert (depth, color) == (8, 0)
+    rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width + 1)
+    assert not rows[:, 0].any()
+    return rows[:, 1:]
+
+
+def test_rasterized_segments_round_trip_through_png():
+    segments = np.array([(10, 10, 10, 40), (0, 0, 49, 29), (30, 5, 90, 5)])
+    image = rasterize(segments, 0, 0, 50, 30)
+    assert image.shape == (30, 50)
+    assert image[10:41, 10].all() and image[0, 0] and image[29, 49]
+    # Отрезок за правым краем обрезается по границе изображения
+    assert image[5, 30:].all() and set(np.unique(image)) == {0, 255}
+    assert np.array_equal(decode_png(encode_png(image)), image)
+    assert rasterize(segments, 0, 0, 50, 30, scale=0.5).shape == (15, 25)
+
+
+def test_line_reach_must_fit_into_a_chunk(tmp_path):
+    with pytest.raises(ValueError):
+        generate_world(str(tmp_path), 1, 1, 1, chunk_size=170, max_length=80, connection_threshold=10)
+    generate_world(str(tmp_path), 1, 1, 1, chunk_size=170, max_length=80, connection_threshold=None,
+                   max_iterations=2)
+
+
+def test_tiny_world_writes_png_tiles(tmp_path):
+    summary = generate_world(str(tmp_path), 1, 2, 2, max_iterations=10, scale=0.5)
+    assert summary["tiles"] == 4
+    with open(tmp_path / "world.json") as file:
+        assert json.load(file)["tile_segments"] == summary["tile_segments"] > 0
+    for i in range(2):
+        for j in range(2):
+            image = decode_png((tmp_path / f"{i}_{j}.png").read_bytes())
+            assert image.shape == (125, 125) and image.any()
+
+
+def test_vector_tiles_hold_the_segments_crossing_the_chunk(make_world, tmp_path):
+    manager = make_world(iterations=10)
+    key = (1, 1)
+    chunk = manager.chunks[key]
+    rect = (chunk.x, chunk.y, chunk.x + chunk.width, chunk.y + chunk.height)
+    count = write_tile(manager, key, str(tmp_path), "vector", 1.0)
+    with open(tmp_path / "1_1.json") as file:
+        tile = json.load(file)
+    assert tile["key"] == [1, 1] and tile["bounds"] == [chunk.x, chunk.y, chunk.width, chunk.height]
+    segments = {tuple(segment) for segment in tile["segments"]}
+    assert len(tile["segments"]) == count
+
+    nearby = {segment for k in [key] + manager.get_neighbor_keys(key)
+              for segment in map(tuple, manager.chunks[k].geometry.segments().tolist())}
+    crossing = {segment for segment in nearby if segment_intersects_rect(*segment, *rect)}
+    assert crossing and crossing <= segments <= nearby
+    # Кроме пересекающих чанк, в тайл попадают только отрезки, чей охватывающий прямоугольник задевает его угол
+    for x1, y1, x2, y2 in segments - crossing:
+        assert min(x1, x2) <= rect[2] and max(x1, x2) >= rect[0] and min(y1, y2) <= rect[3] and max(y1, y2) >= rect[1]
+    assert len(segments - crossing) < len(crossing)
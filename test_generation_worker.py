@@ -0,0 +1,60 @@
+# test_generation_worker.py
+import time
+
+import pytest
+
+from generation_worker import GenerationWorker
+
+
+def test_background_passes_stop_only_after_an_empty_pass(make_world):
+    manager = make_world(iterations=0)
+    worker = GenerationWorker(manager, slice_ms=0.2)
+    worker.submit_expand(500)
+    worker.start()
+    try:
+        deadline = time.perf_counter() + 60
+        while worker.busy() and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        assert not worker.busy()
+    finally:
+        worker.stop()
+    # Короткие кванты не должны завершать фоновую работу, пока структура еще растет
+    assert manager.expand_structure() == 0
+
+
+@pytest.mark.parametrize("seed", [1, 3])
+@pytest.mark.parametrize("slice_steps", [3, 5, 7])
+def test_pass_ending_with_an_empty_slice_is_not_empty(make_world, monkeypatch, seed, slice_steps):
+    manager = make_world(seed=seed, iterations=0)
+    expand_structure = manager.expand_structure
+
+    # Кванты по slice_steps испусканий вместо времени: часть проходов кончается квантом без испусканий
+    def budgeted(**kwargs):
+        kwargs.pop("time_budget_ms")
+        return expand_structure(max_steps=slice_steps, **kwargs)
+
+    monkeypatch.setattr(manager, "expand_structure", budgeted)
+    worker = GenerationWorker(manager)
+    worker._passes = 1000
+    while worker._passes:
+        worker._expand_slice()
+    monkeypatch.undo()
+    assert manager.expand_structure() == 0
+
+
+def test_snapshots_are_published_for_changed_chunks(make_world):
+    manager = make_world(iterations=0)
+    worker = GenerationWorker(manager, slice_ms=1.0)
+    worker.start()
+    try:
+        initial = {snapshot.key: snapshot for snapshot in worker.drain(1000)}
+        assert set(initial) == set(manager.chunks)
+        worker.submit_expand(1)
+        deadline = time.perf_counter() + 60
+        while worker.busy() and time.perf_counter() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.stop()
+    updated = {snapshot.key: snapshot for snapshot in worker.drain(1000)}
+    assert updated
+    assert all(len(updated[key].segments) > len(initial[key].segments) for key in updated)
@@ -0,0 +1,122 @@
+# test_half_edge.py
+from typing import Dict, Hashable, Set, Tuple
+
+from chunk_manager import ChunkManager
+from half_edge import HalfEdgeMesh
+
+
+def canonical_cells(mesh: HalfEdgeMesh) -> Set[tuple]:
+    cells = set()
+    for cell in mesh.cells:
+        points = mesh.cell_xy(cell)
+        cells.add(min(tuple(points[k:] + points[:k]) for k in range(len(points))))
+    return cells
+
+
+def full_mesh(manager: ChunkManager) -> HalfEdgeMesh:
+    """
+    Строит структуру заново по всем линиям чанков в памяти.
+    """
+    mesh = HalfEdgeMesh(256)
+    for key, chunk in manager.chunks.items():
+        geometry = chunk.geometry
+        for edge in range(geometry.edge_count):
+            x1, y1, x2, y2 = geometry.segment(edge)
+            u, v = mesh.vertex(x1, y1), mesh.vertex(x2, y2)
+            if u != v:
+                mesh.add_edge(u, v, (key, edge))
+    mesh.rebuild()
+    return mesh
+
+
+def membership_of(mesh: HalfEdgeMesh) -> Dict[Hashable, int]:
+    membership = {}
+    for half_edges in mesh.cells.values():
+        for edge in mesh.cell_edges(half_edges):
+            membership[mesh.edge_refs[edge]] = membership.get(mesh.edge_refs[edge], 0) + 1
+    return membership
+
+
+def assert_faces_match_full_build(manager: ChunkManager) -> None:
+    manager.update_faces()
+    reference = full_mesh(manager)
+    assert canonical_cells(manager.faces) == canonical_cells(reference)
+    assert manager.faces.edge_count == reference.edge_count
+    expected = membership_of(reference)
+    for key, chunk in manager.chunks.items():
+        membership = chunk.geometry.membership
+        assert [membership[edge] for edge in range(chunk.geometry.edge_count)] == \
+               [expected.get((key, edge), 0) for edge in range(chunk.geometry.edge_count)]
+
+
+def square_with_diagonal() -> Tuple[HalfEdgeMesh, int]:
+    mesh = HalfEdgeMesh()
+    a, b, c, d = (mesh.vertex(x, y) for x, y in ((0, 0), (10, 0), (10, 10), (0, 10)))
+    for n, (u, v) in enumerate(((a, b), (b, c), (c, d), (d, a))):
+        mesh.add_edge(u, v, n)
+    diagonal = mesh.add_edge(a, c, "diagonal")
+    mesh.rebuild()
+    return mesh, diagonal
+
+
+def test_diagonal_splits_square_into_two_cells():
+    mesh, _ = square_with_diagonal()
+    assert len(mesh.cells) == 2
+    assert sorted(abs(mesh.signed_area(half_edges)) for half_edges in mesh.cells.values()) == [50, 50]
+
+
+def test_removed_edge_merges_cells_and_frees_its_slot():
+    mesh, diagonal = square_with_diagonal()
+    mesh.remove_edge(diagonal)
+    removed, added = mesh.rebuild()
+    assert len(removed) == 2
+    assert all("diagonal" in refs for refs in removed.values())
+    assert len(added) == 1 and len(mesh.cells) == 1
+    assert mesh.edge_count == 4
+    a, c = mesh.vertex_ids[(0, 0)], mesh.vertex_ids[(10, 10)]
+    assert mesh.add_edge(a, c, "again") == diagonal
+    mesh.rebuild()
+    assert len(mesh.cells) == 2
+
+
+def test_vertex_without_edges_is_released():
+    mesh = HalfEdgeMesh()
+    u, v = mesh.vertex(0, 0), mesh.vertex(5, 5)
+    mesh.remove_edge(mesh.add_edge(u, v, "line"))
+    mesh.rebuild()
+    assert not mesh.vertex_ids
+    assert mesh.vertex(7, 7) in (u, v)
+
+
+def test_incremental_faces_match_full_build(make_world):
+    manager = make_world(iterations=0)
+    manager.enable_faces()
+    for _ in range(8):
+        manager.expand_structure()
+        assert_faces_match_full_build(manager)
+    assert manager.faces.cells
+
+
+def test_evicted_chunks_leave_the_mesh_without_being_restored(make_world):
+    manager = make_world(side=4, iterations=12)
+    manager.enable_faces()
+    keys = [key for key in manager.chunks if key not in manager._protected_keys()][:6]
+    assert keys
+    edges_before = manager.faces.edge_count
+    for key in keys:
+        manager.evict_chunk(key)
+    assert manager.faces.edge_count < edges_before
+    assert_faces_match_full_build(manager)
+    assert set(keys) <= set(manager.evicted)
+
+    for key in keys:
+        manager.load_chunk(key)
+    assert_faces_match_full_build(manager)
+
+
+def test_discarded_chunks_leave_the_mesh(make_world):
+    manager = make_world(side=4, iterations=12)
+    manager.enable_faces()
+    keys = [key for key in manager.chunks if key not in manager._protected_keys()][:4]
+    manager.discard_chunks(keys)
+    assert_faces_match_full_build(manager)
@@ -0,0 +1,48 @@
+# test_instrumentation.py
+import pytest
+
+from instrumentation import PHASES
+
+
+@pytest.mark.parametrize("truncation", ["brute", "index", "batch"])
+def test_counters_add_up_across_calls(make_world, truncation):
+    manager = make_world(iterations=0)
+    calls = []
+    instrumentation = manager.enable_instrumentation(calls.append)
+    steps = [manager.expand_structure(truncation=truncation) for _ in range(5)]
+
+    assert [call["steps"] for call in calls] == steps
+    for call in calls:
+        assert call["calls"] == 1
+        assert sum(chunk["steps"] for chunk in call["chunks"].values()) == call["steps"]
+        assert sum(call["phases"].values()) <= call["seconds"]
+        assert sum(chunk["seconds"] for chunk in call["chunks"].values()) <= call["seconds"]
+        assert call["rays"]["total"] == call["steps"] * manager.child_count
+        assert call["rays"]["truncated"] <= call["intersections"]["total"]["hits"]
+
+    totals = instrumentation.totals.as_dict()
+    assert totals["calls"] == len(calls)
+    assert totals["steps"] == sum(steps)
+    assert totals["seconds"] == pytest.approx(sum(call["seconds"] for call in calls))
+    for phase in PHASES:
+        assert totals["phases"][phase] == pytest.approx(sum(call["phases"][phase] for call in calls))
+    for phase, tally in totals["intersections"].items():
+        assert tally["tests"] == sum(call["intersections"][phase]["tests"] for call in calls)
+        assert tally["hits"] == sum(call["intersections"][phase]["hits"] for call in calls)
+    assert totals["rays"]["truncated"] == sum(call["rays"]["truncated"] for call in calls)
+
+    instrumentation.reset()
+    assert instrumentation.totals.as_dict()["steps"] == 0
+
+
+@pytest.mark.parametrize("workers", [None, 2])
+def test_instrumentation_does_not_change_the_world(make_world, state_of, workers):
+    expected = state_of(make_world(side=4, seed=2, iterations=6, workers=workers))
+    manager = make_world(side=4, seed=2, iterations=0)
+    calls = []
+    manager.enable_instrumentation(calls.append)
+    for _ in range(6):
+        manager.expand_structure(workers=workers)
+    assert len(calls) == 6
+    assert state_of(manager) == expected
+    assert manager.stats()["expansion"]["steps"] == sum(call["steps"] for call in calls)
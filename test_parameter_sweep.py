@@ -0,0 +1,41 @@
+# test_parameter_sweep.py
+import parameter_sweep
+from parameter_sweep import GRID_DEFAULTS, parameter_grid, run_world
+
+
+def small_params(**values):
+    params = {name: options[0] for name, options in GRID_DEFAULTS.items()}
+    params.update(seed=1, grid_side=2, iterations=5, chunk_size=250)
+    params.update(values)
+    return params
+
+
+def test_parameter_grid_is_the_cartesian_product():
+    grid = parameter_grid({"a": [1, 2], "b": ["x", "y", "z"]})
+    assert len(grid) == 6
+    assert {"a": 2, "b": "z"} in grid
+
+
+def test_run_is_timed_without_instrumentation(monkeypatch):
+    calls = []
+    build_world = parameter_sweep.build_world
+
+    def recording_build(params, instrumented=False):
+        manager, iterations, seconds = build_world(params, instrumented)
+        assert (manager.instrumentation is not None) == instrumented
+        calls.append((instrumented, seconds))
+        return manager, iterations, seconds
+
+    monkeypatch.setattr(parameter_sweep, "build_world", recording_build)
+    result = run_world(small_params())
+    assert [instrumented for instrumented, _ in calls] == [False, True]
+    assert result["seconds"] == calls[0][1]
+    assert 0 <= result["truncation_rate"] <= 1
+    assert result["edges_per_chunk"] == result["edges"] / 4
+
+
+def test_instrumented_build_grows_the_same_world():
+    plain = parameter_sweep.build_world(small_params())[0]
+    instrumented = parameter_sweep.build_world(small_params(), instrumented=True)[0]
+    assert {key: chunk.geometry.segments().tolist() for key, chunk in plain.chunks.items()} == \
+           {key: chunk.geometry.segments().tolist() for key, chunk in instrumented.chunks.items()}
@@ -0,0 +1,53 @@
+# test_spatial_index.py
+import random
+import time
+
+import pytest
+
+from spatial_index import BOX_PAD, SegmentGrid
+
+
+def random_grid(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    grid = SegmentGrid()
+    segments = []
+    for _ in range(count):
+        x, y = rng.randint(0, 1000), rng.randint(0, 1000)
+        segment = (x, y, x + rng.randint(-80, 80), y + rng.randint(-80, 80))
+        grid.insert(*segment)
+        segments.append(segment)
+    return grid, segments
+
+
+def brute_query(segments, x1, y1, x2, y2, after=-1):
+    min_x, min_y = min(x1, x2) - BOX_PAD, min(y1, y2) - BOX_PAD
+    max_x, max_y = max(x1, x2) + BOX_PAD, max(y1, y2) + BOX_PAD
+    return [n for n, (a, b, c, d) in enumerate(segments) if n > after
+            and min(a, c) - BOX_PAD <= max_x and min_x <= max(a, c) + BOX_PAD
+            and min(b, d) - BOX_PAD <= max_y and min_y <= max(b, d) + BOX_PAD]
+
+
+@pytest.mark.parametrize("size", [1, 40, 300, 5000])
+def test_query_matches_brute_force(size):
+    grid, segments = random_grid(400)
+    rng = random.Random(size)
+    for _ in range(200):
+        x, y = rng.uniform(-500, 1500), rng.uniform(-500, 1500)
+        query = (x, y, x + rng.uniform(-size, size), y + rng.uniform(-size, size))
+        after = rng.choice([-1, 100])
+        assert grid.query_segment(*query, after=after) == brute_query(segments, *query, after=after)
+
+
+def test_empty_index_and_disjoint_queries_find_nothing():
+    assert SegmentGrid().query_segment(0, 0, 10, 10) == []
+    grid, _ = random_grid(50)
+    assert grid.query_segment(5000, 5000, 6000, 6000) == []
+
+
+def test_huge_query_costs_no_more_than_the_index():
+    grid, segments = random_grid(400)
+    started = time.perf_counter()
+    found = grid.query_segment(-10 ** 7, -10 ** 7, 10 ** 7, 10 ** 7)
+    # Без обрезки по bounds запрос перебрал бы ~10^10 ячеек сетки
+    assert time.perf_counter() - started < 1.0
+    assert found == list(range(len(segments)))